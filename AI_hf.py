@@ -1,5 +1,148 @@
-import requests
 import datetime
+import json
+import threading
+import time
+from contextlib import aclosing
+from admission import hf_slots
+import http_client
+import metrics
+import resilience
+
+
+MODEL = 'deepseek-ai/DeepSeek-V3-0324'
+
+# Инструкции не меняются между запросами и идут первым, system-сообщением,
+# чтобы провайдер мог кэшировать общий префикс; данные пользователя идут последними.
+TRANSLATE_PROMPTS = {
+    'full': """
+Ты — умный и точный конвертер названий городов в корректный английский формат.
+Твоя задача — на основе полученного от пользователя названия города на любом языке, чаще всего на русском, определить город и страну и выдать результат в формате: City, Country
+
+Учти:
+- исправляй опечатки в названии города;
+- работай с маленькими и малоизвестными городами;
+- всегда используй правильное написание английских названий;
+- не добавляй ничего лишнего: ни точек, ни скобок, ни подчеркиваний, ни вопросов, ни приветствий;
+- всегда выводи через запятую и пробел, с большой буквы для города и страны;
+- примеры: "Воронеж" → "Voronezh, Russia", "Поворино" → "Povorino, Russia", "Нью-Йорк" → "New York, USA".
+
+Не делай следующее:
+- не добавляй пояснения, подсказки, вопросы, приветствия;
+- не используй лишние символы, точки, скобки, подчеркивания;
+- не меняй порядок: всегда сначала город, затем страна;
+- не используй нижний регистр или некорректный верхний регистр;
+- не добавляй дополнительные слова или детали (например, область, регион, координаты);
+- не пытайся красиво описывать город, только корректное название и страна.
+
+Твой ответ должен быть в формате: City, Country
+""",
+    'compact': """
+Определи город и страну по названию на любом языке, исправив опечатки.
+Ответь строго в формате City, Country на английском, с заглавных букв, без других слов и символов.
+Примеры: Воронеж → Voronezh, Russia; Нью-Йорк → New York, USA.
+""",
+}
+
+COMMENTARY_PROMPTS = {
+    'full': """
+Ты — умный, человечный и дружелюбный комментатор погоды.
+Твоя задача — на основе полученных данных о погоде в городе написать короткий, разговорный комментарий от 2 до 5 предложений.
+
+Учти:
+- анализируй всё: температуру, облачность, осадки, ветер, солнечный индекс, влажность, время года, время суток (если указано), местоположение;
+- добавь лёгкий оптимизм, эмоции и живой тон — будто рассказываешь другу, но без обращения напрямую;
+- если погода сложная — будь реалистичным, но подбодри («дождь не помешает прогулке ☔»);
+- если город известен чем-то (например, красивыми осенними парками в Ванкувере или снежными зимами в Москве) — можно добавить локальную деталь;
+- вставляй уместные эмодзи (1–3), не детские, не шаблонные, только если они усиливают смысл;
+- можно лёгкий юмор («ветер сегодня явно решил стать тренером по кардио 💨»);
+- можешь давать советы по погоде, если это логично («лучше взять зонт», «самое время для прогулки»).
+
+Твоя цель — сделать погоду “человечной”: чтобы человек почувствовал атмосферу, настроение дня и лёгкое воодушевление.
+Не задавай встречных вопросов, не упоминай, что ты нейросеть или модель.
+
+Не делай следующее:
+- не задавай встречных вопросов;
+- не используй фразы вроде "по данным модели", "как ИИ", "согласно прогнозу", "по нашим данным";
+- не будь роботоподобным, не повторяй одни и те же слова;
+- не используй избыточный пафос или чрезмерные восклицания;
+- не используй детские, нелепые или неуместные смайлы;
+- не начинай ответ с приветствия;
+- не уходи в длинные научные объяснения — только эмоция, ощущение и смысл.
+
+Основной язык ответа - русский.
+""",
+    'compact': """
+Ты — дружелюбный комментатор погоды. По данным напиши на русском 2–5 живых предложений о погоде:
+настроение дня, уместный совет, 1–3 эмодзи, можно лёгкий юмор и локальную деталь о городе.
+Без приветствий, встречных вопросов, упоминаний ИИ или модели и без пафоса.
+""",
+}
+
+
+
+class UsageStats:
+    """
+    Token and latency accounting of AI_HF calls, per method and prompt variant.
+
+    Token counts come from the 'usage' field of the chat-completion response;
+    calls without it are counted but add no tokens.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def record(self, method, variant, usage, latency):
+        """
+        Add a finished call.
+
+        Args:
+            method (str): AI_HF method name, e.g. 'translate'.
+            variant (str): Prompt variant, e.g. 'full' or 'compact'.
+            usage (dict | None): The 'usage' field of the response.
+            latency (float): Call duration in seconds.
+        """
+        usage = usage or {}
+        with self._lock:
+            entry = self._data.setdefault((method, variant), {
+                'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                'cached_tokens': 0, 'latency': 0.0,
+            })
+            entry['calls'] += 1
+            entry['prompt_tokens'] += usage.get('prompt_tokens') or 0
+            entry['completion_tokens'] += usage.get('completion_tokens') or 0
+            entry['cached_tokens'] += (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+            entry['latency'] += latency
+
+    def summary(self):
+        """
+        Return totals and per-call averages.
+
+        Returns:
+            dict: 'method:variant' -> counters with avg_prompt_tokens,
+                  avg_completion_tokens and avg_latency added.
+        """
+        with self._lock:
+            result = {}
+            for (method, variant), entry in self._data.items():
+                calls = entry['calls']
+                result[f'{method}:{variant}'] = {
+                    **entry,
+                    'avg_prompt_tokens': entry['prompt_tokens'] / calls,
+                    'avg_completion_tokens': entry['completion_tokens'] / calls,
+                    'avg_latency': entry['latency'] / calls,
+                }
+            return result
+
+    def reset(self):
+        """
+        Drop all counters.
+        """
+        with self._lock:
+            self._data.clear()
+
+
+usage_stats = UsageStats()
 
 
 
@@ -12,16 +155,25 @@ class AI_HF:
     2. Generate human-friendly, conversational weather commentary 
        based on structured weather data.
 
+    Requests go through the shared http_client session (keep-alive pool,
+    timeouts and retries of transient errors). Instructions are sent as a
+    constant system message and the user data last; every call is recorded
+    in usage_stats.
+
     Attributes:
         API_URL (str): HuggingFace API endpoint for chat completions.
         HUGGING_FACE_TOKEN (str): Bearer token for authenticating requests.
+        PROMPT_VARIANT (str): Default prompt variant, 'full' or 'compact'.
         text (str): Input text, either city name for translation or raw weather data for commentary.
+        prompt_variant (str): Prompt variant used by this instance.
     """
     API_URL = 'https://router.huggingface.co/v1/chat/completions'
     HUGGING_FACE_TOKEN = "YOUR-KEY"
+    PROMPT_VARIANT = 'full'
 
-    def __init__(self, text):
+    def __init__(self, text, prompt_variant=None):
         self.text = text
+        self.prompt_variant = prompt_variant or self.PROMPT_VARIANT
 
 
     def translate(self):
@@ -38,50 +190,72 @@ class AI_HF:
         Returns:
             str: Translated city in the format "City, Country".
         """
-        headers = {'Authorization': f'Bearer {self.HUGGING_FACE_TOKEN}'}
-        main_promt = f"""
-Ты — умный и точный конвертер названий городов в корректный английский формат. 
-Твоя задача — на основе полученного от пользователя названия города на любом языке, чаще всего на русском, определить город и страну и выдать результат в формате: City, Country
+        started = time.perf_counter()
+        with hf_slots, metrics.stage('llm_translate'):
+            response = http_client.post(self.API_URL, headers=self._headers(), json=self._translate_payload())
+        return self._answer('translate', response.json(), started)
 
-Учти:
-- исправляй опечатки в названии города;
-- работай с маленькими и малоизвестными городами;
-- всегда используй правильное написание английских названий;
-- не добавляй ничего лишнего: ни точек, ни скобок, ни подчеркиваний, ни вопросов, ни приветствий;
-- всегда выводи через запятую и пробел, с большой буквы для города и страны;
-- примеры: "Воронеж" → "Voronezh, Russia", "Поворино" → "Povorino, Russia", "Нью-Йорк" → "New York, USA".
-"""
 
-        negative_promt = f"""
-Не делай следующее:
-- не добавляй пояснения, подсказки, вопросы, приветствия;
-- не используй лишние символы, точки, скобки, подчеркивания;
-- не меняй порядок: всегда сначала город, затем страна;
-- не используй нижний регистр или некорректный верхний регистр;
-- не добавляй дополнительные слова или детали (например, область, регион, координаты);
-- не пытайся красиво описывать город, только корректное название и страна.
-"""
+    async def atranslate(self):
+        """
+        Asynchronous counterpart of translate() using a non-blocking HTTP client.
+
+        Returns:
+            str: Translated city in the format "City, Country".
+        """
+        started = time.perf_counter()
+        async with hf_slots:
+            with metrics.stage('llm_translate'):
+                data = await http_client.arequest_json('POST', self.API_URL, headers=self._headers(), json=self._translate_payload())
+        return self._answer('translate', data, started)
+
+
+    def _headers(self):
+        """
+        Build the authorization headers for the HuggingFace router.
+
+        Returns:
+            dict: HTTP headers.
+        """
+        return {'Authorization': f'Bearer {self.HUGGING_FACE_TOKEN}'}
+
+
+    def _answer(self, method, data, started):
+        """
+        Record usage and latency of a finished call and extract the answer.
+
+        Args:
+            method (str): AI_HF method name for usage_stats.
+            data (dict): Parsed chat-completion response.
+            started (float): time.perf_counter() value at the start of the call.
+
+        Returns:
+            str: Content of the first choice.
+        """
+        usage_stats.record(method, self.prompt_variant, data.get('usage'), time.perf_counter() - started)
+        return data['choices'][0]['message']['content']
+
+
+    def _translate_payload(self):
+        """
+        Build the chat-completion payload for translate().
+
+        Returns:
+            dict: Request payload.
+        """
         payload = {
             'messages': [
-                {
-                    'role': 'user',
-                    'content': (
-                        f'Есть отправленный пользователем город {self.text}. '
-                        f'Выполни задания, описанные дальше. Позитивный промт: {main_promt}. Негативный промт: {negative_promt}.'
-                        f'Как уже было описано выше, твой ответ должен быть в формате: City, Country'
-                    )
-                }
+                {'role': 'system', 'content': TRANSLATE_PROMPTS[self.prompt_variant]},
+                {'role': 'user', 'content': self.text},
             ],
-            'model': 'deepseek-ai/DeepSeek-V3-0324'
+            'model': MODEL
         }
+        return payload
 
-        response = requests.post(self.API_URL, headers=headers, json=payload)
-        return response.json()['choices'][0]['message']['content']
 
 
 
-
-    def formating_answer(self, location, date, now_date=datetime.date.today()):
+    def formating_answer(self, location, date, now_date=None):
         """
         Generate a human-readable, conversational weather commentary.
 
@@ -102,53 +276,190 @@ class AI_HF:
             str: Formatted weather forecast with human-friendly commentary, 
                  including metrics and emoji-enhanced description.
         """
-        headers = {'Authorization': f'Bearer {self.HUGGING_FACE_TOKEN}'}
+        started = time.perf_counter()
+        payload = self._commentary_payload(location, date, now_date)
+        with hf_slots, metrics.stage('llm_commentary'):
+            response = http_client.post(self.API_URL, headers=self._headers(), json=payload)
+        return self._answer('formating_answer', response.json(), started)
 
-        main_promt = f"""
-Ты — умный, человечный и дружелюбный комментатор погоды. 
-Твоя задача — на основе полученных данных о погоде в городе написать короткий, разговорный комментарий от 2 до 5 предложений. 
 
-Учти:
-- анализируй всё: температуру, облачность, осадки, ветер, солнечный индекс, влажность, время года, время суток (если указано), местоположение;
-- добавь лёгкий оптимизм, эмоции и живой тон — будто рассказываешь другу, но без обращения напрямую;
-- если погода сложная — будь реалистичным, но подбодри («дождь не помешает прогулке ☔»);
-- если город известен чем-то (например, красивыми осенними парками в Ванкувере или снежными зимами в Москве) — можно добавить локальную деталь;
-- вставляй уместные эмодзи (1–3), не детские, не шаблонные, только если они усиливают смысл;
-- можно лёгкий юмор («ветер сегодня явно решил стать тренером по кардио 💨»);
-- можешь давать советы по погоде, если это логично («лучше взять зонт», «самое время для прогулки»).
+    async def aformating_answer(self, location, date, now_date=None):
+        """
+        Asynchronous counterpart of formating_answer() using a non-blocking HTTP client.
 
-Твоя цель — сделать погоду “человечной”: чтобы человек почувствовал атмосферу, настроение дня и лёгкое воодушевление. 
-Не задавай встречных вопросов, не упоминай, что ты нейросеть или модель.
-"""
+        Args:
+            location (str): Standardized city name in the format "City, Country".
+            date (datetime.date): The target date for the weather forecast.
+            now_date (datetime.date, optional): The current date, defaults to today.
 
-        negative_promt = f"""
-Не делай следующее:
-- не задавай встречных вопросов;
-- не используй фразы вроде "по данным модели", "как ИИ", "согласно прогнозу", "по нашим данным";
-- не будь роботоподобным, не повторяй одни и те же слова;
-- не используй избыточный пафос или чрезмерные восклицания;
-- не используй детские, нелепые или неуместные смайлы;
-- не начинай ответ с приветствия;
-- не уходи в длинные научные объяснения — только эмоция, ощущение и смысл.
-"""
-        
+        Returns:
+            str: Human-friendly weather commentary.
+        """
+        started = time.perf_counter()
+        payload = self._commentary_payload(location, date, now_date)
+        async with hf_slots:
+            with metrics.stage('llm_commentary'):
+                data = await http_client.arequest_json('POST', self.API_URL, headers=self._headers(), json=payload)
+        return self._answer('formating_answer', data, started)
+
+
+    def stream_formating_answer(self, location, date, now_date=None):
+        """
+        Stream the weather commentary as it is generated.
+
+        Uses the streaming mode of the chat-completions endpoint, so the first
+        words arrive long before the full answer is ready.
+
+        Args:
+            location (str): Standardized city name in the format "City, Country".
+            date (datetime.date): The target date for the weather forecast.
+            now_date (datetime.date, optional): The current date, defaults to today.
+
+        Yields:
+            str: Pieces of the commentary in order.
+
+        Raises:
+            resilience.DeadlineExceeded: If the stream outlives the current deadline.
+        """
+        started = time.perf_counter()
+        usage = None
+        with hf_slots, metrics.stage('llm_commentary_stream'): # слот занят, пока модель генерирует ответ
+            sent = time.perf_counter()
+            response = http_client.post(self.API_URL, headers=self._headers(), json=self._stream_payload(location, date, now_date), stream=True)
+            first_chunk = True
+            try:
+                with response:
+                    response.encoding = 'utf-8'
+                    for line in response.iter_lines(decode_unicode=True):
+                        resilience.check() # таймаут чтения ограничивает паузы, а не весь поток
+                        event = self._parse_stream_line(line)
+                        if event is None:
+                            break
+                        usage = event.get('usage') or usage
+                        chunk = self._stream_delta(event)
+                        if chunk:
+                            if first_chunk:
+                                metrics.observe('llm_commentary_first_token', time.perf_counter() - sent)
+                                first_chunk = False
+                            yield chunk
+            finally:
+                usage_stats.record('stream_formating_answer', self.prompt_variant, usage, time.perf_counter() - started)
+
+
+    async def astream_formating_answer(self, location, date, now_date=None):
+        """
+        Asynchronous counterpart of stream_formating_answer().
+
+        Args:
+            location (str): Standardized city name in the format "City, Country".
+            date (datetime.date): The target date for the weather forecast.
+            now_date (datetime.date, optional): The current date, defaults to today.
+
+        Yields:
+            str: Pieces of the commentary in order.
+        """
+        started = time.perf_counter()
+        usage = None
+        lines = http_client.astream_lines('POST', self.API_URL, headers=self._headers(), json=self._stream_payload(location, date, now_date))
+        async with hf_slots:
+            with metrics.stage('llm_commentary_stream'):
+                sent = time.perf_counter()
+                first_chunk = True
+                try:
+                    async with aclosing(lines):
+                        async for line in lines:
+                            event = self._parse_stream_line(line)
+                            if event is None:
+                                break
+                            usage = event.get('usage') or usage
+                            chunk = self._stream_delta(event)
+                            if chunk:
+                                if first_chunk:
+                                    metrics.observe('llm_commentary_first_token', time.perf_counter() - sent)
+                                    first_chunk = False
+                                yield chunk
+                finally:
+                    usage_stats.record('stream_formating_answer', self.prompt_variant, usage, time.perf_counter() - started)
+
+
+    @staticmethod
+    def _parse_stream_line(line):
+        """
+        Parse one server-sent events line of a streaming chat completion.
+
+        Args:
+            line (str): Line of the response body.
+
+        Returns:
+            dict | None: Parsed event ({} for keep-alive and service lines),
+                         or None at the end of the stream.
+        """
+        if not line or not line.startswith('data:'):
+            return {}
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return None
+        return json.loads(data)
+
+
+    @staticmethod
+    def _stream_delta(event):
+        """
+        Extract the text delta from a parsed stream event.
+
+        Args:
+            event (dict): Event returned by _parse_stream_line().
+
+        Returns:
+            str: Text delta, '' if the event carries none.
+        """
+        choices = event.get('choices') or [{}]
+        return (choices[0].get('delta') or {}).get('content') or ''
+
+
+    def _commentary_payload(self, location, date, now_date=None):
+        """
+        Build the chat-completion payload for formating_answer().
+
+        Args:
+            location (str): Standardized city name in the format "City, Country".
+            date (datetime.date): The target date for the weather forecast.
+            now_date (datetime.date, optional): The current date, defaults to today.
+
+        Returns:
+            dict: Request payload.
+        """
+        if now_date is None:
+            now_date = datetime.date.today()
         payload = {
             'messages': [
+                {'role': 'system', 'content': COMMENTARY_PROMPTS[self.prompt_variant]},
                 {
                     'role': 'user',
                     'content': (
-                        f'Есть данные о погоде в городе {location}. '
-                        f'На {date} дату. Сегодня {now_date}. '
-                        f'Данные: {self.text}. '
-                        f'Проанализируй и напиши короткий комментарий в человеческом, живом, эмоциональном стиле — как описано в инструкциях дальше. '
-                        f'Позитивный промт: {main_promt}. '
-                        f'Негативный промт: {negative_promt}.'
-                        f'Основной язык ответа - русский'
+                        f'Сегодня {now_date}. Прогноз на {date}. Город: {location}.\n'
+                        f'Данные:\n{self.text}'
                     )
-                }
+                },
             ],
-            'model': 'deepseek-ai/DeepSeek-V3-0324'
+            'model': MODEL
         }
+        return payload
+
+
+    def _stream_payload(self, location, date, now_date=None):
+        """
+        Build the streaming variant of the formating_answer() payload,
+        asking the provider to report token usage in the last chunk.
+
+        Args:
+            location (str): Standardized city name in the format "City, Country".
+            date (datetime.date): The target date for the weather forecast.
+            now_date (datetime.date, optional): The current date, defaults to today.
 
-        response = requests.post(self.API_URL, headers=headers, json=payload)
-        return response.json()['choices'][0]['message']['content']
+        Returns:
+            dict: Request payload.
+        """
+        payload = self._commentary_payload(location, date, now_date)
+        payload.update(stream=True, stream_options={'include_usage': True})
+        return payload
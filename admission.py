@@ -0,0 +1,334 @@
+import asyncio
+import heapq
+import itertools
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+import metrics
+import resilience
+from cache import LRUTTLCache
+from ratelimit import RateLimiter
+
+
+INTERACTIVE = 0 # запросы пользователей из чата
+BACKGROUND = 1 # рассылка по подпискам: ждёт, пока есть интерактивные запросы
+
+MAX_ACTIVE = 16 # запросов погоды, обрабатываемых одновременно
+MAX_PENDING = 64 # запросов в очереди; при переполнении пользователь сразу получает ответ «занято»
+MAX_WAIT = 20 # секунд ожидания в очереди, после которых запрос отклоняется
+CHAT_RATE = 0.1 # запросов в секунду на один чат в среднем (один в 10 секунд)
+CHAT_BURST = 5 # запросов подряд, которые чат может сделать без ожидания
+HF_CONCURRENCY = 8 # одновременных вызовов HuggingFace на процесс
+VC_CONCURRENCY = 16 # одновременных вызовов Visual Crossing на процесс
+UPSTREAM_WAIT = 30 # секунд ожидания свободного слота к внешнему сервису
+
+BUSY_TEXT = 'Сейчас очень много запросов 🙏 Попробуй, пожалуйста, через минуту.'
+RATE_LIMITED_TEXT = 'Слишком много запросов подряд ⏳ Подожди немного и попробуй снова.'
+
+
+class BusyError(Exception):
+    """
+    The request was not admitted: the queue is full or the wait took too long.
+    """
+
+    def __init__(self, text=BUSY_TEXT):
+        super().__init__(text)
+
+
+class RateLimitedError(BusyError):
+    """
+    The chat sent more requests than its token bucket allows.
+    """
+
+    def __init__(self, text=RATE_LIMITED_TEXT):
+        super().__init__(text)
+
+
+class _Waiter:
+    """
+    A queued request waiting for a free slot, from a thread or a coroutine.
+    """
+
+    __slots__ = ('event', 'loop', 'future', 'admitted')
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.admitted = False
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def wake(self):
+        self.admitted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+
+class AdmissionController:
+    """
+    Admission control in front of Weather.
+
+    Every request passes a per-chat token bucket, then takes one of
+    max_active slots. When all slots are busy, the request waits in a
+    bounded priority queue where interactive requests go before background
+    ones; background requests may only use half of the queue. A request
+    that finds the queue full or waits longer than max_wait gets BusyError,
+    so the user is answered at once instead of waiting without limit.
+
+    Attributes:
+        max_active (int): Requests processed at once.
+        max_pending (int): Maximum queue length.
+        max_wait (float): Seconds a request may wait in the queue, capped by its deadline.
+        admitted (int): Number of admitted requests.
+        rejected (dict): Rejected requests by reason ('rate', 'queue_full', 'timeout').
+    """
+
+    def __init__(self, max_active=MAX_ACTIVE, max_pending=MAX_PENDING, max_wait=MAX_WAIT,
+                 chat_rate=CHAT_RATE, chat_burst=CHAT_BURST):
+        """
+        Initialize the controller.
+
+        Args:
+            max_active (int, optional): Requests processed at once. Defaults to MAX_ACTIVE.
+            max_pending (int, optional): Queue length. Defaults to MAX_PENDING.
+            max_wait (float, optional): Queue wait limit in seconds. Defaults to MAX_WAIT.
+            chat_rate (float, optional): Per-chat requests per second. Defaults to CHAT_RATE.
+            chat_burst (float, optional): Per-chat bucket size. Defaults to CHAT_BURST.
+        """
+        self.max_active = max_active
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.admitted = 0
+        self.rejected = {'rate': 0, 'queue_full': 0, 'timeout': 0}
+        # корзина простаивающего чата через chat_burst / chat_rate секунд снова полна, её можно забыть
+        self._buckets = LRUTTLCache(maxsize=100_000, ttl=chat_burst / chat_rate)
+        self._active = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _reject(self, reason, error):
+        with self._lock:
+            self.rejected[reason] += 1
+        metrics.rejected(reason)
+        raise error
+
+    def _check_rate(self, chat_id):
+        """
+        Take a token from the chat's bucket or raise RateLimitedError.
+        """
+        if chat_id is None:
+            return
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = RateLimiter(self.chat_rate, self.chat_burst)
+        self._buckets.set(chat_id, bucket)
+        if not bucket.try_acquire():
+            self._reject('rate', RateLimitedError())
+
+    def _enter(self, priority, loop=None):
+        """
+        Take a slot at once or enqueue a waiter.
+
+        Returns:
+            _Waiter | None: Waiter to wait on, None if a slot was taken.
+        """
+        with self._lock:
+            if self._active < self.max_active and not self._queue:
+                self._active += 1
+                self.admitted += 1
+                return None
+            limit = self.max_pending if priority == INTERACTIVE else self.max_pending // 2
+            full = len(self._queue) >= limit
+            if not full:
+                waiter = _Waiter(loop)
+                heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+                return waiter
+        self._reject('queue_full', BusyError())
+
+    def _cancel(self, waiter):
+        """
+        Remove a waiter from the queue unless it was admitted meanwhile.
+
+        Returns:
+            bool: True if the waiter holds a slot after all.
+        """
+        with self._lock:
+            if waiter.admitted:
+                return True
+            self._queue = [item for item in self._queue if item[2] is not waiter]
+            heapq.heapify(self._queue)
+            return False
+
+    def _give_up(self, waiter):
+        """
+        Handle a waiter that timed out: keep the slot if it was admitted
+        meanwhile, otherwise raise BusyError.
+        """
+        if not self._cancel(waiter):
+            self._reject('timeout', BusyError())
+
+    def _leave(self):
+        """
+        Free a slot and pass it to the first waiter in priority order.
+        """
+        with self._lock:
+            if self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                self.admitted += 1
+                waiter.wake()
+            else:
+                self._active -= 1
+
+    @contextmanager
+    def admit(self, chat_id=None, priority=INTERACTIVE):
+        """
+        Run a block once the request is admitted.
+
+        Usage:
+            with admission_control.admit(message.chat.id):
+                ...
+
+        Args:
+            chat_id (int, optional): Telegram chat identifier; None skips the per-chat limit.
+            priority (int, optional): INTERACTIVE or BACKGROUND. Defaults to INTERACTIVE.
+
+        Raises:
+            BusyError: The request was rejected; RateLimitedError for the per-chat limit.
+            resilience.DeadlineExceeded: The request's time budget is already spent.
+        """
+        max_wait = resilience.timeout(self.max_wait)
+        self._check_rate(chat_id)
+        waiter = self._enter(priority)
+        if waiter is not None:
+            with metrics.stage('admission_wait'):
+                if not waiter.event.wait(max_wait):
+                    self._give_up(waiter)
+        try:
+            yield
+        finally:
+            self._leave()
+
+    @asynccontextmanager
+    async def aadmit(self, chat_id=None, priority=INTERACTIVE):
+        """
+        Asynchronous counterpart of admit().
+
+        Args:
+            chat_id (int, optional): Telegram chat identifier; None skips the per-chat limit.
+            priority (int, optional): INTERACTIVE or BACKGROUND. Defaults to INTERACTIVE.
+
+        Raises:
+            BusyError: The request was rejected; RateLimitedError for the per-chat limit.
+            resilience.DeadlineExceeded: The request's time budget is already spent.
+        """
+        max_wait = resilience.timeout(self.max_wait)
+        self._check_rate(chat_id)
+        waiter = self._enter(priority, asyncio.get_running_loop())
+        if waiter is not None:
+            with metrics.stage('admission_wait'):
+                try:
+                    await asyncio.wait_for(waiter.future, max_wait)
+                except asyncio.TimeoutError:
+                    self._give_up(waiter)
+                except asyncio.CancelledError:
+                    if self._cancel(waiter):
+                        self._leave()
+                    raise
+        try:
+            yield
+        finally:
+            self._leave()
+
+    def stats(self):
+        """
+        Return controller counters.
+
+        Returns:
+            dict: Active and queued requests, admitted and rejected counts.
+        """
+        with self._lock:
+            return {
+                'active': self._active,
+                'pending': len(self._queue),
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected),
+            }
+
+
+class ConcurrencyLimit:
+    """
+    Process-wide cap on concurrent calls to one upstream service, usable
+    from threads and from coroutines.
+
+    Attributes:
+        name (str): Upstream name for metrics.
+        limit (int): Maximum concurrent calls.
+        timeout (float): Seconds to wait for a free slot before BusyError, capped by the deadline.
+    """
+
+    def __init__(self, name, limit, timeout=UPSTREAM_WAIT):
+        """
+        Initialize the limit.
+
+        Args:
+            name (str): Upstream name, e.g. 'huggingface'.
+            limit (int): Maximum concurrent calls.
+            timeout (float, optional): Slot wait limit in seconds. Defaults to UPSTREAM_WAIT.
+        """
+        self.name = name
+        self.limit = limit
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._asemaphore = None
+
+    def __enter__(self):
+        timeout = resilience.timeout(self.timeout)
+        with metrics.stage(f'{self.name}_slot_wait'):
+            acquired = self._semaphore.acquire(timeout=timeout)
+        if not acquired:
+            metrics.rejected(f'{self.name}_busy')
+            raise BusyError()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+        return False
+
+    async def __aenter__(self):
+        # процесс работает либо в потоках (bot.py), либо в asyncio (bot_async.py), поэтому отдельный семафор
+        if self._asemaphore is None:
+            self._asemaphore = asyncio.Semaphore(self.limit)
+        timeout = resilience.timeout(self.timeout)
+        with metrics.stage(f'{self.name}_slot_wait'):
+            try:
+                await asyncio.wait_for(self._asemaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                metrics.rejected(f'{self.name}_busy')
+                raise BusyError() from None
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._asemaphore.release()
+        return False
+
+
+admission_control = AdmissionController()
+hf_slots = ConcurrencyLimit('huggingface', HF_CONCURRENCY)
+vc_slots = ConcurrencyLimit('visual_crossing', VC_CONCURRENCY)
+
+
+def _admission_metrics():
+    stats = admission_control.stats()
+    return {
+        ('admission_active', 'Weather requests being processed.'): {(): stats['active']},
+        ('admission_pending', 'Weather requests waiting in the admission queue.'): {(): stats['pending']},
+    }
+
+
+metrics.register_collector(_admission_metrics)
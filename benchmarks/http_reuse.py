@@ -0,0 +1,75 @@
+"""
+Measures the per-call saving of the shared http_client session over bare
+requests calls, which open a new connection (and TLS handshake) every time.
+
+Usage:
+    python benchmarks/http_reuse.py                      # local keep-alive server
+    python benchmarks/http_reuse.py --url https://router.huggingface.co/ -n 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import http_client
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _measure(call, url, n):
+    timings = []
+    for _ in range(n):
+        started = time.perf_counter()
+        try:
+            call(url)
+        except requests.HTTPError:
+            pass
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='URL to call; a local server is started if omitted')
+    parser.add_argument('-n', type=int, default=200, help='number of calls per variant')
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}/'
+
+    bare = _measure(lambda u: requests.get(u, timeout=10), url, args.n)
+    pooled = _measure(http_client.get, url, args.n)
+
+    for name, timings in (('bare requests', bare), ('http_client', pooled)):
+        print(f'{name:14} mean {statistics.mean(timings) * 1000:8.2f} ms   '
+              f'median {statistics.median(timings) * 1000:8.2f} ms')
+    saving = statistics.mean(bare) - statistics.mean(pooled)
+    print(f'saving per call: {saving * 1000:.2f} ms')
+    print(f'connections: {http_client.connection_stats()}')
+
+
+if __name__ == '__main__':
+    main()
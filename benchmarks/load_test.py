@@ -0,0 +1,481 @@
+"""
+Offline load test of the bot pipeline.
+
+Starts local stand-ins for the HuggingFace router, Visual Crossing and the
+Telegram Bot API with configurable latency and error rates, points the real
+bot.py (or bot_async.py) handlers at them and drives N concurrent simulated
+chats. A share of the chats asks for cities missing from the offline index,
+so their names are resolved by the LLM. Reports end-to-end and
+time-to-first-content percentiles, a per-stage breakdown from the
+metrics.stage_seconds histograms and throughput, and writes them to a JSON
+file for comparing versions.
+
+Usage:
+    python benchmarks/load_test.py --requests 500 --concurrency 50 --out load_test.json
+    python benchmarks/load_test.py --async --hf-latency 1.5 --hf-error-rate 0.02 --cold
+    python benchmarks/load_test.py --unknown-share 0.5
+    python benchmarks/load_test.py --updates --requests 1000 --concurrency 200
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+import admission
+import metrics
+
+COMMENTARY = 'Дождь идёт с самого утра, но к вечеру обещает прояснение — зонт всё-таки пригодится ☔'
+
+
+class Upstream:
+    """
+    Latency and error model of one fake upstream.
+
+    Attributes:
+        latency (float): Mean response latency in seconds.
+        jitter (float): Standard deviation of the latency in seconds.
+        error_rate (float): Share of requests answered with 503.
+        calls (int): Number of served requests.
+        errors (int): Number of injected errors.
+    """
+
+    def __init__(self, latency, jitter, error_rate):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def delay(self):
+        return max(0.0, random.gauss(self.latency, self.jitter))
+
+    def fail(self):
+        failed = random.random() < self.error_rate
+        with self._lock:
+            self.calls += 1
+            self.errors += failed
+        return failed
+
+
+def _day(date):
+    return {
+        'datetime': date, 'temp': 288.4, 'tempmax': 291.2, 'tempmin': 284.9,
+        'feelslike': 287.9, 'feelslikemax': 291.0, 'feelslikemin': 283.1,
+        'humidity': 78.0, 'precip': 2.4, 'precipprob': 64.0, 'preciptype': ['rain'],
+        'windspeed': 4.1, 'windgust': 9.7, 'winddir': 204.0, 'cloudcover': 81.0,
+        'visibility': 11.3, 'sunrise': '07:12:40', 'sunset': '17:48:02', 'uvindex': 2.0,
+        'conditions': 'Rain, Partially cloudy', 'description': 'Partly cloudy throughout the day with rain.',
+        'hours': [{'datetime': f'{h:02d}:00:00', 'temp': 288.0} for h in range(24)],
+    }
+
+
+def make_handler(hf, vc, tg):
+    """
+    Build the request handler serving all three fake upstreams on one port.
+
+    The upstream is chosen by path: /v1/chat/completions (HuggingFace),
+    /timeline (Visual Crossing), /bot<token>/<method> (Telegram).
+    """
+    message_ids = iter(range(1, 10 ** 9))
+    ids_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def _send_json(self, data, status=200):
+            body = json.dumps(data, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def do_GET(self):
+            if self.path.startswith('/timeline'):
+                time.sleep(vc.delay())
+                if vc.fail():
+                    return self._send_json({'error': 'unavailable'}, 503)
+                query = dict(parse_qsl(urlsplit(self.path).query))
+                start = datetime.date.fromisoformat(query.get('date1', datetime.date.today().isoformat()))
+                end = datetime.date.fromisoformat(query.get('date2', start.isoformat()))
+                days = [_day((start + datetime.timedelta(i)).isoformat()) for i in range((end - start).days + 1)]
+                if query.get('include') == 'days':
+                    for day in days:
+                        del day['hours']
+                if query.get('elements'):
+                    elements = query['elements'].split(',')
+                    days = [{k: day[k] for k in elements if k in day} for day in days]
+                return self._send_json({'days': days})
+            self._send_json({'error': 'not found'}, 404)
+
+        def do_POST(self):
+            body = self._body()
+            if self.path.startswith('/v1/chat/completions'):
+                return self._chat(json.loads(body))
+            if self.path.startswith('/bot'):
+                url = urlsplit(self.path)
+                params = dict(parse_qsl(url.query))
+                if body.startswith(b'{'):
+                    params.update(json.loads(body))
+                elif body:
+                    params.update(parse_qsl(body.decode()))
+                return self._telegram(params)
+            self._send_json({'error': 'not found'}, 404)
+
+        def _chat(self, payload):
+            time.sleep(hf.delay())
+            if hf.fail():
+                return self._send_json({'error': 'overloaded'}, 503)
+            prompt = json.dumps(payload['messages'], ensure_ascii=False)
+            answer = 'Voronezh, Russia' if 'City, Country' in prompt else COMMENTARY
+            usage = {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(answer) // 4}
+            if not payload.get('stream'):
+                return self._send_json({'choices': [{'message': {'role': 'assistant', 'content': answer}}], 'usage': usage})
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            words = answer.split(' ')
+            for i, word in enumerate(words):
+                chunk = {'choices': [{'delta': {'content': word + (' ' if i < len(words) - 1 else '')}}]}
+                self.wfile.write(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode())
+                self.wfile.flush()
+                time.sleep(hf.latency / 20)
+            self.wfile.write(f'data: {json.dumps({"choices": [], "usage": usage})}\n\ndata: [DONE]\n\n'.encode())
+            self.close_connection = True
+
+        def _telegram(self, params):
+            time.sleep(tg.delay())
+            if tg.fail():
+                return self._send_json({'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                                        'parameters': {'retry_after': 1}}, 429)
+            with ids_lock:
+                message_id = int(params.get('message_id') or next(message_ids))
+            self._send_json({'ok': True, 'result': {
+                'message_id': message_id, 'date': int(time.time()),
+                'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                'text': params.get('text', ''),
+            }})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def percentiles(values):
+    """
+    Return p50/p95/p99, mean and max of a list of seconds, in milliseconds.
+    """
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99),
+            'mean': statistics.mean(ordered) * 1000, 'max': ordered[-1] * 1000}
+
+
+def stage_histograms(histogram):
+    """
+    Summarize a metrics.Histogram by stage: count, mean and percentiles in
+    milliseconds, each percentile being the upper bound of its bucket.
+    """
+    result = {}
+    for key, (counts, total, count) in sorted(histogram._values.items()):
+        def bound(q):
+            cumulative = 0
+            for upper, n in zip(histogram.buckets, counts):
+                cumulative += n
+                if cumulative >= q * count:
+                    return upper * 1000
+            return float('inf')
+
+        result[dict(key)['stage']] = {
+            'count': count, 'mean_ms': total / count * 1000,
+            'p50_le_ms': bound(0.50), 'p95_le_ms': bound(0.95), 'p99_le_ms': bound(0.99),
+            'buckets': {str(upper): n for upper, n in zip(histogram.buckets, counts)},
+        }
+    return result
+
+
+class Recorder:
+    """
+    Collects per-request timings from wrapped Telegram send/edit calls.
+    """
+
+    def __init__(self):
+        self.first_content = {}
+        self.errors = set()
+        self.busy = set()
+        self.telegram_seconds = []
+        self.handler_backlog = 0
+        self._lock = threading.Lock()
+
+    def sent(self, chat_id, text, elapsed):
+        with self._lock:
+            self.first_content.setdefault(chat_id, time.perf_counter())
+            self.telegram_seconds.append(elapsed)
+            if str(text).startswith('Ошибка'):
+                self.errors.add(chat_id)
+            elif text in (admission.BUSY_TEXT, admission.RATE_LIMITED_TEXT):
+                self.busy.add(chat_id)
+
+
+def _message_json(chat_id, text):
+    return {
+        'message_id': chat_id, 'date': int(time.time()), 'text': text,
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'bench'},
+    }
+
+
+def make_message(chat_id, text):
+    from telebot import types
+    return types.Message.de_json(_message_json(chat_id, text))
+
+
+def make_update(chat_id, text):
+    from telebot import types
+    return types.Update.de_json({'update_id': chat_id, 'message': _message_json(chat_id, text)})
+
+
+def deliver_updates(args, cities, bot, recorder, caches):
+    """
+    Deliver the requests as Telegram updates through bot.process_new_updates,
+    so they pass telebot's handler thread pool as in production: batches of
+    --concurrency updates arrive every --batch-interval seconds.
+    """
+    finished = {}
+    done = threading.Condition()
+    handler = next(h for h in bot.bot.message_handlers if h['function'] is bot.handle_message)
+
+    def wrapped(message, _original=handler['function']):
+        try:
+            _original(message)
+        finally:
+            with done:
+                finished[message.chat.id] = time.perf_counter()
+                done.notify_all()
+
+    handler['function'] = wrapped
+    started = {}
+    for first in range(1, args.requests + 1, args.concurrency):
+        if args.cold:
+            caches()
+        batch = range(first, min(first + args.concurrency, args.requests + 1))
+        for i in batch:
+            bot.state_store.set(i, 'today') # чат уже нажал «Погода на сегодня», следующее сообщение — город
+        now = time.perf_counter()
+        started.update((i, now) for i in batch)
+        bot.bot.process_new_updates([make_update(i, cities[i % len(cities)]) for i in batch])
+        recorder.handler_backlog = max(recorder.handler_backlog, bot.bot.worker_pool.tasks.qsize())
+        time.sleep(args.batch_interval)
+    with done:
+        done.wait_for(lambda: len(finished) == len(started))
+    return [(i, started[i], finished[i]) for i in sorted(started)]
+
+
+def run_sync(args, cities, recorder, caches):
+    import bot
+
+    bot.PROGRESSIVE = not args.no_progressive
+    for name in ('send_message', 'edit_message_text'):
+        original = getattr(bot.bot, name)
+
+        def wrapped(*a, _original=original, _name=name, **kw):
+            started = time.perf_counter()
+            result = _original(*a, **kw)
+            chat_id, text = (a[0], a[1]) if _name == 'send_message' else (a[1], a[0])
+            recorder.sent(chat_id, text, time.perf_counter() - started)
+            return result
+
+        setattr(bot.bot, name, wrapped)
+
+    if args.updates:
+        return deliver_updates(args, cities, bot, recorder, caches)
+
+    def one(i):
+        if args.cold:
+            caches()
+        started = time.perf_counter()
+        bot.today_get_weather(make_message(i, cities[i % len(cities)]))
+        return i, started, time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        return list(pool.map(one, range(1, args.requests + 1)))
+
+
+def run_async(args, cities, recorder, caches):
+    import bot_async
+    import http_client
+
+    bot_async.PROGRESSIVE = not args.no_progressive
+    for name in ('send_message', 'edit_message_text'):
+        original = getattr(bot_async.bot, name)
+
+        async def wrapped(*a, _original=original, _name=name, **kw):
+            started = time.perf_counter()
+            result = await _original(*a, **kw)
+            chat_id, text = (a[0], a[1]) if _name == 'send_message' else (a[1], a[0])
+            recorder.sent(chat_id, text, time.perf_counter() - started)
+            return result
+
+        setattr(bot_async.bot, name, wrapped)
+
+    async def main():
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(i):
+            async with semaphore:
+                if args.cold:
+                    caches()
+                started = time.perf_counter()
+                await bot_async.today_get_weather(make_message(i, cities[i % len(cities)]))
+                return i, started, time.perf_counter()
+
+        try:
+            return await asyncio.gather(*(one(i) for i in range(1, args.requests + 1)))
+        finally:
+            await http_client.close_async_session()
+            await bot_async.bot.close_session()
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='total simulated requests')
+    parser.add_argument('--concurrency', type=int, default=20, help='simultaneous chats')
+    parser.add_argument('--cities', type=int, default=20, help='distinct cities in the request mix')
+    parser.add_argument('--unknown-share', type=float, default=0.2,
+                        help='share of requests for cities missing from the offline index (resolved by the LLM)')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='drive bot_async.py instead of bot.py')
+    parser.add_argument('--cold', action='store_true', help='clear forecast and commentary caches before every request')
+    parser.add_argument('--updates', action='store_true',
+                        help='deliver requests as Telegram updates through the handler thread pool (sync bot only)')
+    parser.add_argument('--batch-interval', type=float, default=0.5,
+                        help='with --updates: seconds between batches of --concurrency updates')
+    parser.add_argument('--no-progressive', action='store_true', help='send one final message instead of streaming')
+    for name, latency in (('hf', 0.8), ('vc', 0.15), ('tg', 0.03)):
+        parser.add_argument(f'--{name}-latency', type=float, default=latency, help=f'{name} mean latency, seconds')
+        parser.add_argument(f'--{name}-jitter', type=float, default=latency / 4, help=f'{name} latency stddev, seconds')
+        parser.add_argument(f'--{name}-error-rate', type=float, default=0.0, help=f'{name} share of 5xx/429 answers')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default='load_test.json', help='JSON result file')
+    args = parser.parse_args()
+    if args.updates and args.use_async:
+        parser.error('--updates drives the sync bot only')
+    random.seed(args.seed)
+    out_path = os.path.abspath(args.out)
+
+    hf = Upstream(args.hf_latency, args.hf_jitter, args.hf_error_rate)
+    vc = Upstream(args.vc_latency, args.vc_jitter, args.vc_error_rate)
+    tg = Upstream(args.tg_latency, args.tg_jitter, args.tg_error_rate)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(hf, vc, tg))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    # SQLite-файлы бота создаются во временной папке, чтобы прогоны не влияли друг на друга
+    os.chdir(tempfile.mkdtemp(prefix='weather_bot_bench_'))
+    os.environ.setdefault('BOT_TOKEN', '123456:BENCHMARK')
+
+    from telebot import apihelper, asyncio_helper
+    import AI_hf
+    import http_client
+    import weather_cod
+    from city_resolver import CITIES
+
+    apihelper.API_URL = base + '/bot{0}/{1}'
+    asyncio_helper.API_URL = base + '/bot{0}/{1}'
+    AI_hf.AI_HF.API_URL = base + '/v1/chat/completions'
+    weather_cod.Weather.url_weather = base + '/timeline'
+    http_client.BACKOFF_FACTOR = 0.05
+
+    def clear_caches():
+        weather_cod.forecast_cache.local._data.clear()
+        weather_cod.commentary_cache._data.clear()
+
+    # неизвестные справочнику названия: их разрешает AI_HF.translate, повторные — кэш city_resolver
+    known = list(CITIES)[:args.cities]
+    unknown = [f'Посёлок №{n}' for n in range(1, args.cities + 1)]
+    cities = [random.choice(unknown) if random.random() < args.unknown_share else known[i % len(known)]
+              for i in range(args.requests + 1)]
+    metrics.enable()
+    recorder = Recorder()
+    started = time.perf_counter()
+    runs = (run_async if args.use_async else run_sync)(args, cities, recorder, clear_caches)
+    wall = time.perf_counter() - started
+
+    end_to_end = [end - start for _, start, end in runs]
+    first_content = [recorder.first_content[i] - start for i, start, _ in runs if i in recorder.first_content]
+    vc_stats = http_client.stats.get(urlsplit(base).netloc, {})
+    stages = {name: {'calls': entry['calls'], 'avg_ms': entry['avg_latency'] * 1000}
+              for name, entry in AI_hf.usage_stats.summary().items()}
+    stages['visual_crossing'] = {'calls': vc.calls,
+                                 'forecast_cache_hit_rate': weather_cod.forecast_cache.stats()['hit_rate']}
+    stages['telegram'] = {'calls': len(recorder.telegram_seconds),
+                          'avg_ms': statistics.mean(recorder.telegram_seconds) * 1000 if recorder.telegram_seconds else 0}
+    stages['city_resolver'] = dict(weather_cod.city_resolver.stats)
+    stage_seconds = stage_histograms(metrics.stage_seconds)
+
+    result = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'config': {k: v for k, v in vars(args).items() if k != 'out'},
+        'requests': len(runs),
+        'failed': len(recorder.errors),
+        'busy': len(recorder.busy),
+        'admission': admission.admission_control.stats(),
+        'handler_backlog': recorder.handler_backlog,
+        'wall_seconds': wall,
+        'throughput_rps': len(runs) / wall,
+        'end_to_end_ms': percentiles(end_to_end),
+        'time_to_first_content_ms': percentiles(first_content),
+        'stages': stages,
+        'stage_seconds': stage_seconds,
+        'upstream_calls': {'huggingface': hf.calls, 'visual_crossing': vc.calls, 'telegram': tg.calls},
+        'injected_errors': {'huggingface': hf.errors, 'visual_crossing': vc.errors, 'telegram': tg.errors},
+        'http_client': vc_stats,
+    }
+    with open(out_path, 'w') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    print(f'requests {result["requests"]}, failed {result["failed"]}, busy {result["busy"]}, '
+          f'{result["throughput_rps"]:.1f} req/s over {wall:.1f} s')
+    print(f'admission {result["admission"]}, handler backlog {result["handler_backlog"]}')
+    for name in ('end_to_end_ms', 'time_to_first_content_ms'):
+        p = result[name]
+        if p:
+            print(f'{name:26} p50 {p["p50"]:8.1f}  p95 {p["p95"]:8.1f}  p99 {p["p99"]:8.1f}')
+    for name, stage in stages.items():
+        print(f'  {name:32} {stage}')
+    print('stage_seconds (percentiles are bucket upper bounds)')
+    for name, h in stage_seconds.items():
+        print(f'  {name:32} n {h["count"]:6}  mean {h["mean_ms"]:8.1f}  '
+              f'p50 ≤{h["p50_le_ms"]:8.0f}  p95 ≤{h["p95_le_ms"]:8.0f}  p99 ≤{h["p99_le_ms"]:8.0f}')
+    print(f'results written to {out_path}')
+
+
+if __name__ == '__main__':
+    main()
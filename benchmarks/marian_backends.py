@@ -0,0 +1,155 @@
+"""
+Compares MarianMT backends: in-process fp32 (the default), a worker process
+with fp32 weights and a worker pool with int8 dynamic-quantized weights.
+
+Every variant runs in a fresh interpreter and reports model load time,
+sequential latency, throughput under concurrent chats, how long a 10 ms
+timer thread in the bot process was stalled (GIL contention with Telegram
+I/O) and the RSS of the bot process and of its workers.
+
+Needs transformers and torch; the models are downloaded on the first run.
+
+Usage:
+    python benchmarks/marian_backends.py -n 50 --concurrency 16 --out marian_backends.json
+    python benchmarks/marian_backends.py --variants local-fp32 worker-int8 --workers 2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+VARIANTS = {
+    'local-fp32': {'MARIAN_BACKEND': 'local'},
+    'local-int8': {'MARIAN_BACKEND': 'local', 'MARIAN_QUANTIZE': '1'},
+    'worker-fp32': {'MARIAN_BACKEND': 'worker'},
+    'worker-int8': {'MARIAN_BACKEND': 'worker', 'MARIAN_QUANTIZE': '1'},
+}
+
+TEXTS = [
+    'hail', 'sleet', 'drizzle', 'freezing drizzle', 'thunderstorm', 'snow showers',
+    'light rain', 'heavy snow', 'fog', 'mist', 'partially cloudy', 'overcast',
+    'clear skies throughout the day', 'rain in the morning and afternoon',
+    'becoming cloudy in the afternoon', 'chance of thunderstorms in the evening',
+]
+
+
+def _rss_mib(pid):
+    """
+    Current resident set size of a process from /proc, in MiB.
+    """
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _run_variant(args):
+    """
+    Measure one backend in this process; the backend is chosen by the
+    environment before weather_cod is imported.
+    """
+    sys.path.insert(0, ROOT)
+    import weather_cod
+
+    translator = weather_cod.marian_pool or weather_cod.model_registry
+    started = time.perf_counter()
+    translator.warm_up([('en', 'ru')])
+    load_seconds = time.perf_counter() - started
+
+    def translate(i):
+        started = time.perf_counter()
+        weather_cod.Translate(TEXTS[i % len(TEXTS)]).translate_word_en_ru()
+        return time.perf_counter() - started
+
+    sequential = [translate(i) for i in range(args.n)]
+
+    stalls = []
+    stop = threading.Event()
+
+    def ticker():
+        while not stop.is_set():
+            started = time.perf_counter()
+            time.sleep(0.01)
+            stalls.append(time.perf_counter() - started - 0.01)
+
+    tick = threading.Thread(target=ticker, daemon=True)
+    tick.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        concurrent = list(pool.map(translate, range(args.n * 4)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    tick.join()
+
+    pids = weather_cod.marian_pool.pids() if weather_cod.marian_pool is not None else []
+    result = {
+        'load_s': round(load_seconds, 2),
+        'latency_ms': {'p50': round(statistics.median(sequential) * 1000, 1),
+                       'p95': round(_percentile(sequential, 0.95) * 1000, 1)},
+        'concurrent_latency_ms': {'p50': round(statistics.median(concurrent) * 1000, 1),
+                                  'p95': round(_percentile(concurrent, 0.95) * 1000, 1)},
+        'throughput_rps': round(len(concurrent) / elapsed, 1),
+        'io_stall_ms': {'p99': round(_percentile(stalls, 0.99) * 1000, 1), 'max': round(max(stalls) * 1000, 1)},
+        'bot_rss_mib': round(_rss_mib(os.getpid()), 1),
+        'worker_rss_mib': round(sum(_rss_mib(pid) for pid in pids), 1),
+    }
+    if weather_cod.marian_pool is not None:
+        result['requests_per_batch'] = round(weather_cod.marian_pool.stats()['requests_per_batch'], 1)
+        weather_cod.marian_pool.close()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--variants', nargs='+', choices=VARIANTS, default=list(VARIANTS))
+    parser.add_argument('-n', type=int, default=50, help='sequential translations per variant')
+    parser.add_argument('--concurrency', type=int, default=16, help='simultaneous chats in the throughput phase')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes for the worker variants')
+    parser.add_argument('--out', help='write the results as JSON')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _run_variant(args)
+        return
+
+    results = {}
+    for variant in args.variants:
+        env = dict(os.environ, MARIAN_WORKERS=str(args.workers), **VARIANTS[variant])
+        env.pop('NO_LOCAL_ML', None)
+        if 'MARIAN_QUANTIZE' not in VARIANTS[variant]:
+            env.pop('MARIAN_QUANTIZE', None)
+        done = subprocess.run(
+            [sys.executable, __file__, '--child', '-n', str(args.n), '--concurrency', str(args.concurrency)],
+            env=env, capture_output=True, text=True,
+        )
+        if done.returncode:
+            print(f'{variant}: failed\n{done.stderr[-2000:]}')
+            continue
+        results[variant] = json.loads(done.stdout.strip().splitlines()[-1])
+        r = results[variant]
+        print(f"{variant:12} load {r['load_s']:5.2f} s | latency p50 {r['latency_ms']['p50']:6.1f} ms "
+              f"| {r['throughput_rps']:6.1f} req/s | I/O stall p99 {r['io_stall_ms']['p99']:5.1f} ms "
+              f"| RSS bot {r['bot_rss_mib']:6.1f} MiB + workers {r['worker_rss_mib']:6.1f} MiB")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'workers': args.workers, 'concurrency': args.concurrency, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Compares AI_HF prompt variants on token cost and latency against a local
+mock of the chat-completions endpoint.
+
+The mock estimates tokens as characters / 4, reports a previously seen
+system message as cached prefix tokens (like provider-side prefix caching)
+and sleeps in proportion to the uncached prompt tokens.
+
+Usage:
+    python benchmarks/prompt_variants.py -n 20 --ms-per-token 0.05 --json prompt_variants.json
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from AI_hf import AI_HF, usage_stats
+
+
+SAMPLE_DATA = (
+    'Температура: мин 12°C, средняя 15°C, макс 18°C. Осадки: дождь, 60%, 2.1 мм. '
+    'Ветер 4 м/с, порывы 9 м/с, 200°. Облачность 80%, видимость 10 км. УФ-индекс 2. '
+    'Rain, partially cloudy throughout the day with rain.'
+)
+
+
+def _tokens(text):
+    return max(1, len(text) // 4)
+
+
+def make_handler(ms_per_token):
+    seen_prefixes = set()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            messages = body['messages']
+            prompt_tokens = sum(_tokens(m['content']) for m in messages)
+            prefix = messages[0]['content'] if messages[0]['role'] == 'system' else None
+            with lock:
+                cached = _tokens(prefix) if prefix in seen_prefixes else 0
+                if prefix is not None:
+                    seen_prefixes.add(prefix)
+            time.sleep((prompt_tokens - cached) * ms_per_token / 1000)
+            answer = 'Voronezh, Russia' if 'City, Country' in str(messages) else 'Дождливо, но уютно ☔'
+            data = json.dumps({
+                'choices': [{'message': {'role': 'assistant', 'content': answer}}],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': _tokens(answer),
+                    'prompt_tokens_details': {'cached_tokens': cached},
+                },
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=20, help='calls per method and variant')
+    parser.add_argument('--ms-per-token', type=float, default=0.05, help='mock prefill cost per uncached token')
+    parser.add_argument('--json', help='write the summary to this file')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(args.ms_per_token))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    AI_HF.API_URL = f'http://127.0.0.1:{server.server_port}/v1/chat/completions'
+
+    today = datetime.date.today()
+    for variant in ('full', 'compact'):
+        for _ in range(args.n):
+            AI_HF('Воронеж', prompt_variant=variant).translate()
+            AI_HF(SAMPLE_DATA, prompt_variant=variant).formating_answer('Voronezh, Russia', today)
+
+    summary = usage_stats.summary()
+    print(f'{"method:variant":32} {"calls":>5} {"prompt":>8} {"cached":>8} {"compl.":>7} {"latency ms":>10}')
+    for name, entry in sorted(summary.items()):
+        print(f'{name:32} {entry["calls"]:5} {entry["avg_prompt_tokens"]:8.0f} '
+              f'{entry["cached_tokens"] / entry["calls"]:8.0f} {entry["avg_completion_tokens"]:7.0f} '
+              f'{entry["avg_latency"] * 1000:10.2f}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures the cold start of a bot module: wall time of `import bot` in a fresh
+interpreter, its peak RSS and its slowest direct imports (python -X importtime).
+
+Usage:
+    python benchmarks/startup.py                        # bot.py, 5 runs
+    python benchmarks/startup.py --module bot_async -n 10 --out startup.json
+    python benchmarks/startup.py --no-local-ml          # NO_LOCAL_ML=1
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _env(no_local_ml):
+    env = dict(os.environ, BOT_TOKEN='123456:STARTUP', PYTHONPATH=ROOT)
+    env.pop('WARM_UP_MODELS', None)
+    if no_local_ml:
+        env['NO_LOCAL_ML'] = '1'
+    return env
+
+
+def _run(module, env, cwd):
+    """
+    Import the module in a child interpreter.
+
+    Returns:
+        tuple: (wall seconds, peak RSS in MiB, stderr with the import times).
+    """
+    code = f'import {module}; import resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)'
+    started = time.perf_counter()
+    done = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          env=env, cwd=cwd, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if done.returncode:
+        raise SystemExit(done.stderr[-2000:])
+    rss_kib = int(done.stdout.split()[-1]) # ru_maxrss в КиБ на Linux
+    return elapsed, rss_kib / 1024, done.stderr
+
+
+def _top_imports(importtime, module, n):
+    """
+    Parse `-X importtime` output into the n slowest direct imports of a module.
+    """
+    children = []
+    for line in importtime.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        depth = len(name) - len(name.lstrip()) # ' name' — верхний уровень, '   name' — его прямые импорты
+        if depth == 3:
+            children.append((name.strip(), int(cumulative_us) / 1000))
+        elif depth == 1:
+            if name.strip() == module:
+                break
+            children = []
+    children.sort(key=lambda row: row[1], reverse=True)
+    return [{'module': name, 'ms': round(ms, 1)} for name, ms in children[:n]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='bot', help='module to import (bot or bot_async)')
+    parser.add_argument('-n', type=int, default=5, help='number of fresh interpreters')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest imports to show')
+    parser.add_argument('--no-local-ml', action='store_true', help='set NO_LOCAL_ML=1')
+    parser.add_argument('--out', help='write the results as JSON')
+    args = parser.parse_args()
+
+    env = _env(args.no_local_ml)
+    walls, rss = [], []
+    with tempfile.TemporaryDirectory() as cwd: # SQLite-файлы кэша и подписок создаются во временной папке
+        for _ in range(args.n):
+            wall, peak, importtime = _run(args.module, env, cwd)
+            walls.append(wall)
+            rss.append(peak)
+
+    result = {
+        'module': args.module,
+        'no_local_ml': args.no_local_ml,
+        'runs': args.n,
+        'wall_ms': {'median': round(statistics.median(walls) * 1000, 1),
+                    'min': round(min(walls) * 1000, 1), 'max': round(max(walls) * 1000, 1)},
+        'peak_rss_mib': round(max(rss), 1),
+        'top_imports': _top_imports(importtime, args.module, args.top),
+    }
+    print(f"import {args.module}: {result['wall_ms']['median']} ms median "
+          f"({result['wall_ms']['min']}–{result['wall_ms']['max']}), peak RSS {result['peak_rss_mib']} MiB")
+    for row in result['top_imports']:
+        print(f"  {row['ms']:8.1f} ms  {row['module']}")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,55 @@
 import telebot
 from telebot import types
-from weather_cod import Weather
+from telebot.apihelper import ApiTelegramException
+from weather_cod import LOCAL_ML, Weather, marian_pool, model_registry
+from subscriptions import SubscriptionScheduler, SubscriptionStore
+from conversation import SQLiteStateStore
+from admission import BACKGROUND, MAX_ACTIVE, MAX_PENDING, BusyError, admission_control
+from resilience import UNAVAILABLE_TEXT, UpstreamUnavailable, deadline
+import datetime
+import metrics
+import os
+import threading
 import time
 
 
-BOT_TOKEN = 'YOUR-KEY'
+BOT_TOKEN = os.environ.get('BOT_TOKEN', 'YOUR-KEY')
+WARM_UP_MODELS = bool(os.environ.get('WARM_UP_MODELS')) # загружать модели MarianMT в фоне при старте бота
+PROGRESSIVE = True # сразу отправлять цифры прогноза и дописывать комментарий ИИ по мере генерации
+EDIT_INTERVAL = 1.5 # минимальный интервал в секундах между правками одного сообщения
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0)) or None # порт Prometheus-эндпоинта /metrics, None — метрики выключены
+TRACE_LOG = bool(os.environ.get('TRACE_LOG')) # JSON-лог с разбивкой по этапам для каждого запроса
+HANDLER_THREADS = MAX_ACTIVE + MAX_PENDING + 16 # потоков обработчиков: больше, чем допущенных и ждущих запросов, чтобы лишние сразу получали «занято», а не копились в очереди telebot
 
-bot = telebot.TeleBot(BOT_TOKEN)
+bot = telebot.TeleBot(BOT_TOKEN, num_threads=HANDLER_THREADS)
+
+
+state_store = SQLiteStateStore() # какого ответа ждём от чата; общий для всех процессов бота на хосте
+subscription_store = SubscriptionStore()
+
+
+def scheduled_forecast(location):
+    """
+    Builds today's forecast for a subscription, as a background request that
+    yields to users' interactive requests.
+
+    Args:
+        location (str): Resolved location in the "City, Country" format.
+
+    Returns:
+        str: The forecast text.
+    """
+    with deadline(), admission_control.admit(priority=BACKGROUND):
+        return Weather.for_location(location).weather_today()
+
+
+subscription_scheduler = SubscriptionScheduler(subscription_store, forecast=scheduled_forecast, send=bot.send_message)
 
 
 menu = types.ReplyKeyboardMarkup(resize_keyboard=True)
 weather_today = types.KeyboardButton('Погода на сегодня')
-menu.add(weather_today)
+weather_week = types.KeyboardButton('Погода на неделю')
+menu.add(weather_today, weather_week)
 
 @bot.message_handler(commands=['start'])
 def start_message(message):
@@ -24,62 +62,217 @@ def start_message(message):
         message (telebot.types.Message): Incoming Telegram message object containing
                                          chat and user information.
     """
+    state_store.pop(message.chat.id)
     bot.send_message(message.chat.id, "Привет 🌤️\nЯ бот прогноза погоды! Хочешь узнать погоду?", reply_markup=menu)
 
+@bot.message_handler(commands=['subscribe'])
+def subscribe_message(message):
+    """
+    Handles the /subscribe <city> <HH:MM> command: subscribes the chat to a
+    daily forecast for the city at the given time.
+
+    Args:
+        message (telebot.types.Message): Incoming Telegram message object.
+    """
+    parts = message.text.split()
+    try:
+        send_time = datetime.datetime.strptime(parts[-1], '%H:%M').time()
+        city = ' '.join(parts[1:-1])
+        if not city:
+            raise ValueError
+    except (ValueError, IndexError):
+        bot.send_message(message.chat.id, 'Формат: /subscribe <город> <ЧЧ:ММ>, например /subscribe Воронеж 07:30')
+        return
+    try:
+        location = Weather(city, strict=True).location # догадку-транслитерацию не сохраняем
+        subscription_store.subscribe(message.chat.id, city, location, send_time)
+        bot.send_message(message.chat.id, f'Готово! Каждый день в {send_time:%H:%M} пришлю прогноз для {location} ⏰')
+    except Exception as e:
+        bot.send_message(message.chat.id, f"Ошибка 😕: {e}")
+
+@bot.message_handler(commands=['unsubscribe'])
+def unsubscribe_message(message):
+    """
+    Handles the /unsubscribe command: removes all subscriptions of the chat.
+
+    Args:
+        message (telebot.types.Message): Incoming Telegram message object.
+    """
+    if subscription_store.unsubscribe(message.chat.id):
+        bot.send_message(message.chat.id, 'Подписка отменена 👌')
+    else:
+        bot.send_message(message.chat.id, 'У тебя нет подписок')
+
 @bot.message_handler(func=lambda message: True)
 def handle_message(message):
     """
     Handles all text messages sent to the bot.
 
-    Detects whether the user requested today's or tomorrow's forecast and
-    forwards control to the appropriate weather handler.
+    If the chat is waiting for a city name, forwards the message to the pending
+    weather handler; otherwise detects whether the user requested today's,
+    tomorrow's or the week's forecast. The pending step lives in state_store, so the reply
+    may be handled by any bot process.
 
     Args:
         message (telebot.types.Message): Incoming Telegram message object.
     """
-    if message.text == 'Погода на сегодня':
+    step = state_store.pop(message.chat.id)
+    if step is not None:
+        STEPS[step](message)
+    elif message.text == 'Погода на сегодня':
         bot.send_message(message.chat.id, 'Напиши название города, погоду в котором хочешь узнать 🌍')
-        bot.register_next_step_handler(message, today_get_weather)
+        state_store.set(message.chat.id, 'today')
     elif message.text == 'Погода на завтра':
         bot.send_message(message.chat.id, 'Напиши название города, погоду в котором хочешь узнать 🌍')
-        bot.register_next_step_handler(message, tomorrow_get_weather)
+        state_store.set(message.chat.id, 'tomorrow')
+    elif message.text == 'Погода на неделю':
+        bot.send_message(message.chat.id, 'Напиши название города, погоду в котором хочешь узнать 🌍')
+        state_store.set(message.chat.id, 'week')
+
+
+def send_progressive(chat_id, parts):
+    """
+    Sends a growing text as one message: the first part is sent at once and the
+    message is then edited at most every EDIT_INTERVAL seconds, with a final
+    edit carrying the complete text.
+
+    Intermediate edits rejected by Telegram (e.g. 429 Too Many Requests) are
+    skipped; the next edit carries the newer text anyway.
+
+    Args:
+        chat_id (int): Telegram chat identifier.
+        parts (iterable): Texts, each one a longer version of the previous.
+    """
+    message = None
+    text = sent = None
+    last_edit = 0.0
+    for text in parts:
+        if message is None:
+            with metrics.stage('telegram_send'):
+                message = bot.send_message(chat_id, text)
+            sent, last_edit = text, time.monotonic()
+        elif time.monotonic() - last_edit >= EDIT_INTERVAL:
+            try:
+                with metrics.stage('telegram_send'):
+                    bot.edit_message_text(text, chat_id, message.message_id)
+                sent = text
+            except ApiTelegramException:
+                pass
+            last_edit = time.monotonic()
+    if message is not None and text != sent:
+        try:
+            with metrics.stage('telegram_send'):
+                bot.edit_message_text(text, chat_id, message.message_id)
+        except ApiTelegramException as e:
+            if e.error_code != 429:
+                raise
+            time.sleep(e.result_json.get('parameters', {}).get('retry_after', EDIT_INTERVAL))
+            bot.edit_message_text(text, chat_id, message.message_id)
 
 
 def today_get_weather(message):
     """
-    Processes the user's input city and sends the weather forecast for today.
+    Processes the user's input city and sends the weather forecast for today,
+    or a "busy" answer if admission_control rejects the request. The answer
+    comes within resilience.REQUEST_BUDGET seconds.
 
     Args:
         message (telebot.types.Message): Telegram message containing the city name.
     """
-    try:
-        city = message.text
-        w = Weather(city)
-        weather = w.weather_today()
-        bot.send_message(message.chat.id, weather)
-    except Exception as e:
-        bot.send_message(message.chat.id, f"Ошибка 😕: {e}")
+    with metrics.request('today', message.chat.id), deadline():
+        try:
+            with admission_control.admit(message.chat.id):
+                city = message.text
+                w = Weather(city)
+                if PROGRESSIVE:
+                    send_progressive(message.chat.id, w.iter_day_weather(datetime.date.today()))
+                    return
+                weather = w.weather_today()
+                with metrics.stage('telegram_send'):
+                    bot.send_message(message.chat.id, weather)
+        except BusyError as e:
+            bot.send_message(message.chat.id, str(e))
+        except UpstreamUnavailable as e:
+            metrics.error('today', e)
+            bot.send_message(message.chat.id, UNAVAILABLE_TEXT)
+        except Exception as e:
+            metrics.error('today', e)
+            bot.send_message(message.chat.id, f"Ошибка 😕: {e}")
 
 def tomorrow_get_weather(message):
     """
-    Processes the user's input city and sends the weather forecast for tomorrow.
+    Processes the user's input city and sends the weather forecast for tomorrow,
+    or a "busy" answer if admission_control rejects the request. The answer
+    comes within resilience.REQUEST_BUDGET seconds.
 
     Args:
         message (telebot.types.Message): Telegram message containing the city name.
     """
-    try:
-        city = message.text
-        w = Weather(city)
-        weather = w.weather_tommorow()
-        bot.send_message(message.chat.id, weather)
-    except Exception as e:
-        bot.send_message(message.chat.id, f"Ошибка 😕: {e}")
+    with metrics.request('tomorrow', message.chat.id), deadline():
+        try:
+            with admission_control.admit(message.chat.id):
+                city = message.text
+                w = Weather(city)
+                if PROGRESSIVE:
+                    tomorrow = datetime.date.today() + datetime.timedelta(1)
+                    send_progressive(message.chat.id, w.iter_day_weather(tomorrow))
+                    return
+                weather = w.weather_tommorow()
+                with metrics.stage('telegram_send'):
+                    bot.send_message(message.chat.id, weather)
+        except BusyError as e:
+            bot.send_message(message.chat.id, str(e))
+        except UpstreamUnavailable as e:
+            metrics.error('tomorrow', e)
+            bot.send_message(message.chat.id, UNAVAILABLE_TEXT)
+        except Exception as e:
+            metrics.error('tomorrow', e)
+            bot.send_message(message.chat.id, f"Ошибка 😕: {e}")
 
 
-while True:
-    try:
-        bot.infinity_polling(timeout=10, long_polling_timeout=5)
-    except Exception as e:
-        print(f"Ошибка polling: {e}. Перезапуск через 5 секунд...")
-        time.sleep(5)
+def week_get_weather(message):
+    """
+    Processes the user's input city and sends the forecast for the week,
+    fetched from Visual Crossing in one call, or a "busy" answer if
+    admission_control rejects the request.
+
+    Args:
+        message (telebot.types.Message): Telegram message containing the city name.
+    """
+    with metrics.request('week', message.chat.id), deadline():
+        try:
+            with admission_control.admit(message.chat.id):
+                w = Weather(message.text)
+                weather = w.weather_week()
+                with metrics.stage('telegram_send'):
+                    bot.send_message(message.chat.id, weather)
+        except BusyError as e:
+            bot.send_message(message.chat.id, str(e))
+        except UpstreamUnavailable as e:
+            metrics.error('week', e)
+            bot.send_message(message.chat.id, UNAVAILABLE_TEXT)
+        except Exception as e:
+            metrics.error('week', e)
+            bot.send_message(message.chat.id, f"Ошибка 😕: {e}")
+
+
+# шаги диалога по именам из state_store
+STEPS = {'today': today_get_weather, 'tomorrow': tomorrow_get_weather, 'week': week_get_weather}
+
+
+if __name__ == '__main__':
+    if METRICS_PORT or TRACE_LOG:
+        metrics.enable(METRICS_PORT, trace_log=TRACE_LOG)
+    if WARM_UP_MODELS and LOCAL_ML:
+        threading.Thread(target=(marian_pool or model_registry).warm_up, daemon=True).start()
+    subscription_scheduler.start()
+    bot.remove_webhook() # polling не работает, пока установлен вебхук (см. webhook.py)
+
+    while True:
+        try:
+            bot.infinity_polling(timeout=10, long_polling_timeout=5)
+        except Exception as e:
+            print(f"Ошибка polling: {e}. Перезапуск через 5 секунд...")
+            time.sleep(5)
+
 
@@ -0,0 +1,284 @@
+import asyncio
+import datetime
+import metrics
+import os
+import time
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_helper import ApiTelegramException
+from telebot import types
+from weather_cod import Weather
+from subscriptions import SubscriptionScheduler, SubscriptionStore
+from conversation import SQLiteStateStore
+from admission import BACKGROUND, BusyError, admission_control
+from resilience import UNAVAILABLE_TEXT, UpstreamUnavailable, deadline
+from http_client import close_async_session
+
+
+BOT_TOKEN = os.environ.get('BOT_TOKEN', 'YOUR-KEY')
+PROGRESSIVE = True # сразу отправлять цифры прогноза и дописывать комментарий ИИ по мере генерации
+EDIT_INTERVAL = 1.5 # минимальный интервал в секундах между правками одного сообщения
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0)) or None # порт Prometheus-эндпоинта /metrics, None — метрики выключены
+TRACE_LOG = bool(os.environ.get('TRACE_LOG')) # JSON-лог с разбивкой по этапам для каждого запроса
+
+bot = AsyncTeleBot(BOT_TOKEN)
+
+
+menu = types.ReplyKeyboardMarkup(resize_keyboard=True)
+weather_today = types.KeyboardButton('Погода на сегодня')
+weather_week = types.KeyboardButton('Погода на неделю')
+menu.add(weather_today, weather_week)
+
+state_store = SQLiteStateStore() # какого ответа ждём от чата; переживает перезапуск бота; вызовы SQLite — через to_thread, чтобы не блокировать цикл
+subscription_store = SubscriptionStore()
+
+
+async def scheduled_forecast(location):
+    """
+    Asynchronous counterpart of bot.scheduled_forecast().
+
+    Args:
+        location (str): Resolved location in the "City, Country" format.
+
+    Returns:
+        str: The forecast text.
+    """
+    with deadline():
+        async with admission_control.aadmit(priority=BACKGROUND):
+            return await Weather.for_location(location).aweather_today()
+
+
+@bot.message_handler(commands=['start'])
+async def start_message(message):
+    """
+    Handles the /start command sent by the user.
+
+    Sends a welcome message and displays a custom keyboard with weather options.
+
+    Args:
+        message (telebot.types.Message): Incoming Telegram message object.
+    """
+    await asyncio.to_thread(state_store.pop, message.chat.id)
+    await bot.send_message(message.chat.id, "Привет 🌤️\nЯ бот прогноза погоды! Хочешь узнать погоду?", reply_markup=menu)
+
+
+@bot.message_handler(commands=['subscribe'])
+async def subscribe_message(message):
+    """
+    Handles the /subscribe <city> <HH:MM> command: subscribes the chat to a
+    daily forecast for the city at the given time.
+
+    Args:
+        message (telebot.types.Message): Incoming Telegram message object.
+    """
+    parts = message.text.split()
+    try:
+        send_time = datetime.datetime.strptime(parts[-1], '%H:%M').time()
+        city = ' '.join(parts[1:-1])
+        if not city:
+            raise ValueError
+    except (ValueError, IndexError):
+        await bot.send_message(message.chat.id, 'Формат: /subscribe <город> <ЧЧ:ММ>, например /subscribe Воронеж 07:30')
+        return
+    try:
+        location = (await Weather.acreate(city, strict=True)).location # догадку-транслитерацию не сохраняем
+        await asyncio.to_thread(subscription_store.subscribe, message.chat.id, city, location, send_time)
+        await bot.send_message(message.chat.id, f'Готово! Каждый день в {send_time:%H:%M} пришлю прогноз для {location} ⏰')
+    except Exception as e:
+        await bot.send_message(message.chat.id, f"Ошибка 😕: {e}")
+
+
+@bot.message_handler(commands=['unsubscribe'])
+async def unsubscribe_message(message):
+    """
+    Handles the /unsubscribe command: removes all subscriptions of the chat.
+
+    Args:
+        message (telebot.types.Message): Incoming Telegram message object.
+    """
+    if await asyncio.to_thread(subscription_store.unsubscribe, message.chat.id):
+        await bot.send_message(message.chat.id, 'Подписка отменена 👌')
+    else:
+        await bot.send_message(message.chat.id, 'У тебя нет подписок')
+
+
+@bot.message_handler(func=lambda message: True)
+async def handle_message(message):
+    """
+    Handles all text messages sent to the bot.
+
+    If the chat is waiting for a city name, forwards the message to the pending
+    weather handler; otherwise detects whether the user requested today's,
+    tomorrow's or the week's forecast.
+
+    Args:
+        message (telebot.types.Message): Incoming Telegram message object.
+    """
+    step = await asyncio.to_thread(state_store.pop, message.chat.id)
+    if step is not None:
+        await STEPS[step](message)
+    elif message.text == 'Погода на сегодня':
+        await bot.send_message(message.chat.id, 'Напиши название города, погоду в котором хочешь узнать 🌍')
+        await asyncio.to_thread(state_store.set, message.chat.id, 'today')
+    elif message.text == 'Погода на завтра':
+        await bot.send_message(message.chat.id, 'Напиши название города, погоду в котором хочешь узнать 🌍')
+        await asyncio.to_thread(state_store.set, message.chat.id, 'tomorrow')
+    elif message.text == 'Погода на неделю':
+        await bot.send_message(message.chat.id, 'Напиши название города, погоду в котором хочешь узнать 🌍')
+        await asyncio.to_thread(state_store.set, message.chat.id, 'week')
+
+
+async def send_progressive(chat_id, parts):
+    """
+    Asynchronous counterpart of bot.send_progressive().
+
+    Args:
+        chat_id (int): Telegram chat identifier.
+        parts (async iterable): Texts, each one a longer version of the previous.
+    """
+    message = None
+    text = sent = None
+    last_edit = 0.0
+    async for text in parts:
+        if message is None:
+            with metrics.stage('telegram_send'):
+                message = await bot.send_message(chat_id, text)
+            sent, last_edit = text, time.monotonic()
+        elif time.monotonic() - last_edit >= EDIT_INTERVAL:
+            try:
+                with metrics.stage('telegram_send'):
+                    await bot.edit_message_text(text, chat_id, message.message_id)
+                sent = text
+            except ApiTelegramException:
+                pass
+            last_edit = time.monotonic()
+    if message is not None and text != sent:
+        try:
+            with metrics.stage('telegram_send'):
+                await bot.edit_message_text(text, chat_id, message.message_id)
+        except ApiTelegramException as e:
+            if e.error_code != 429:
+                raise
+            await asyncio.sleep(e.result_json.get('parameters', {}).get('retry_after', EDIT_INTERVAL))
+            await bot.edit_message_text(text, chat_id, message.message_id)
+
+
+async def today_get_weather(message):
+    """
+    Processes the user's input city and sends the weather forecast for today,
+    or a "busy" answer if admission_control rejects the request. The answer
+    comes within resilience.REQUEST_BUDGET seconds.
+
+    Args:
+        message (telebot.types.Message): Telegram message containing the city name.
+    """
+    with metrics.request('today', message.chat.id), deadline():
+        try:
+            async with admission_control.aadmit(message.chat.id):
+                w = await Weather.acreate(message.text)
+                if PROGRESSIVE:
+                    await send_progressive(message.chat.id, w.aiter_day_weather(datetime.date.today()))
+                    return
+                weather = await w.aweather_today()
+                with metrics.stage('telegram_send'):
+                    await bot.send_message(message.chat.id, weather)
+        except BusyError as e:
+            await bot.send_message(message.chat.id, str(e))
+        except UpstreamUnavailable as e:
+            metrics.error('today', e)
+            await bot.send_message(message.chat.id, UNAVAILABLE_TEXT)
+        except Exception as e:
+            metrics.error('today', e)
+            await bot.send_message(message.chat.id, f"Ошибка 😕: {e}")
+
+
+async def tomorrow_get_weather(message):
+    """
+    Processes the user's input city and sends the weather forecast for tomorrow,
+    or a "busy" answer if admission_control rejects the request. The answer
+    comes within resilience.REQUEST_BUDGET seconds.
+
+    Args:
+        message (telebot.types.Message): Telegram message containing the city name.
+    """
+    with metrics.request('tomorrow', message.chat.id), deadline():
+        try:
+            async with admission_control.aadmit(message.chat.id):
+                w = await Weather.acreate(message.text)
+                if PROGRESSIVE:
+                    tomorrow = datetime.date.today() + datetime.timedelta(1)
+                    await send_progressive(message.chat.id, w.aiter_day_weather(tomorrow))
+                    return
+                weather = await w.aweather_tommorow()
+                with metrics.stage('telegram_send'):
+                    await bot.send_message(message.chat.id, weather)
+        except BusyError as e:
+            await bot.send_message(message.chat.id, str(e))
+        except UpstreamUnavailable as e:
+            metrics.error('tomorrow', e)
+            await bot.send_message(message.chat.id, UNAVAILABLE_TEXT)
+        except Exception as e:
+            metrics.error('tomorrow', e)
+            await bot.send_message(message.chat.id, f"Ошибка 😕: {e}")
+
+
+async def week_get_weather(message):
+    """
+    Processes the user's input city and sends the forecast for the week,
+    fetched from Visual Crossing in one call, or a "busy" answer if
+    admission_control rejects the request.
+
+    Args:
+        message (telebot.types.Message): Telegram message containing the city name.
+    """
+    with metrics.request('week', message.chat.id), deadline():
+        try:
+            async with admission_control.aadmit(message.chat.id):
+                w = await Weather.acreate(message.text)
+                weather = await w.aweather_week()
+                with metrics.stage('telegram_send'):
+                    await bot.send_message(message.chat.id, weather)
+        except BusyError as e:
+            await bot.send_message(message.chat.id, str(e))
+        except UpstreamUnavailable as e:
+            metrics.error('week', e)
+            await bot.send_message(message.chat.id, UNAVAILABLE_TEXT)
+        except Exception as e:
+            metrics.error('week', e)
+            await bot.send_message(message.chat.id, f"Ошибка 😕: {e}")
+
+
+# шаги диалога по именам из state_store
+STEPS = {'today': today_get_weather, 'tomorrow': tomorrow_get_weather, 'week': week_get_weather}
+
+
+async def main():
+    """
+    Runs the bot in asyncio mode: every update is handled in its own task,
+    so a slow chat does not block the others.
+
+    The subscription scheduler runs in its own thread and hands forecasts
+    and messages to the event loop, so mailings share the loop's admission
+    queue and upstream limits with the chats.
+    """
+    loop = asyncio.get_running_loop()
+
+    def on_loop(coro):
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    scheduler = SubscriptionScheduler(
+        subscription_store,
+        forecast=lambda location: on_loop(scheduled_forecast(location)),
+        send=lambda chat_id, text: on_loop(bot.send_message(chat_id, text)),
+    )
+    scheduler.start()
+    try:
+        await bot.infinity_polling(timeout=10, request_timeout=15)
+    finally:
+        scheduler.stop()
+        await close_async_session()
+
+
+if __name__ == '__main__':
+    if METRICS_PORT or TRACE_LOG:
+        metrics.enable(METRICS_PORT, trace_log=TRACE_LOG)
+    asyncio.run(main())
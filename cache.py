@@ -0,0 +1,524 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+
+import resilience
+
+
+CACHE_PATH = 'weather_cache.sqlite3'
+
+
+class SQLiteTTLCache:
+    """
+    Persistent key-value cache with per-entry expiry, stored in a SQLite file.
+
+    Values are stored as JSON, so anything json-serializable can be cached.
+    Several bot processes may point at the same file and share entries.
+
+    Attributes:
+        path (str): Path to the SQLite database file.
+        table (str): Table used by this cache; one file can hold several caches.
+        ttl (float): Default time to live of an entry in seconds.
+    """
+
+    def __init__(self, path=CACHE_PATH, table='cache', ttl=86400):
+        """
+        Initialize a cache. The database is opened lazily on first use.
+
+        Args:
+            path (str, optional): SQLite file path. Defaults to CACHE_PATH.
+            table (str, optional): Table name. Defaults to 'cache'.
+            ttl (float, optional): Default time to live in seconds. Defaults to one day.
+        """
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """
+        Open the database and create the table if needed. Caller holds the lock.
+
+        Returns:
+            sqlite3.Connection: Open connection.
+        """
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} '
+                f'(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        """
+        Return a cached value.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            Any: Cached value, or None if it is missing or expired.
+        """
+        with self._lock:
+            row = self._connect().execute(
+                f'SELECT value, expires FROM {self.table} WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value.
+
+        Args:
+            key (str): Cache key.
+            value (Any): JSON-serializable value.
+            ttl (float, optional): Time to live in seconds. Defaults to self.ttl.
+        """
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)',
+                (key, json.dumps(value, ensure_ascii=False), expires)
+            )
+            conn.commit()
+
+    def purge_expired(self):
+        """
+        Delete all expired entries.
+
+        Returns:
+            int: Number of deleted entries.
+        """
+        with self._lock:
+            conn = self._connect()
+            deleted = conn.execute(f'DELETE FROM {self.table} WHERE expires < ?', (time.time(),)).rowcount
+            conn.commit()
+        return deleted
+
+
+class LRUTTLCache:
+    """
+    In-process, thread-safe cache with LRU eviction and per-entry expiry.
+
+    Attributes:
+        maxsize (int): Maximum number of entries kept in memory.
+        ttl (float): Default time to live of an entry in seconds.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that found nothing or an expired entry.
+    """
+
+    def __init__(self, maxsize=1024, ttl=600):
+        """
+        Initialize an empty cache.
+
+        Args:
+            maxsize (int, optional): Maximum number of entries. Defaults to 1024.
+            ttl (float, optional): Default time to live in seconds. Defaults to 10 minutes.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return a cached value and mark it as recently used.
+
+        Args:
+            key (Hashable): Cache key.
+
+        Returns:
+            Any: Cached value, or None if it is missing or expired.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key (Hashable): Cache key.
+            value (Any): Value to store.
+            ttl (float, optional): Time to live in seconds. Defaults to self.ttl.
+        """
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: Size, hits, misses and hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+class _Flight:
+    """
+    A call in progress shared by SingleFlight waiters.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.expired = False # вызов оборвал срок ведущего запроса, а не сам сервис
+
+
+class _AsyncFlight:
+    """
+    A call in progress shared by AsyncSingleFlight waiters.
+    """
+
+    __slots__ = ('future', 'expired')
+
+    def __init__(self):
+        self.future = None
+        self.expired = False
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+
+    The first caller runs the function; callers arriving while it runs wait
+    and receive the same result or exception. A waiter waits no longer than
+    its own deadline (resilience.remaining()). If the leader's call was cut
+    by the leader's deadline, waiters that still have time do not inherit
+    that error but run the call again, one of them as the new leader.
+
+    Attributes:
+        calls (int): Number of executed functions.
+        coalesced (int): Number of callers that shared another caller's result.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Run fn once for all concurrent callers with the same key.
+
+        Args:
+            key (Hashable): Identity of the call.
+            fn (callable): Function without arguments.
+
+        Returns:
+            Any: Result of fn.
+
+        Raises:
+            resilience.DeadlineExceeded: If the caller's deadline passed while waiting.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    self.calls += 1
+                else:
+                    self.coalesced += 1
+            if leader:
+                break
+            if not flight.event.wait(resilience.remaining()):
+                raise resilience.DeadlineExceeded()
+            if flight.expired:
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            flight.expired = resilience.cut_by_deadline(e)
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+        return flight.result
+
+
+class AsyncSingleFlight:
+    """
+    Asynchronous counterpart of SingleFlight for coroutine functions, with
+    the same deadline handling.
+
+    Attributes:
+        calls (int): Number of executed coroutines.
+        coalesced (int): Number of callers that shared another caller's result.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._flights = {}
+
+    async def do(self, key, coro_fn):
+        """
+        Await coro_fn once for all concurrent callers with the same key.
+
+        Args:
+            key (Hashable): Identity of the call.
+            coro_fn (callable): Coroutine function without arguments.
+
+        Returns:
+            Any: Result of the coroutine.
+
+        Raises:
+            resilience.DeadlineExceeded: If the caller's deadline passed while waiting.
+        """
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.wait_for(asyncio.shield(flight.future), resilience.remaining())
+            except asyncio.TimeoutError:
+                raise resilience.DeadlineExceeded() from None
+            except Exception:
+                if not flight.expired:
+                    raise
+                self._forget(key, flight) # ведущий мог ещё не убрать свой вызов
+
+        async def run():
+            try:
+                return await coro_fn()
+            except Exception as e:
+                flight.expired = resilience.cut_by_deadline(e) # в контексте ведущего: его срок
+                raise
+
+        self.calls += 1
+        flight = self._flights[key] = _AsyncFlight()
+        flight.future = asyncio.ensure_future(run())
+        try:
+            return await asyncio.shield(flight.future)
+        finally:
+            if flight.future.done():
+                self._forget(key, flight)
+            else:
+                flight.future.add_done_callback(lambda _: self._forget(key, flight))
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+class _StreamBuffer:
+    """
+    Items of a stream in progress, replayed by StreamFlight followers.
+    """
+
+    def __init__(self, changed):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.abandoned = True # ведущий бросил поток или его оборвал срок ведущего — не ошибка сервиса
+        self.changed = changed
+
+
+class StreamFlight:
+    """
+    Coalesces concurrent streams with the same key into one upstream stream.
+
+    The first caller iterates the generator and stores every item; callers
+    arriving meanwhile replay the items stored so far and then follow the
+    leader as new ones arrive, each waiting no longer than its own deadline.
+    An error of the leader's stream is raised in every follower. If the
+    leader stops early or its stream is cut by the leader's deadline,
+    followers that still have time start the stream again, one of them as
+    the new leader. The new items follow the ones already yielded, so a
+    stream that may be restarted should yield self-contained items, e.g.
+    the text so far rather than deltas.
+
+    Attributes:
+        calls (int): Number of started streams.
+        coalesced (int): Number of callers that followed another caller's stream.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def stream(self, key, gen_fn):
+        """
+        Iterate gen_fn() once for all concurrent callers with the same key.
+
+        Args:
+            key (Hashable): Identity of the stream.
+            gen_fn (callable): Function without arguments returning an iterator.
+
+        Yields:
+            Any: Items of the stream in order.
+
+        Raises:
+            resilience.DeadlineExceeded: If the caller's deadline passed while waiting.
+        """
+        while True:
+            with self._lock:
+                buffer = self._flights.get(key)
+                leader = buffer is None
+                if leader:
+                    buffer = self._flights[key] = _StreamBuffer(threading.Condition(self._lock))
+                    self.calls += 1
+                else:
+                    self.coalesced += 1
+            if leader:
+                break
+
+            i = 0
+            done = False
+            while not done:
+                with self._lock:
+                    while i == len(buffer.chunks) and not buffer.done:
+                        if not buffer.changed.wait(resilience.remaining()):
+                            raise resilience.DeadlineExceeded()
+                    chunks = buffer.chunks[i:]
+                    done = buffer.done
+                i += len(chunks)
+                yield from chunks
+            if buffer.error is None:
+                return
+            if not buffer.abandoned:
+                raise buffer.error
+
+        error = RuntimeError('Поток прерван')
+        try:
+            iterator = gen_fn()
+            try:
+                for chunk in iterator:
+                    with self._lock:
+                        buffer.chunks.append(chunk)
+                        buffer.changed.notify_all()
+                    yield chunk
+            finally:
+                close = getattr(iterator, 'close', None)
+                if close is not None:
+                    close()
+            error = None
+        except Exception as e:
+            error = e
+            buffer.abandoned = resilience.cut_by_deadline(e)
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                buffer.done, buffer.error = True, error
+                buffer.changed.notify_all()
+
+
+class AsyncStreamFlight:
+    """
+    Asynchronous counterpart of StreamFlight for async generators, with the
+    same deadline handling.
+
+    Attributes:
+        calls (int): Number of started streams.
+        coalesced (int): Number of callers that followed another caller's stream.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._flights = {}
+
+    async def stream(self, key, agen_fn):
+        """
+        Iterate agen_fn() once for all concurrent callers with the same key.
+
+        Args:
+            key (Hashable): Identity of the stream.
+            agen_fn (callable): Function without arguments returning an async generator.
+
+        Yields:
+            Any: Items of the stream in order.
+
+        Raises:
+            resilience.DeadlineExceeded: If the caller's deadline passed while waiting.
+        """
+        while True:
+            buffer = self._flights.get(key)
+            if buffer is None:
+                break
+            self.coalesced += 1
+            i = 0
+            while True:
+                while i < len(buffer.chunks):
+                    yield buffer.chunks[i]
+                    i += 1
+                if buffer.done:
+                    break
+                try:
+                    await asyncio.wait_for(buffer.changed.wait(), resilience.remaining())
+                except asyncio.TimeoutError:
+                    raise resilience.DeadlineExceeded() from None
+            if buffer.error is None:
+                return
+            if not buffer.abandoned:
+                raise buffer.error
+
+        self.calls += 1
+        buffer = self._flights[key] = _StreamBuffer(asyncio.Event())
+        error = RuntimeError('Поток прерван')
+        try:
+            async with aclosing(agen_fn()) as chunks:
+                async for chunk in chunks:
+                    buffer.chunks.append(chunk)
+                    # ожидающие просыпаются по старому событию, следующие ждут нового
+                    buffer.changed.set()
+                    buffer.changed = asyncio.Event()
+                    yield chunk
+            error = None
+        except Exception as e:
+            error = e
+            buffer.abandoned = resilience.cut_by_deadline(e)
+            raise
+        finally:
+            del self._flights[key]
+            buffer.done, buffer.error = True, error
+            buffer.changed.set()
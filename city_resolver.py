@@ -0,0 +1,421 @@
+import asyncio
+import difflib
+import re
+import threading
+
+
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+}
+
+# Офлайн-справочник: русское название -> "City, Country" в формате Visual Crossing
+CITIES = {
+    'Москва': 'Moscow, Russia',
+    'Санкт-Петербург': 'Saint Petersburg, Russia',
+    'Питер': 'Saint Petersburg, Russia',
+    'Новосибирск': 'Novosibirsk, Russia',
+    'Екатеринбург': 'Yekaterinburg, Russia',
+    'Казань': 'Kazan, Russia',
+    'Нижний Новгород': 'Nizhny Novgorod, Russia',
+    'Челябинск': 'Chelyabinsk, Russia',
+    'Самара': 'Samara, Russia',
+    'Омск': 'Omsk, Russia',
+    'Ростов-на-Дону': 'Rostov-on-Don, Russia',
+    'Уфа': 'Ufa, Russia',
+    'Красноярск': 'Krasnoyarsk, Russia',
+    'Воронеж': 'Voronezh, Russia',
+    'Пермь': 'Perm, Russia',
+    'Волгоград': 'Volgograd, Russia',
+    'Краснодар': 'Krasnodar, Russia',
+    'Саратов': 'Saratov, Russia',
+    'Тюмень': 'Tyumen, Russia',
+    'Тольятти': 'Tolyatti, Russia',
+    'Ижевск': 'Izhevsk, Russia',
+    'Барнаул': 'Barnaul, Russia',
+    'Ульяновск': 'Ulyanovsk, Russia',
+    'Иркутск': 'Irkutsk, Russia',
+    'Хабаровск': 'Khabarovsk, Russia',
+    'Ярославль': 'Yaroslavl, Russia',
+    'Владивосток': 'Vladivostok, Russia',
+    'Махачкала': 'Makhachkala, Russia',
+    'Томск': 'Tomsk, Russia',
+    'Оренбург': 'Orenburg, Russia',
+    'Кемерово': 'Kemerovo, Russia',
+    'Новокузнецк': 'Novokuznetsk, Russia',
+    'Рязань': 'Ryazan, Russia',
+    'Астрахань': 'Astrakhan, Russia',
+    'Набережные Челны': 'Naberezhnye Chelny, Russia',
+    'Пенза': 'Penza, Russia',
+    'Липецк': 'Lipetsk, Russia',
+    'Киров': 'Kirov, Russia',
+    'Чебоксары': 'Cheboksary, Russia',
+    'Тула': 'Tula, Russia',
+    'Калининград': 'Kaliningrad, Russia',
+    'Курск': 'Kursk, Russia',
+    'Ставрополь': 'Stavropol, Russia',
+    'Сочи': 'Sochi, Russia',
+    'Тверь': 'Tver, Russia',
+    'Белгород': 'Belgorod, Russia',
+    'Брянск': 'Bryansk, Russia',
+    'Иваново': 'Ivanovo, Russia',
+    'Владимир': 'Vladimir, Russia',
+    'Архангельск': 'Arkhangelsk, Russia',
+    'Мурманск': 'Murmansk, Russia',
+    'Смоленск': 'Smolensk, Russia',
+    'Калуга': 'Kaluga, Russia',
+    'Тамбов': 'Tambov, Russia',
+    'Курган': 'Kurgan, Russia',
+    'Орёл': 'Oryol, Russia',
+    'Вологда': 'Vologda, Russia',
+    'Якутск': 'Yakutsk, Russia',
+    'Сургут': 'Surgut, Russia',
+    'Петрозаводск': 'Petrozavodsk, Russia',
+    'Кострома': 'Kostroma, Russia',
+    'Новгород': 'Veliky Novgorod, Russia',
+    'Великий Новгород': 'Veliky Novgorod, Russia',
+    'Псков': 'Pskov, Russia',
+    'Севастополь': 'Sevastopol, Ukraine',
+    'Симферополь': 'Simferopol, Ukraine',
+    'Поворино': 'Povorino, Russia',
+    'Минск': 'Minsk, Belarus',
+    'Киев': 'Kyiv, Ukraine',
+    'Харьков': 'Kharkiv, Ukraine',
+    'Одесса': 'Odesa, Ukraine',
+    'Астана': 'Astana, Kazakhstan',
+    'Алматы': 'Almaty, Kazakhstan',
+    'Ташкент': 'Tashkent, Uzbekistan',
+    'Бишкек': 'Bishkek, Kyrgyzstan',
+    'Душанбе': 'Dushanbe, Tajikistan',
+    'Баку': 'Baku, Azerbaijan',
+    'Ереван': 'Yerevan, Armenia',
+    'Тбилиси': 'Tbilisi, Georgia',
+    'Кишинёв': 'Chisinau, Moldova',
+    'Рига': 'Riga, Latvia',
+    'Вильнюс': 'Vilnius, Lithuania',
+    'Таллин': 'Tallinn, Estonia',
+    'Хельсинки': 'Helsinki, Finland',
+    'Стокгольм': 'Stockholm, Sweden',
+    'Осло': 'Oslo, Norway',
+    'Копенгаген': 'Copenhagen, Denmark',
+    'Берлин': 'Berlin, Germany',
+    'Мюнхен': 'Munich, Germany',
+    'Варшава': 'Warsaw, Poland',
+    'Прага': 'Prague, Czech Republic',
+    'Вена': 'Vienna, Austria',
+    'Будапешт': 'Budapest, Hungary',
+    'Париж': 'Paris, France',
+    'Лондон': 'London, United Kingdom',
+    'Дублин': 'Dublin, Ireland',
+    'Амстердам': 'Amsterdam, Netherlands',
+    'Брюссель': 'Brussels, Belgium',
+    'Мадрид': 'Madrid, Spain',
+    'Барселона': 'Barcelona, Spain',
+    'Лиссабон': 'Lisbon, Portugal',
+    'Рим': 'Rome, Italy',
+    'Милан': 'Milan, Italy',
+    'Афины': 'Athens, Greece',
+    'Белград': 'Belgrade, Serbia',
+    'София': 'Sofia, Bulgaria',
+    'Бухарест': 'Bucharest, Romania',
+    'Стамбул': 'Istanbul, Turkey',
+    'Анкара': 'Ankara, Turkey',
+    'Анталья': 'Antalya, Turkey',
+    'Дубай': 'Dubai, United Arab Emirates',
+    'Тель-Авив': 'Tel Aviv, Israel',
+    'Каир': 'Cairo, Egypt',
+    'Пекин': 'Beijing, China',
+    'Шанхай': 'Shanghai, China',
+    'Токио': 'Tokyo, Japan',
+    'Сеул': 'Seoul, South Korea',
+    'Бангкок': 'Bangkok, Thailand',
+    'Пхукет': 'Phuket, Thailand',
+    'Дели': 'Delhi, India',
+    'Сингапур': 'Singapore, Singapore',
+    'Нью-Йорк': 'New York, USA',
+    'Лос-Анджелес': 'Los Angeles, USA',
+    'Чикаго': 'Chicago, USA',
+    'Майами': 'Miami, USA',
+    'Сан-Франциско': 'San Francisco, USA',
+    'Торонто': 'Toronto, Canada',
+    'Ванкувер': 'Vancouver, Canada',
+    'Мехико': 'Mexico City, Mexico',
+    'Рио-де-Жанейро': 'Rio de Janeiro, Brazil',
+    'Буэнос-Айрес': 'Buenos Aires, Argentina',
+    'Сидней': 'Sydney, Australia',
+}
+
+
+def normalize(text):
+    """
+    Normalize a city name for lookups: lower case, 'ё' -> 'е', single spaces, no hyphens.
+
+    Args:
+        text (str): City name as typed by the user.
+
+    Returns:
+        str: Normalized key.
+    """
+    text = text.lower().replace('ё', 'е')
+    text = re.sub(r'[\s\-_.,]+', ' ', text)
+    return text.strip()
+
+
+def transliterate(text):
+    """
+    Transliterate Cyrillic characters to Latin; other characters are kept.
+
+    Args:
+        text (str): Text, usually already normalized.
+
+    Returns:
+        str: Latin transliteration.
+    """
+    return ''.join(CYRILLIC_TO_LATIN.get(ch, ch) for ch in text.lower())
+
+
+def is_typo(key, candidate):
+    """
+    Check that a close match is a typo of the candidate, not another place.
+
+    Derived names are often a known city with a changed or extra suffix
+    ('Тамбовка', 'Брянка', 'Белгородка') and score high in difflib, so a
+    match is accepted only if it is one edit away (a wrong, missing, extra
+    or swapped letter) and the candidate is not a strict prefix of the input.
+
+    Args:
+        key (str): Normalized input.
+        candidate (str): Index key returned by difflib.
+
+    Returns:
+        bool: True if the match may be used.
+    """
+    if abs(len(key) - len(candidate)) > 1:
+        return False
+    if key != candidate and key.startswith(candidate):
+        return False
+    return _edit_distance(key, candidate) <= 1
+
+
+def _edit_distance(a, b):
+    # Расстояние Дамерау — Левенштейна (с перестановкой соседних букв)
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (a[i - 1] != b[j - 1]),
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+    return current[len(b)]
+
+
+class CityResolver:
+    """
+    Resolves user input to the "City, Country" format in front of the LLM.
+
+    Lookup order:
+    1. Offline index of CITIES by Russian name, its transliteration and English name.
+    2. Persistent cache of earlier LLM answers, keyed by the normalized input.
+    3. Typo-tolerant fuzzy match against the offline index; see is_typo().
+    4. The fallback (AI_HF.translate); its answer is written back to the cache.
+    5. If the fallback fails (LLM down, circuit open, deadline spent), the
+       transliterated input, e.g. 'Поворино' -> 'Povorino'. Visual Crossing
+       geocodes most such names; the guess is not cached.
+
+    Attributes:
+        cache (SQLiteTTLCache | None): Persistent cache of resolved names.
+        fallback (callable | None): Function resolving a raw name on a real miss.
+        afallback (callable | None): Coroutine function used by aresolve() on a real miss.
+        fuzzy_cutoff (float): Minimal similarity ratio for fuzzy matches.
+        stats (dict): Counters of lookups by source.
+    """
+
+    def __init__(self, cache=None, fallback=None, afallback=None, cities=CITIES, fuzzy_cutoff=0.84):
+        """
+        Initialize the resolver and build the offline index.
+
+        Args:
+            cache (SQLiteTTLCache, optional): Persistent cache. Defaults to None.
+            fallback (callable, optional): Called with the raw input on a miss. Defaults to None.
+            afallback (callable, optional): Awaited with the raw input on a miss. Defaults to None.
+            cities (dict, optional): Russian name -> "City, Country". Defaults to CITIES.
+            fuzzy_cutoff (float, optional): Similarity cutoff for difflib. Defaults to 0.84.
+        """
+        self.cache = cache
+        self.fallback = fallback
+        self.afallback = afallback
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.stats = {'index': 0, 'cache': 0, 'fuzzy': 0, 'fallback': 0, 'transliteration': 0}
+        self._stats_lock = threading.Lock()
+        self.index = {}
+        for name, resolved in cities.items():
+            key = normalize(name)
+            self.index[key] = resolved
+            self.index[transliterate(key)] = resolved
+            self.index.setdefault(normalize(resolved.split(',')[0]), resolved)
+        self._keys = list(self.index)
+
+    def _count(self, source):
+        with self._stats_lock:
+            self.stats[source] += 1
+
+    def lookup(self, text):
+        """
+        Resolve a name without calling the fallback.
+
+        Args:
+            text (str): City name as typed by the user.
+
+        Returns:
+            str | None: "City, Country", or None if the name is unknown offline.
+        """
+        key = normalize(text)
+        resolved = self._from_index(key)
+        if resolved is not None:
+            return resolved
+
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._count('cache')
+                return cached
+
+        for candidate in (key, transliterate(key)):
+            for match in difflib.get_close_matches(candidate, self._keys, n=3, cutoff=self.fuzzy_cutoff):
+                if is_typo(candidate, match):
+                    self._count('fuzzy')
+                    return self.index[match]
+        return None
+
+    def _from_index(self, key):
+        """
+        Look a normalized name up in the offline index, by itself and transliterated.
+
+        Args:
+            key (str): Normalized input.
+
+        Returns:
+            str | None: "City, Country", or None if the index has no such name.
+        """
+        for candidate in (key, transliterate(key)):
+            if candidate in self.index:
+                self._count('index')
+                return self.index[candidate]
+        return None
+
+    def resolve(self, text, strict=False):
+        """
+        Resolve a name, calling the fallback only on a real miss.
+
+        Args:
+            text (str): City name as typed by the user.
+            strict (bool, optional): Raise instead of returning the transliterated
+                guess when the fallback fails, e.g. for names that are stored.
+                Defaults to False.
+
+        Returns:
+            str: "City, Country", or the transliterated input if the fallback failed.
+
+        Raises:
+            LookupError: If the name is unknown and no fallback is configured,
+                or in strict mode if the fallback failed.
+        """
+        resolved = self.lookup(text)
+        if resolved is not None:
+            return resolved
+        if self.fallback is None:
+            raise LookupError(f'Неизвестный город: {text}')
+
+        try:
+            answer = self.fallback(text)
+        except Exception as e:
+            if strict:
+                raise LookupError(f'Не удалось определить город «{text}», попробуй чуть позже') from e
+            return self._transliterated(text)
+        self._count('fallback')
+        return self._remember(text, answer)
+
+    async def aresolve(self, text, strict=False):
+        """
+        Asynchronous counterpart of resolve(), awaiting afallback on a real miss.
+
+        Only the offline index is read on the event loop; the SQLite cache and
+        the fuzzy match run in a worker thread.
+
+        Args:
+            text (str): City name as typed by the user.
+            strict (bool, optional): See resolve(). Defaults to False.
+
+        Returns:
+            str: "City, Country", or the transliterated input if the fallback failed.
+
+        Raises:
+            LookupError: If the name is unknown and no afallback is configured,
+                or in strict mode if the afallback failed.
+        """
+        resolved = self._from_index(normalize(text))
+        if resolved is None:
+            resolved = await asyncio.to_thread(self.lookup, text)
+        if resolved is not None:
+            return resolved
+        if self.afallback is None:
+            raise LookupError(f'Неизвестный город: {text}')
+
+        try:
+            answer = await self.afallback(text)
+        except Exception as e:
+            if strict:
+                raise LookupError(f'Не удалось определить город «{text}», попробуй чуть позже') from e
+            return self._transliterated(text)
+        self._count('fallback')
+        return await asyncio.to_thread(self._remember, text, answer)
+
+    def _transliterated(self, text):
+        """
+        Degraded answer used when the fallback fails: the input in Latin letters.
+
+        Args:
+            text (str): City name as typed by the user.
+
+        Returns:
+            str: Transliterated name, e.g. 'Ростов-на-Дону' -> 'Rostov-Na-Donu'.
+        """
+        self._count('transliteration')
+        return ' '.join(transliterate(text).split()).title()
+
+    def _remember(self, text, answer):
+        """
+        Write a fallback answer back to the cache if it looks valid.
+
+        Args:
+            text (str): City name as typed by the user.
+            answer (str): Fallback answer.
+
+        Returns:
+            str: The stripped answer.
+        """
+        resolved = answer.strip()
+        if self.cache is not None and self._looks_resolved(resolved):
+            self.cache.set(normalize(text), resolved)
+        return resolved
+
+    @staticmethod
+    def _looks_resolved(answer):
+        """
+        Check that an LLM answer has the "City, Country" shape before caching it.
+
+        Args:
+            answer (str): LLM answer.
+
+        Returns:
+            bool: True if the answer is safe to cache.
+        """
+        parts = answer.split(',')
+        return len(parts) == 2 and all(p.strip() for p in parts) and len(answer) <= 100
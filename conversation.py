@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+STATE_PATH = 'conversations.sqlite3'
+STATE_TTL = 3600 # через сколько секунд бот перестаёт ждать ответа пользователя
+
+
+class MemoryStateStore:
+    """
+    Per-chat conversation state kept in process memory.
+
+    Enough for a single bot process; the state is lost on restart.
+
+    Attributes:
+        ttl (float): Seconds after which a stored step expires.
+    """
+
+    def __init__(self, ttl=STATE_TTL):
+        """
+        Initialize an empty store.
+
+        Args:
+            ttl (float, optional): Step lifetime in seconds. Defaults to STATE_TTL.
+        """
+        self.ttl = ttl
+        self._steps = {}
+        self._lock = threading.Lock()
+
+    def set(self, chat_id, step):
+        """
+        Remember the step that the next message of a chat should go to.
+
+        Args:
+            chat_id (int): Telegram chat identifier.
+            step (str): Step name, e.g. 'today'.
+        """
+        with self._lock:
+            self._steps[chat_id] = (step, time.time() + self.ttl)
+
+    def pop(self, chat_id):
+        """
+        Take and forget the pending step of a chat.
+
+        Args:
+            chat_id (int): Telegram chat identifier.
+
+        Returns:
+            str | None: Step name, or None if nothing is pending or it expired.
+        """
+        with self._lock:
+            entry = self._steps.pop(chat_id, None)
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry[0]
+
+
+class SQLiteStateStore:
+    """
+    Per-chat conversation state shared by all bot processes on one host.
+
+    A chat's reply is handled by whichever process receives it: pop() deletes
+    the row it read, so exactly one process gets the step. Another backend,
+    e.g. for several hosts, only needs the same set() and pop() methods.
+
+    Attributes:
+        path (str): Path to the SQLite database file.
+        ttl (float): Seconds after which a stored step expires.
+    """
+
+    def __init__(self, path=STATE_PATH, ttl=STATE_TTL):
+        """
+        Initialize a store. The database is opened lazily, once per process.
+
+        Args:
+            path (str, optional): SQLite file path. Defaults to STATE_PATH.
+            ttl (float, optional): Step lifetime in seconds. Defaults to STATE_TTL.
+        """
+        self.path = path
+        self.ttl = ttl
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """
+        Open the database and create the table if needed. Caller holds the lock.
+
+        A connection inherited from the parent process after fork is not reused.
+
+        Returns:
+            sqlite3.Connection: Open connection.
+        """
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._pid = os.getpid()
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS states '
+                '(chat_id INTEGER PRIMARY KEY, step TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+            self._conn.commit()
+        return self._conn
+
+    def set(self, chat_id, step):
+        """
+        Remember the step that the next message of a chat should go to.
+
+        Args:
+            chat_id (int): Telegram chat identifier.
+            step (str): Step name, e.g. 'today'.
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO states (chat_id, step, expires) VALUES (?, ?, ?)',
+                (chat_id, step, time.time() + self.ttl)
+            )
+            conn.commit()
+
+    def pop(self, chat_id):
+        """
+        Take and forget the pending step of a chat.
+
+        Args:
+            chat_id (int): Telegram chat identifier.
+
+        Returns:
+            str | None: Step name, or None if nothing is pending, it expired
+                        or another process took it first.
+        """
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT step, expires FROM states WHERE chat_id = ?', (chat_id,)).fetchone()
+            if row is None:
+                return None
+            taken = conn.execute(
+                'DELETE FROM states WHERE chat_id = ? AND step = ? AND expires = ?', (chat_id, *row)
+            ).rowcount
+            conn.commit()
+        if not taken or row[1] < time.time():
+            return None
+        return row[0]
+
+    def purge_expired(self):
+        """
+        Delete all expired steps.
+
+        Returns:
+            int: Number of deleted steps.
+        """
+        with self._lock:
+            conn = self._connect()
+            deleted = conn.execute('DELETE FROM states WHERE expires < ?', (time.time(),)).rowcount
+            conn.commit()
+        return deleted
@@ -0,0 +1,368 @@
+import asyncio
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import metrics
+import resilience
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+
+CONNECT_TIMEOUT = 5 # секунды на установку соединения
+READ_TIMEOUT = 60 # секунды на ожидание ответа (LLM отвечает долго)
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+BACKOFF_JITTER = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+POOL_MAXSIZE = 32 # keep-alive соединений на один хост
+
+
+_session = None
+_session_lock = threading.Lock()
+_async_session = None
+
+stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(url, elapsed, error=False):
+    """
+    Add a finished call to the per-host stats.
+
+    Args:
+        url (str): Request URL.
+        elapsed (float): Call duration in seconds.
+        error (bool, optional): Whether the call failed. Defaults to False.
+    """
+    host = urlsplit(url).netloc
+    metrics.upstream(host, error)
+    with _stats_lock:
+        host_stats = stats.setdefault(host, {'calls': 0, 'errors': 0, 'seconds': 0.0})
+        host_stats['calls'] += 1
+        host_stats['errors'] += error
+        host_stats['seconds'] += elapsed
+
+
+def _is_outage(error):
+    """
+    Tell whether a failed call says the upstream is unhealthy rather than the request bad.
+
+    A call that failed when the request's deadline was (nearly) spent was cut
+    short by the bot's own budget, e.g. after a long admission wait, and says
+    nothing about the upstream.
+
+    Args:
+        error (Exception): Error raised by the call.
+
+    Returns:
+        bool | None: True for connection errors, timeouts and 429/5xx statuses,
+                     False if the upstream answered, None if the deadline cut the call.
+    """
+    if resilience.cut_by_deadline(error):
+        return None
+    if isinstance(error, requests.HTTPError):
+        return error.response.status_code in RETRY_STATUSES
+    status = getattr(error, 'status', None) # aiohttp.ClientResponseError
+    return status is None or status in RETRY_STATUSES
+
+
+def _settle(circuit, error):
+    """
+    Report a failed call to the host's circuit breaker according to _is_outage().
+
+    Args:
+        circuit (resilience.CircuitBreaker): Breaker of the called host.
+        error (Exception): Error raised by the call.
+    """
+    outage = _is_outage(error)
+    if outage:
+        circuit.failure()
+    elif outage is not None:
+        circuit.success()
+
+
+class _DeadlineRetry(Retry):
+    """
+    Retry policy that gives up once the backoff before the next attempt
+    no longer fits in the request's deadline.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        delay = retry.get_backoff_time()
+        if response is not None:
+            delay = max(delay, retry.get_retry_after(response) or 0)
+        if not resilience.fits(delay):
+            raise MaxRetryError(_pool, url, error or ResponseError('request deadline exceeded'))
+        return retry
+
+
+def get_session():
+    """
+    Return the shared requests session, creating it on first use.
+
+    The session keeps a keep-alive connection pool per host and retries
+    transient errors (429 and 5xx, connection failures) with jittered
+    exponential backoff, honouring Retry-After, as long as the current
+    resilience.deadline() leaves time for it.
+
+    Returns:
+        requests.Session: Shared session.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = _DeadlineRetry(
+                total=RETRIES,
+                backoff_factor=BACKOFF_FACTOR,
+                backoff_jitter=BACKOFF_JITTER,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=None,
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def request(method, url, **kwargs):
+    """
+    Send a request through the shared session with default timeouts.
+
+    The timeouts are capped by the time left until the current
+    resilience.deadline(), and every host has a circuit breaker: after
+    repeated connection errors, timeouts or 429/5xx answers calls to it
+    fail at once for a while.
+
+    Args:
+        method (str): HTTP method.
+        url (str): Request URL.
+        **kwargs: Passed to requests.Session.request; 'timeout' overrides the defaults.
+
+    Returns:
+        requests.Response: Successful response.
+
+    Raises:
+        requests.RequestException: On connection errors, timeouts or an error status
+                                   left after all retries.
+        resilience.UpstreamUnavailable: If the deadline is spent or the host's circuit is open.
+    """
+    timeout = kwargs.get('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    # сначала срок: если бюджет уже исчерпан, пробный вызов к хосту не тратится
+    if isinstance(timeout, tuple):
+        kwargs['timeout'] = tuple(resilience.timeout(t) for t in timeout)
+    else:
+        kwargs['timeout'] = resilience.timeout(timeout)
+    circuit = resilience.breaker(urlsplit(url).netloc)
+    probe = circuit.before_call()
+    started = time.perf_counter()
+    try:
+        response = get_session().request(method, url, **kwargs)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        _record(url, time.perf_counter() - started, error=True)
+        _settle(circuit, e)
+        resilience.check() # таймаут, урезанный до срока, — это исчерпанный бюджет, а не ошибка сервиса
+        raise
+    finally:
+        circuit.release(probe)
+    _record(url, time.perf_counter() - started)
+    circuit.success()
+    return response
+
+
+def get(url, **kwargs):
+    """
+    Send a GET request through the shared session. See request().
+    """
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    """
+    Send a POST request through the shared session. See request().
+    """
+    return request('POST', url, **kwargs)
+
+
+def connection_stats():
+    """
+    Return connection reuse counters of the shared session per host.
+
+    Returns:
+        dict: host -> {'connections': opened connections, 'requests': sent requests}.
+    """
+    result = {}
+    if _session is None:
+        return result
+    for adapter in set(_session.adapters.values()):
+        for key in adapter.poolmanager.pools.keys():
+            pool = adapter.poolmanager.pools[key]
+            result[f'{pool.host}:{pool.port}'] = {
+                'connections': pool.num_connections,
+                'requests': pool.num_requests,
+            }
+    return result
+
+
+async def get_async_session():
+    """
+    Return the shared aiohttp session, creating it on first use.
+
+    One session is reused by every asynchronous AI_HF and Weather call, so
+    connections to the HuggingFace router and Visual Crossing are kept alive.
+
+    Returns:
+        aiohttp.ClientSession: Shared session bound to the running event loop.
+    """
+    import aiohttp # импортируется только в асинхронном режиме, синхронный бот стартует быстрее
+
+    global _async_session
+    if _async_session is None or _async_session.closed:
+        _async_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit_per_host=POOL_MAXSIZE),
+        )
+    return _async_session
+
+
+def _set_atimeout(aiohttp, kwargs):
+    """
+    Per-attempt aiohttp timeout: the whole attempt must end by the current deadline.
+
+    Args:
+        kwargs (dict): Request arguments; 'timeout' is set unless there is no deadline.
+
+    Raises:
+        resilience.DeadlineExceeded: If the deadline is already spent.
+    """
+    if resilience.remaining() is None:
+        return
+    total = resilience.timeout(READ_TIMEOUT)
+    kwargs['timeout'] = aiohttp.ClientTimeout(total=total, sock_connect=min(CONNECT_TIMEOUT, total), sock_read=total)
+
+
+async def arequest_json(method, url, **kwargs):
+    """
+    Asynchronous counterpart of request(): sends a request through the shared
+    aiohttp session with the same retry policy, deadline and circuit breaker
+    and returns the parsed JSON body.
+
+    Args:
+        method (str): HTTP method.
+        url (str): Request URL.
+        **kwargs: Passed to aiohttp.ClientSession.request.
+
+    Returns:
+        Any: Parsed JSON body.
+
+    Raises:
+        aiohttp.ClientError: On an error status or connection failure left after all retries.
+        asyncio.TimeoutError: If the last attempt timed out.
+        resilience.UpstreamUnavailable: If the deadline is spent or the host's circuit is open.
+    """
+    import aiohttp
+
+    resilience.timeout(READ_TIMEOUT) # как в request(): срок проверяется до автомата
+    circuit = resilience.breaker(urlsplit(url).netloc)
+    probe = circuit.before_call()
+    try:
+        session = await get_async_session()
+        started = time.perf_counter()
+        for attempt in range(RETRIES + 1):
+            delay = BACKOFF_FACTOR * 2 ** attempt + random.uniform(0, BACKOFF_JITTER)
+            try:
+                _set_atimeout(aiohttp, kwargs)
+                async with session.request(method, url, **kwargs) as response:
+                    if response.status in RETRY_STATUSES and attempt < RETRIES:
+                        retry_after = response.headers.get('Retry-After', '')
+                        if retry_after.isdigit():
+                            delay = float(retry_after)
+                    else:
+                        response.raise_for_status()
+                        data = await response.json(content_type=None)
+                        _record(url, time.perf_counter() - started)
+                        circuit.success()
+                        return data
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt == RETRIES or not resilience.fits(delay):
+                    _record(url, time.perf_counter() - started, error=True)
+                    _settle(circuit, e)
+                    resilience.check()
+                    raise
+            except (aiohttp.ClientError, resilience.DeadlineExceeded) as e:
+                _record(url, time.perf_counter() - started, error=True)
+                _settle(circuit, e)
+                raise
+            if not resilience.fits(delay):
+                _record(url, time.perf_counter() - started, error=True)
+                circuit.failure()
+                raise resilience.DeadlineExceeded()
+            await asyncio.sleep(delay)
+    finally:
+        circuit.release(probe) # отмена задачи не должна оставить автомат с занятым пробным вызовом
+
+
+async def astream_lines(method, url, **kwargs):
+    """
+    Send a request through the shared aiohttp session and yield the response
+    body line by line, e.g. for server-sent events.
+
+    Streams are not retried: a retry could repeat data already yielded.
+    The whole stream must end by the current resilience.deadline().
+
+    Args:
+        method (str): HTTP method.
+        url (str): Request URL.
+        **kwargs: Passed to aiohttp.ClientSession.request.
+
+    Yields:
+        str: Decoded lines without the trailing newline.
+
+    Raises:
+        aiohttp.ClientError: On an error status or connection failure.
+        resilience.UpstreamUnavailable: If the deadline is spent or the host's circuit is open.
+    """
+    import aiohttp
+
+    resilience.timeout(READ_TIMEOUT) # как в request(): срок проверяется до автомата
+    circuit = resilience.breaker(urlsplit(url).netloc)
+    probe = circuit.before_call()
+    started = time.perf_counter()
+    failed = False
+    try:
+        session = await get_async_session()
+        _set_atimeout(aiohttp, kwargs)
+        async with session.request(method, url, **kwargs) as response:
+            response.raise_for_status()
+            circuit.success() # заголовки получены: сервис отвечает, даже если поток закроют раньше конца
+            async for line in response.content:
+                yield line.decode('utf-8').rstrip('\r\n')
+    except (aiohttp.ClientError, asyncio.TimeoutError, resilience.DeadlineExceeded) as e:
+        failed = True
+        _settle(circuit, e)
+        resilience.check()
+        raise
+    finally:
+        # сюда попадают и GeneratorExit (потребитель закрыл поток), и CancelledError
+        _record(url, time.perf_counter() - started, error=failed)
+        circuit.release(probe)
+
+
+async def close_async_session():
+    """
+    Close the shared aiohttp session, e.g. on bot shutdown.
+    """
+    global _async_session
+    if _async_session is not None and not _async_session.closed:
+        await _async_session.close()
+    _async_session = None
@@ -0,0 +1,313 @@
+import os
+import queue
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing.connection import Connection
+
+import resilience
+
+
+BATCH_WINDOW = 0.0 # сколько секунд ждать других запросов; 0 — батч из того, что накопилось, пока воркер был занят
+MAX_BATCH = 32 # максимум текстов в одном батче
+CALL_TIMEOUT = 60 # секунд на ответ воркера; дольше — воркер завис и перезапускается
+TRANSLATE_TIMEOUT = 10 # секунд, которые запрос ждёт перевода, не больше остатка дедлайна
+
+
+def _serve(conn, quantize):
+    """
+    Worker process loop: receives translation batches over the socket and
+    answers with translated texts.
+
+    Messages are ('translate', src, tgt, texts), ('warm_up', pairs) and None
+    to stop; answers are ('ok', result) or ('error', message).
+
+    Args:
+        conn (multiprocessing.connection.Connection): Worker end of the socket pair.
+        quantize (bool): Load int8 dynamic-quantized models.
+    """
+    from weather_cod import ModelRegistry, Translate # модели и torch живут только в процессе воркера
+
+    registry = ModelRegistry(max_idle=None, quantize=quantize)
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        try:
+            if message[0] == 'warm_up':
+                registry.warm_up(message[1])
+                conn.send(('ok', os.getpid()))
+            else:
+                _, src_lang, tgt_lang, texts = message
+                tokenizer, model = registry.get(src_lang, tgt_lang)
+                conn.send(('ok', Translate._translate(texts, tokenizer, model)))
+        except Exception as e:
+            conn.send(('error', f'{type(e).__name__}: {e}'))
+
+
+class _Worker:
+    """
+    One worker process and the bot-side end of its socket pair.
+
+    The worker is a fresh interpreter running this file, so it does not
+    re-import the bot module the way multiprocessing's spawn would.
+    """
+
+    def __init__(self, quantize):
+        self.lock = threading.Lock()
+        parent_sock, child_sock = socket.socketpair()
+        args = [sys.executable, os.path.abspath(__file__), str(child_sock.fileno())]
+        self.process = subprocess.Popen(
+            args + (['--quantize'] if quantize else []),
+            pass_fds=(child_sock.fileno(),),
+            env=dict(os.environ, MARIAN_BACKEND='local'),
+        )
+        child_sock.close()
+        self.conn = Connection(parent_sock.detach())
+
+    def call(self, message, timeout=None):
+        with self.lock:
+            self.conn.send(message)
+            if timeout is not None and not self.conn.poll(timeout):
+                raise TimeoutError(f'Процесс перевода не ответил за {timeout} с')
+            status, result = self.conn.recv()
+        if status == 'error':
+            raise RuntimeError(result)
+        return result
+
+    def close(self, wait=5):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=wait)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.conn.close()
+
+
+class MarianPool:
+    """
+    Pool of MarianMT worker processes.
+
+    Inference runs outside the bot process, so model.generate does not hold
+    the bot's GIL and torch does not grow its memory. Translation requests
+    from concurrent chats are queued and sent to a worker in batches: one
+    model call per language pair for everything that queued up while the
+    worker was busy. Workers are started on the first request.
+
+    Attributes:
+        workers (int): Number of worker processes.
+        quantize (bool): Whether workers use int8 dynamic-quantized weights.
+        requests (int): Number of translate() calls.
+        batches (int): Number of model calls made by the workers.
+        restarts (int): Number of workers restarted after a crash or a hang.
+    """
+
+    def __init__(self, workers=1, quantize=False):
+        """
+        Initialize a pool without starting processes.
+
+        Args:
+            workers (int, optional): Number of worker processes. Defaults to 1.
+            quantize (bool, optional): Use int8 dynamic-quantized weights. Defaults to False.
+        """
+        self.workers = workers
+        self.quantize = quantize
+        self.requests = 0
+        self.batches = 0
+        self.restarts = 0
+        self._queue = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._workers:
+                return
+            for _ in range(self.workers):
+                worker = _Worker(self.quantize)
+                self._workers.append(worker)
+                threading.Thread(target=self._dispatch, args=(len(self._workers) - 1,), daemon=True).start()
+
+    def translate(self, src_lang, tgt_lang, text):
+        """
+        Translate text in a worker process, batched with concurrent requests.
+
+        Args:
+            src_lang (str): Source language code ('ru' or 'en').
+            tgt_lang (str): Target language code ('ru' or 'en').
+            text (str | list[str]): Text or list of texts to translate.
+
+        Returns:
+            str | list[str]: Translated text, or a list in the input order.
+
+        Raises:
+            TimeoutError: If no answer came within TRANSLATE_TIMEOUT or the
+                request's deadline; the batch keeps running in the worker.
+        """
+        texts = [text] if isinstance(text, str) else list(text)
+        if not texts:
+            return []
+        self._ensure_started()
+        future = Future()
+        self._queue.put(((src_lang, tgt_lang), texts, future))
+        with self._lock:
+            self.requests += 1
+        try:
+            result = future.result(timeout=resilience.timeout(TRANSLATE_TIMEOUT))
+        except FutureTimeoutError:
+            raise TimeoutError('Перевод не готов вовремя') from None
+        return result[0] if isinstance(text, str) else result
+
+    def _collect(self):
+        """
+        Take the next request and everything already queued or arriving within
+        BATCH_WINDOW, up to MAX_BATCH texts.
+
+        Returns:
+            list | None: (pair, texts, future) requests, None once the pool is closed.
+        """
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        size = len(batch[0][1])
+        deadline = time.monotonic() + BATCH_WINDOW
+        while size < MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None) # сигнал остановки — для этого же диспетчера на следующем круге
+                break
+            batch.append(item)
+            size += len(item[1])
+        return batch
+
+    def _dispatch(self, index):
+        """
+        Dispatcher thread of one worker: sends collected requests as one
+        deduplicated batch per language pair and resolves their futures.
+
+        Args:
+            index (int): Worker index in the pool.
+        """
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            by_pair = defaultdict(list)
+            for pair, texts, future in batch:
+                by_pair[pair].append((texts, future))
+            for (src_lang, tgt_lang), requests in by_pair.items():
+                unique = list(dict.fromkeys(t for texts, _ in requests for t in texts))
+                try:
+                    translated = dict(zip(unique, self._call(index, ('translate', src_lang, tgt_lang, unique))))
+                except Exception as e:
+                    for _, future in requests:
+                        future.set_exception(e)
+                    continue
+                for texts, future in requests:
+                    future.set_result([translated[t] for t in texts])
+
+    def _call(self, index, message):
+        """
+        Send a message to a worker. A worker that died is restarted and the
+        message is sent once more to the new process; a worker that hung for
+        CALL_TIMEOUT is killed and restarted, and the call fails without a
+        retry, since the same batch would likely hang again.
+
+        Args:
+            index (int): Worker index in the pool.
+            message (tuple): Message for _serve().
+
+        Returns:
+            Any: The worker's answer.
+        """
+        for attempt in range(2):
+            worker = self._workers[index]
+            try:
+                result = worker.call(message, CALL_TIMEOUT)
+                break
+            except TimeoutError:
+                self._restart(index, worker, wait=0)
+                raise
+            except (EOFError, OSError) as e:
+                self._restart(index, worker)
+                if attempt:
+                    raise RuntimeError(f'Процесс перевода недоступен: {e}') from e
+        if message[0] == 'translate':
+            with self._lock:
+                self.batches += 1
+        return result
+
+    def _restart(self, index, worker, wait=5):
+        worker.close(wait)
+        with self._lock:
+            self._workers[index] = _Worker(self.quantize)
+            self.restarts += 1
+
+    def warm_up(self, pairs=None):
+        """
+        Start the workers and load the given language pairs in each of them.
+
+        Args:
+            pairs (iterable, optional): Pairs like ('en', 'ru'). Defaults to ModelRegistry.DEFAULT_PAIRS.
+        """
+        self._ensure_started()
+        pairs = list(pairs) if pairs else None
+        for worker in list(self._workers):
+            worker.call(('warm_up', pairs)) # без таймаута: загрузка моделей с хаба может идти дольше CALL_TIMEOUT
+
+    def pids(self):
+        """
+        Return the process identifiers of the running workers.
+
+        Returns:
+            list[int]: Worker PIDs.
+        """
+        with self._lock:
+            return [worker.process.pid for worker in self._workers]
+
+    def stats(self):
+        """
+        Return pool counters.
+
+        Returns:
+            dict: Requests, model calls, average requests per call and restarts.
+        """
+        with self._lock:
+            return {
+                'workers': len(self._workers),
+                'requests': self.requests,
+                'batches': self.batches,
+                'requests_per_batch': self.requests / self.batches if self.batches else 0.0,
+                'restarts': self.restarts,
+            }
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.close()
+
+
+if __name__ == '__main__':
+    _serve(Connection(int(sys.argv[1])), '--quantize' in sys.argv[2:])
@@ -0,0 +1,335 @@
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ENABLED = False # включается enable(); без этого stage() почти ничего не стоит
+TRACE_LOG = False # писать JSON-строку с разбивкой по этапам для каждого запроса
+PREFIX = 'weather_bot'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+logger = logging.getLogger('weather_bot.trace')
+
+_lock = threading.Lock()
+_trace = contextvars.ContextVar('weather_bot_trace', default=None)
+_NOOP = contextlib.nullcontext()
+
+
+def _labels(labels):
+    return ','.join(f'{k}="{v}"' for k, v in labels)
+
+
+class Counter:
+    """
+    Monotonic counter with labels.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        return [f'{self.name}{{{_labels(k)}}} {v}' for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down, with labels.
+    """
+
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets, with labels.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{_labels(key + (("le", bound),))}}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{_labels(key + (("le", "+Inf"),))}}} {count}')
+            lines.append(f'{self.name}_sum{{{_labels(key)}}} {total}')
+            lines.append(f'{self.name}_count{{{_labels(key)}}} {count}')
+        return lines
+
+
+stage_seconds = Histogram(f'{PREFIX}_stage_seconds', 'Duration of pipeline stages in seconds.')
+stage_errors = Counter(f'{PREFIX}_stage_errors_total', 'Pipeline stages that raised an exception.')
+in_flight = Gauge(f'{PREFIX}_in_flight', 'Pipeline stages currently running.')
+upstream_requests = Counter(f'{PREFIX}_upstream_requests_total', 'HTTP requests to upstream services.')
+upstream_errors = Counter(f'{PREFIX}_upstream_errors_total', 'Failed HTTP requests to upstream services.')
+request_errors = Counter(f'{PREFIX}_request_errors_total', 'User requests answered with an error.')
+rejections = Counter(f'{PREFIX}_rejections_total', 'Requests rejected by admission control.')
+fallbacks = Counter(f'{PREFIX}_fallbacks_total', 'Degraded answers served instead of an upstream result.')
+
+_metrics = [stage_seconds, stage_errors, in_flight, upstream_requests, upstream_errors, request_errors, rejections,
+            fallbacks]
+_collectors = []
+
+
+class _Stage:
+    """
+    Context manager timing one pipeline stage.
+    """
+
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        in_flight.inc(stage=self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        in_flight.dec(stage=self.name)
+        _record(self.name, elapsed, exc_type)
+        return False
+
+
+def _record(name, elapsed, exc_type=None):
+    stage_seconds.observe(elapsed, stage=name)
+    if exc_type is not None:
+        stage_errors.inc(stage=name)
+    trace = _trace.get()
+    if trace is not None:
+        trace['stages'].append({'stage': name, 'ms': round(elapsed * 1000, 2),
+                                'error': exc_type.__name__ if exc_type else None})
+
+
+def stage(name):
+    """
+    Time a pipeline stage: latency histogram, in-flight gauge, error counter
+    and an entry in the current request trace.
+
+    Usage:
+        with metrics.stage('visual_crossing'):
+            ...
+
+    Args:
+        name (str): Stage name.
+
+    Returns:
+        contextmanager: A no-op context manager when metrics are disabled.
+    """
+    if not ENABLED:
+        return _NOOP
+    return _Stage(name)
+
+
+def observe(name, seconds):
+    """
+    Record a stage timed by the caller, for spans that do not fit a with
+    block, e.g. the time to the first chunk of a stream.
+
+    Args:
+        name (str): Stage name.
+        seconds (float): Stage duration.
+    """
+    if not ENABLED:
+        return
+    _record(name, seconds)
+
+
+@contextlib.contextmanager
+def request(kind, chat_id=None):
+    """
+    Time a whole user request as the 'request:<kind>' stage and, with
+    TRACE_LOG on, log its per-stage breakdown as one JSON line.
+
+    Args:
+        kind (str): Request kind, e.g. 'today'.
+        chat_id (int, optional): Telegram chat identifier for the trace.
+    """
+    if not ENABLED:
+        yield
+        return
+    trace = {'kind': kind, 'chat_id': chat_id, 'stages': []}
+    token = _trace.set(trace)
+    started = time.perf_counter()
+    error = None
+    try:
+        with _Stage(f'request:{kind}'):
+            yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _trace.reset(token)
+        if TRACE_LOG:
+            trace['ms'] = round((time.perf_counter() - started) * 1000, 2)
+            trace['error'] = error
+            logger.info(json.dumps(trace, ensure_ascii=False))
+
+
+def error(kind, exc):
+    """
+    Count a user request answered with an error and mark the current trace.
+
+    Args:
+        kind (str): Request kind, e.g. 'today'.
+        exc (BaseException): The handled exception.
+    """
+    if not ENABLED:
+        return
+    request_errors.inc(kind=kind, error=type(exc).__name__)
+    trace = _trace.get()
+    if trace is not None:
+        trace['handled_error'] = f'{type(exc).__name__}: {exc}'
+
+
+def upstream(host, error=False):
+    """
+    Count an HTTP request to an upstream service.
+
+    Args:
+        host (str): Upstream host.
+        error (bool, optional): Whether the request failed. Defaults to False.
+    """
+    if not ENABLED:
+        return
+    upstream_requests.inc(upstream=host)
+    if error:
+        upstream_errors.inc(upstream=host)
+
+
+def rejected(reason):
+    """
+    Count a request rejected by admission control.
+
+    Args:
+        reason (str): Rejection reason, e.g. 'queue_full'.
+    """
+    if not ENABLED:
+        return
+    rejections.inc(reason=reason)
+
+
+def fallback(kind):
+    """
+    Count a degraded answer served because an upstream failed or was too slow.
+
+    Args:
+        kind (str): What was replaced, e.g. 'commentary'.
+    """
+    if not ENABLED:
+        return
+    fallbacks.inc(kind=kind)
+
+
+def register_collector(fn):
+    """
+    Register a function called on every scrape; it returns extra gauges as
+    {(metric name, help): {labels tuple: value}}.
+
+    Args:
+        fn (callable): Collector without arguments.
+    """
+    _collectors.append(fn)
+
+
+def render():
+    """
+    Render all metrics in the Prometheus text exposition format.
+
+    Returns:
+        str: Metrics text.
+    """
+    lines = []
+    with _lock:
+        for metric in _metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+    for fn in _collectors:
+        for (name, help), values in fn().items():
+            lines.append(f'# HELP {PREFIX}_{name} {help}')
+            lines.append(f'# TYPE {PREFIX}_{name} gauge')
+            lines.extend(f'{PREFIX}_{name}{{{_labels(k)}}} {v}' for k, v in values.items())
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def enable(port=None, trace_log=False):
+    """
+    Turn instrumentation on and optionally serve /metrics over HTTP.
+
+    Args:
+        port (int, optional): Port of the Prometheus endpoint; None serves nothing.
+        trace_log (bool, optional): Log per-request traces. Defaults to False.
+
+    Returns:
+        ThreadingHTTPServer | None: The started server.
+    """
+    global ENABLED, TRACE_LOG
+    ENABLED = True
+    TRACE_LOG = trace_log
+    if trace_log and not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    if port is None:
+        return None
+    server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,278 @@
+import contextlib
+import contextvars
+import threading
+import time
+
+import metrics
+
+
+REQUEST_BUDGET = 25 # секунд на весь ответ пользователю, включая очередь и все внешние сервисы
+FAILURE_THRESHOLD = 5 # ошибок подряд, после которых сервис считается недоступным
+RESET_TIMEOUT = 30 # секунд до пробного запроса к недоступному сервису
+DEADLINE_SLACK = 0.1 # секунды: ошибка ближе к сроку запроса считается обрезанной сроком, а не сбоем сервиса
+
+UNAVAILABLE_TEXT = 'Сервис погоды сейчас не отвечает 😕 Попробуй, пожалуйста, чуть позже.'
+
+_deadline = contextvars.ContextVar('weather_bot_deadline', default=None)
+
+
+class UpstreamUnavailable(Exception):
+    """
+    An upstream call was not made or not finished in time.
+    """
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """
+    The request's time budget is spent.
+    """
+
+    def __init__(self, text='Не уложились в отведённое время'):
+        super().__init__(text)
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """
+    The upstream failed repeatedly and is skipped until RESET_TIMEOUT passes.
+    """
+
+    def __init__(self, name):
+        super().__init__(f'Сервис {name} временно недоступен')
+
+
+@contextlib.contextmanager
+def deadline(seconds=REQUEST_BUDGET):
+    """
+    Give the current request (thread or asyncio task) a time budget.
+
+    Upstream calls made inside take their timeouts from the time left and
+    do not retry past it. A nested deadline can only shorten the outer one.
+
+    Usage:
+        with resilience.deadline():
+            ...
+
+    Args:
+        seconds (float, optional): Budget in seconds. Defaults to REQUEST_BUDGET.
+    """
+    new = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """
+    Return the time left until the current deadline.
+
+    Returns:
+        float | None: Seconds left (0 when spent), None without a deadline.
+    """
+    current = _deadline.get()
+    if current is None:
+        return None
+    return max(0.0, current - time.monotonic())
+
+
+def timeout(default):
+    """
+    Cap a timeout by the time left.
+
+    Args:
+        default (float): Timeout without a deadline.
+
+    Returns:
+        float: min(default, remaining()).
+
+    Raises:
+        DeadlineExceeded: If the budget is already spent.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded()
+    return min(default, left)
+
+
+def check():
+    """
+    Raise if the current deadline has passed, e.g. between chunks of a stream.
+
+    Raises:
+        DeadlineExceeded: If the budget is spent.
+    """
+    if remaining() == 0:
+        raise DeadlineExceeded()
+
+
+def fits(seconds):
+    """
+    Check that a wait of the given length still fits in the current budget.
+
+    Args:
+        seconds (float): Planned wait, e.g. a retry backoff.
+
+    Returns:
+        bool: True without a deadline or if more time than that is left.
+    """
+    left = remaining()
+    return left is None or left > seconds
+
+
+def cut_by_deadline(error):
+    """
+    Tell whether a failed call was cut short by the current request's own
+    budget rather than failed by itself, e.g. a read timeout capped by
+    timeout() after a long admission wait.
+
+    Args:
+        error (BaseException): Error raised by the call.
+
+    Returns:
+        bool: True for DeadlineExceeded or an error at the (nearly) spent deadline.
+    """
+    if isinstance(error, DeadlineExceeded):
+        return True
+    left = remaining()
+    return left is not None and left <= DEADLINE_SLACK
+
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker.
+
+    After failure_threshold failures in a row the circuit opens and calls
+    fail at once with CircuitOpenError. After reset_timeout seconds one
+    probe call is let through: success closes the circuit, failure opens
+    it again.
+
+    Attributes:
+        name (str): Upstream name.
+        failure_threshold (int): Failures in a row that open the circuit.
+        reset_timeout (float): Seconds before a probe call.
+        failures (int): Current number of failures in a row.
+        opened (int): How many times the circuit has opened.
+    """
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        """
+        Initialize a closed circuit.
+
+        Args:
+            name (str): Upstream name.
+            failure_threshold (int, optional): Defaults to FAILURE_THRESHOLD.
+            reset_timeout (float, optional): Defaults to RESET_TIMEOUT.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = None
+        self._probe = None # метка пробного вызова в полуоткрытом состоянии
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """
+        str: 'closed', 'open' or 'half_open'.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._probe is not None or time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def before_call(self):
+        """
+        Let a call through or fail fast.
+
+        Returns:
+            object | None: Probe token if this call is the probe of a half-open
+                circuit, to be passed to release(); None otherwise.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a probe in flight.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return None
+            if self._probe is not None or time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError(self.name)
+            self._probe = object()
+            return self._probe
+
+    def success(self):
+        """
+        Record a successful call and close the circuit.
+        """
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._probe = None
+
+    def release(self, probe):
+        """
+        End a call, also one without an outcome, e.g. a cancelled one: frees
+        the probe slot if this call still holds it, without changing the
+        circuit's state. Other calls and later probes are not affected.
+
+        Args:
+            probe (object | None): Token returned by before_call().
+        """
+        if probe is None:
+            return
+        with self._lock:
+            if self._probe is probe:
+                self._probe = None
+
+    def failure(self):
+        """
+        Record a failed call; open the circuit at the threshold or after a failed probe.
+        """
+        with self._lock:
+            self.failures += 1
+            if self._probe is not None or (self._opened_at is None and self.failures >= self.failure_threshold):
+                if self._probe is None:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+            self._probe = None
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(name):
+    """
+    Return the circuit breaker of an upstream, creating it on first use.
+
+    Args:
+        name (str): Upstream name, e.g. the host.
+
+    Returns:
+        CircuitBreaker: Shared breaker.
+    """
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def _breaker_metrics():
+    states = {'closed': 0, 'half_open': 1, 'open': 2}
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {
+        ('circuit_state', 'Circuit breaker state by upstream: 0 closed, 1 half-open, 2 open.'): {
+            (('upstream', b.name),): states[b.state] for b in breakers
+        },
+    }
+
+
+metrics.register_collector(_breaker_metrics)
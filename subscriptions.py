@@ -0,0 +1,265 @@
+import datetime
+import sqlite3
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ratelimit import RateLimiter
+
+
+SUBSCRIPTIONS_PATH = 'subscriptions.sqlite3'
+FORECAST_WORKERS = 4 # прогнозов, которые рассылка строит одновременно; нагрузку дополнительно ограничивает admission
+RETRY_DELAY = 60 # секунд до повтора прогноза для города после ошибки; после каждой следующей — вдвое больше
+MAX_FAILURES = 6 # ошибок за день, после которых город пропускается до завтра
+
+
+class SubscriptionStore:
+    """
+    Persistent storage of daily forecast subscriptions in a SQLite file.
+
+    A chat has at most one subscription per resolved location.
+
+    Attributes:
+        path (str): Path to the SQLite database file.
+    """
+
+    def __init__(self, path=SUBSCRIPTIONS_PATH):
+        """
+        Initialize the store and create the table if needed.
+
+        Args:
+            path (str, optional): SQLite file path. Defaults to SUBSCRIPTIONS_PATH.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS subscriptions ('
+            'chat_id INTEGER NOT NULL, location TEXT NOT NULL, city TEXT NOT NULL, '
+            'send_time TEXT NOT NULL, last_sent TEXT, PRIMARY KEY (chat_id, location))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS subscriptions_time ON subscriptions (send_time)')
+        self._conn.commit()
+
+    def subscribe(self, chat_id, city, location, send_time):
+        """
+        Add a subscription or change the time of an existing one.
+
+        Args:
+            chat_id (int): Telegram chat identifier.
+            city (str): City name as typed by the user.
+            location (str): Resolved location in the "City, Country" format.
+            send_time (datetime.time): Local time of the daily message.
+        """
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO subscriptions (chat_id, location, city, send_time) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (chat_id, location) DO UPDATE SET city = excluded.city, send_time = excluded.send_time',
+                (chat_id, location, city, send_time.strftime('%H:%M'))
+            )
+            self._conn.commit()
+
+    def unsubscribe(self, chat_id):
+        """
+        Remove all subscriptions of a chat.
+
+        Args:
+            chat_id (int): Telegram chat identifier.
+
+        Returns:
+            int: Number of removed subscriptions.
+        """
+        with self._lock:
+            removed = self._conn.execute('DELETE FROM subscriptions WHERE chat_id = ?', (chat_id,)).rowcount
+            self._conn.commit()
+        return removed
+
+    def list(self, chat_id):
+        """
+        Return the subscriptions of a chat.
+
+        Args:
+            chat_id (int): Telegram chat identifier.
+
+        Returns:
+            list: (city, location, send_time) tuples.
+        """
+        with self._lock:
+            return self._conn.execute(
+                'SELECT city, location, send_time FROM subscriptions WHERE chat_id = ? ORDER BY send_time',
+                (chat_id,)
+            ).fetchall()
+
+    def due(self, now):
+        """
+        Return subscriptions whose time has come today and which were not sent today.
+
+        Args:
+            now (datetime.datetime): Current local time.
+
+        Returns:
+            list: (chat_id, location) tuples.
+        """
+        with self._lock:
+            return self._conn.execute(
+                'SELECT chat_id, location FROM subscriptions '
+                'WHERE send_time <= ? AND (last_sent IS NULL OR last_sent < ?)',
+                (now.strftime('%H:%M'), now.date().isoformat())
+            ).fetchall()
+
+    def mark_sent(self, chat_ids, location, date):
+        """
+        Remember that today's message for a location was sent to the given chats.
+
+        Args:
+            chat_ids (list[int]): Telegram chat identifiers.
+            location (str): Resolved location.
+            date (datetime.date): Date of the sent forecast.
+        """
+        with self._lock:
+            self._conn.executemany(
+                'UPDATE subscriptions SET last_sent = ? WHERE chat_id = ? AND location = ?',
+                [(date.isoformat(), chat_id, location) for chat_id in chat_ids]
+            )
+            self._conn.commit()
+
+
+class SubscriptionScheduler:
+    """
+    Sends daily forecasts to subscribers.
+
+    Due subscriptions are grouped by resolved location: each unique location
+    is fetched and commented once per run and the text is fanned out to all
+    its subscribers, within the Telegram sending rate. Forecasts for
+    different locations are built by up to `workers` threads at once; each
+    text is sent as soon as it is ready.
+
+    A location whose forecast fails is retried after RETRY_DELAY seconds,
+    doubled after every further failure; after MAX_FAILURES failures in a
+    day it is marked as sent and skipped until tomorrow.
+
+    Attributes:
+        store (SubscriptionStore): Subscription storage.
+        forecast (callable): Returns the forecast text for a location.
+        send (callable): Sends a text to a chat, e.g. bot.send_message.
+        limiter (RateLimiter): Limits outgoing messages.
+        interval (float): Seconds between runs.
+        workers (int): Forecasts built at once.
+    """
+
+    def __init__(self, store, forecast, send, messages_per_second=25, interval=30, workers=FORECAST_WORKERS):
+        """
+        Initialize the scheduler.
+
+        Args:
+            store (SubscriptionStore): Subscription storage.
+            forecast (callable): Called with a location, returns the forecast text; must be thread-safe.
+            send (callable): Called with (chat_id, text).
+            messages_per_second (float, optional): Sending rate; Telegram allows about 30. Defaults to 25.
+            interval (float, optional): Seconds between runs. Defaults to 30.
+            workers (int, optional): Forecasts built at once. Defaults to FORECAST_WORKERS.
+        """
+        self.store = store
+        self.forecast = forecast
+        self.send = send
+        self.limiter = RateLimiter(messages_per_second)
+        self.interval = interval
+        self.workers = workers
+        self._failures = {} # location -> (дата, число ошибок, время следующей попытки)
+        self._stop = threading.Event()
+
+    def run_once(self, now=None):
+        """
+        Send all due forecasts.
+
+        Args:
+            now (datetime.datetime, optional): Current local time. Defaults to now.
+
+        Returns:
+            dict: Numbers of processed 'locations', 'sent' messages, 'errors'
+                and locations 'postponed' after earlier failures.
+        """
+        now = now or datetime.datetime.now()
+        self._failures = {location: f for location, f in self._failures.items() if f[0] == now.date()}
+        by_location = defaultdict(list)
+        postponed = set()
+        for chat_id, location in self.store.due(now):
+            if location in self._failures and now < self._failures[location][2]:
+                postponed.add(location)
+            else:
+                by_location[location].append(chat_id)
+
+        result = {'locations': 0, 'sent': 0, 'errors': 0, 'postponed': len(postponed)}
+        if not by_location:
+            return result
+        with ThreadPoolExecutor(min(self.workers, len(by_location))) as pool:
+            futures = {pool.submit(self.forecast, location): location for location in by_location}
+            for future in as_completed(futures):
+                location = futures[future]
+                chat_ids = by_location[location]
+                try:
+                    text = future.result()
+                except Exception as e:
+                    print(f'Ошибка рассылки для {location}: {e}')
+                    result['errors'] += 1
+                    self._failed(location, chat_ids, now)
+                    continue
+                self._failures.pop(location, None)
+                result['locations'] += 1
+                for chat_id in chat_ids:
+                    self.limiter.acquire()
+                    try:
+                        self.send(chat_id, text)
+                        result['sent'] += 1
+                    except Exception as e:
+                        print(f'Ошибка отправки в чат {chat_id}: {e}')
+                        result['errors'] += 1
+                self.store.mark_sent(chat_ids, location, now.date())
+        return result
+
+    def _failed(self, location, chat_ids, now):
+        """
+        Schedule the next attempt for a location whose forecast failed, or
+        give up on it for today after MAX_FAILURES failures.
+
+        Args:
+            location (str): Resolved location.
+            chat_ids (list[int]): Its due subscribers.
+            now (datetime.datetime): Time of the run.
+        """
+        failures = self._failures.get(location, (None, 0, None))[1] + 1
+        if failures >= MAX_FAILURES:
+            print(f'Прогноз для {location} не удался {failures} раз, рассылка пропущена до завтра')
+            self._failures.pop(location, None)
+            self.store.mark_sent(chat_ids, location, now.date())
+            return
+        retry_at = now + datetime.timedelta(seconds=RETRY_DELAY * 2 ** (failures - 1))
+        self._failures[location] = (now.date(), failures, retry_at)
+
+    def run_forever(self):
+        """
+        Call run_once every interval seconds until stop() is called.
+        """
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f'Ошибка планировщика: {e}')
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """
+        Run the scheduler in a daemon thread.
+
+        Returns:
+            threading.Thread: Started thread.
+        """
+        thread = threading.Thread(target=self.run_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """
+        Stop run_forever after the current run.
+        """
+        self._stop.set()
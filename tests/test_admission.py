@@ -0,0 +1,140 @@
+import asyncio
+import threading
+import time
+import unittest
+
+import resilience
+from admission import (BACKGROUND, INTERACTIVE, AdmissionController, BusyError,
+                       RateLimitedError)
+
+
+class AdmissionTest(unittest.TestCase):
+    def setUp(self):
+        self.controller = AdmissionController(max_active=1, max_pending=2, max_wait=5)
+        self.release = threading.Event()
+        self.threads = []
+        self.addCleanup(self.finish)
+
+    def finish(self):
+        self.release.set()
+        for thread in self.threads:
+            thread.join(5)
+
+    def start(self, priority=INTERACTIVE, done=None):
+        """
+        Enter the controller in a thread and hold the slot until release.
+        """
+        def run():
+            with self.controller.admit(priority=priority):
+                if done is not None:
+                    done.append(priority)
+                self.release.wait(5)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.threads.append(thread)
+
+    def wait_for(self, active, pending):
+        for _ in range(200):
+            stats = self.controller.stats()
+            if (stats['active'], stats['pending']) == (active, pending):
+                return
+            time.sleep(0.01)
+        self.fail(f'stats {self.controller.stats()}')
+
+    def test_queue_full(self):
+        self.start()
+        self.wait_for(1, 0)
+        self.start()
+        self.start()
+        self.wait_for(1, 2)
+        with self.assertRaises(BusyError):
+            with self.controller.admit():
+                pass
+        self.assertEqual(self.controller.rejected['queue_full'], 1)
+
+    def test_background_uses_half_of_queue(self):
+        self.start()
+        self.wait_for(1, 0)
+        self.start(BACKGROUND)
+        self.wait_for(1, 1)
+        with self.assertRaises(BusyError):
+            with self.controller.admit(priority=BACKGROUND):
+                pass
+        self.start(INTERACTIVE)
+        self.wait_for(1, 2)
+
+    def test_wait_timeout(self):
+        self.controller.max_wait = 0.05
+        self.start()
+        self.wait_for(1, 0)
+        with self.assertRaises(BusyError):
+            with self.controller.admit():
+                pass
+        self.assertEqual(self.controller.rejected['timeout'], 1)
+        self.assertEqual(self.controller.stats()['pending'], 0)
+
+    def test_wait_capped_by_deadline(self):
+        self.start()
+        self.wait_for(1, 0)
+        started = time.monotonic()
+        with resilience.deadline(0.05):
+            with self.assertRaises(BusyError):
+                with self.controller.admit():
+                    pass
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_interactive_goes_first(self):
+        done = []
+        self.controller.max_active = 1
+        self.start()
+        self.wait_for(1, 0)
+        self.start(BACKGROUND, done)
+        self.wait_for(1, 1)
+        self.start(INTERACTIVE, done)
+        self.wait_for(1, 2)
+        self.release.set()
+        for thread in self.threads:
+            thread.join(5)
+        self.assertEqual(done, [INTERACTIVE, BACKGROUND])
+        self.assertEqual(self.controller.stats()['active'], 0)
+
+    def test_chat_rate(self):
+        controller = AdmissionController(chat_rate=0.001, chat_burst=2)
+        for _ in range(2):
+            with controller.admit(chat_id=1):
+                pass
+        with self.assertRaises(RateLimitedError):
+            with controller.admit(chat_id=1):
+                pass
+        with controller.admit(chat_id=2):
+            pass
+        self.assertEqual(controller.rejected['rate'], 1)
+
+    def test_async_wait_timeout(self):
+        controller = AdmissionController(max_active=1, max_pending=2, max_wait=0.05)
+
+        async def run():
+            held = asyncio.Event()
+
+            async def hold():
+                async with controller.aadmit():
+                    held.set()
+                    await asyncio.sleep(0.5)
+
+            task = asyncio.create_task(hold())
+            await held.wait()
+            with self.assertRaises(BusyError):
+                async with controller.aadmit():
+                    pass
+            await task
+
+        asyncio.run(run())
+        self.assertEqual(controller.stats(), {
+            'active': 0, 'pending': 0, 'admitted': 1,
+            'rejected': {'rate': 0, 'queue_full': 0, 'timeout': 1},
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,242 @@
+import asyncio
+import threading
+import time
+import unittest
+
+import resilience
+from cache import AsyncSingleFlight, AsyncStreamFlight, SingleFlight, StreamFlight
+
+
+def in_thread(fn):
+    """
+    Run fn in a thread; return the thread and a dict that gets 'result' or 'error'.
+    """
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = fn()
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.calls = 0
+
+    def slow(self, seconds, result='ok'):
+        def fn():
+            self.calls += 1
+            # вызов, уважающий срок вызывающего, как http_client
+            if not resilience.fits(seconds):
+                time.sleep(resilience.remaining())
+                raise resilience.DeadlineExceeded()
+            time.sleep(seconds)
+            return result
+        return fn
+
+    def test_shares_result(self):
+        leader, first = in_thread(lambda: self.flight.do('k', self.slow(0.1)))
+        time.sleep(0.03)
+        self.assertEqual(self.flight.do('k', self.slow(0.1)), 'ok')
+        leader.join()
+        self.assertEqual(first['result'], 'ok')
+        self.assertEqual((self.flight.calls, self.flight.coalesced, self.calls), (1, 1, 1))
+
+    def test_shares_error(self):
+        def fail():
+            time.sleep(0.1)
+            raise ValueError('boom')
+
+        leader, first = in_thread(lambda: self.flight.do('k', fail))
+        time.sleep(0.03)
+        with self.assertRaises(ValueError):
+            self.flight.do('k', fail)
+        leader.join()
+        self.assertIsInstance(first['error'], ValueError)
+
+    def test_follower_outlives_leader_deadline(self):
+        def short_leader():
+            with resilience.deadline(0.1):
+                return self.flight.do('k', self.slow(0.2))
+
+        leader, first = in_thread(short_leader)
+        time.sleep(0.03)
+        with resilience.deadline(5):
+            self.assertEqual(self.flight.do('k', self.slow(0.2)), 'ok')
+        leader.join()
+        self.assertIsInstance(first['error'], resilience.DeadlineExceeded)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.flight._flights, {})
+
+    def test_follower_wait_bounded_by_own_deadline(self):
+        leader, _ = in_thread(lambda: self.flight.do('k', self.slow(0.5)))
+        time.sleep(0.03)
+        started = time.monotonic()
+        with resilience.deadline(0.05):
+            with self.assertRaises(resilience.DeadlineExceeded):
+                self.flight.do('k', self.slow(0.5))
+        self.assertLess(time.monotonic() - started, 0.3)
+        leader.join()
+
+
+class AsyncSingleFlightTest(unittest.TestCase):
+    def test_follower_outlives_leader_deadline(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            if not resilience.fits(0.2):
+                await asyncio.sleep(resilience.remaining())
+                raise resilience.DeadlineExceeded()
+            await asyncio.sleep(0.2)
+            return 'ok'
+
+        async def short_leader():
+            with resilience.deadline(0.1):
+                return await flight.do('k', slow)
+
+        async def follower():
+            await asyncio.sleep(0.03)
+            with resilience.deadline(5):
+                return await flight.do('k', slow)
+
+        async def run():
+            return await asyncio.gather(short_leader(), follower(), return_exceptions=True)
+
+        first, second = asyncio.run(run())
+        self.assertIsInstance(first, resilience.DeadlineExceeded)
+        self.assertEqual(second, 'ok')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(flight._flights, {})
+
+    def test_follower_wait_bounded_by_own_deadline(self):
+        flight = AsyncSingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.5)
+            return 'ok'
+
+        async def follower():
+            await asyncio.sleep(0.03)
+            with resilience.deadline(0.05):
+                return await flight.do('k', slow)
+
+        async def run():
+            return await asyncio.gather(flight.do('k', slow), follower(), return_exceptions=True)
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first, 'ok')
+        self.assertIsInstance(second, resilience.DeadlineExceeded)
+
+
+def snapshots(parts, delay, cut=None):
+    """
+    Generator of accumulated text, as weather_cod streams commentary.
+    """
+    text = ''
+    started = time.monotonic()
+    for part in parts:
+        time.sleep(delay)
+        if cut is not None and time.monotonic() - started > cut:
+            raise resilience.DeadlineExceeded()
+        text += part
+        yield text
+
+
+class StreamFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.flight = StreamFlight()
+
+    def test_followers_replay_and_follow(self):
+        leader, first = in_thread(lambda: list(self.flight.stream('k', lambda: snapshots('abc', 0.05))))
+        time.sleep(0.07)
+        self.assertEqual(list(self.flight.stream('k', lambda: snapshots('xyz', 0.05))), ['a', 'ab', 'abc'])
+        leader.join()
+        self.assertEqual(first['result'], ['a', 'ab', 'abc'])
+        self.assertEqual(self.flight.calls, 1)
+
+    def test_shares_error(self):
+        def broken():
+            yield 'a'
+            time.sleep(0.1)
+            raise ValueError('boom')
+
+        leader, first = in_thread(lambda: list(self.flight.stream('k', broken)))
+        time.sleep(0.03)
+        with self.assertRaises(ValueError):
+            list(self.flight.stream('k', broken))
+        leader.join()
+        self.assertIsInstance(first['error'], ValueError)
+
+    def test_follower_outlives_leader_deadline(self):
+        leader, first = in_thread(lambda: list(self.flight.stream('k', lambda: snapshots('abc', 0.05, cut=0.07))))
+        time.sleep(0.03)
+        items = list(self.flight.stream('k', lambda: snapshots('abc', 0.05)))
+        leader.join()
+        self.assertIsInstance(first['error'], resilience.DeadlineExceeded)
+        self.assertEqual(items[-1], 'abc')
+        self.assertEqual(self.flight.calls, 2)
+        self.assertEqual(self.flight._flights, {})
+
+    def test_follower_takes_over_closed_leader(self):
+        stream = self.flight.stream('k', lambda: snapshots('abc', 0.05))
+        self.assertEqual(next(stream), 'a')
+        follower, second = in_thread(lambda: list(self.flight.stream('k', lambda: snapshots('abc', 0.05))))
+        time.sleep(0.03)
+        stream.close()
+        follower.join()
+        self.assertEqual(second['result'][-1], 'abc')
+
+    def test_follower_wait_bounded_by_own_deadline(self):
+        leader, _ = in_thread(lambda: list(self.flight.stream('k', lambda: snapshots('ab', 0.3))))
+        time.sleep(0.03)
+
+        def follow():
+            with resilience.deadline(0.05):
+                return list(self.flight.stream('k', lambda: snapshots('ab', 0.3)))
+
+        with self.assertRaises(resilience.DeadlineExceeded):
+            follow()
+        leader.join()
+
+
+class AsyncStreamFlightTest(unittest.TestCase):
+    def test_follower_outlives_leader_deadline(self):
+        flight = AsyncStreamFlight()
+
+        async def snapshots_async(cut=None):
+            text = ''
+            for part in 'abc':
+                await asyncio.sleep(0.05)
+                if cut is not None and resilience.remaining() is not None and resilience.remaining() < 0.05:
+                    raise resilience.DeadlineExceeded()
+                text += part
+                yield text
+
+        async def collect(timeout):
+            with resilience.deadline(timeout):
+                return [text async for text in flight.stream('k', lambda: snapshots_async(cut=True))]
+
+        async def follower():
+            await asyncio.sleep(0.03)
+            return await collect(5)
+
+        async def run():
+            return await asyncio.gather(collect(0.12), follower(), return_exceptions=True)
+
+        first, second = asyncio.run(run())
+        self.assertIsInstance(first, resilience.DeadlineExceeded)
+        self.assertEqual(second[-1], 'abc')
+        self.assertEqual(flight.calls, 2)
+        self.assertEqual(flight._flights, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
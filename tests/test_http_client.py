@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+
+import http_client
+import resilience
+
+
+class FakeUpstream:
+    """
+    Local HTTP server answering every request with the same status after a delay.
+    """
+
+    def __init__(self, status=503, delay=0.0):
+        self.calls = 0
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                upstream.calls += 1
+                time.sleep(delay)
+                body = b'{}'
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError: # клиент уже ушёл по таймауту
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.host = f'127.0.0.1:{self.server.server_port}'
+        self.url = f'http://{self.host}/'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class DeadlineRetryTest(unittest.TestCase):
+    def setUp(self):
+        # новая сессия с предсказуемой паузой: 0, 0.4, 0.8 с перед повторами
+        patches = [
+            mock.patch.object(http_client, 'BACKOFF_FACTOR', 0.2),
+            mock.patch.object(http_client, 'BACKOFF_JITTER', 0.0),
+            mock.patch.object(http_client, '_session', None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def upstream(self, **kwargs):
+        upstream = FakeUpstream(**kwargs)
+        self.addCleanup(upstream.close)
+        return upstream
+
+    def test_retries_without_deadline(self):
+        upstream = self.upstream(status=503)
+        with self.assertRaises(requests.HTTPError):
+            http_client.get(upstream.url)
+        self.assertEqual(upstream.calls, http_client.RETRIES + 1)
+        self.assertEqual(resilience.breaker(upstream.host).failures, 1)
+
+    def test_backoff_past_deadline_is_not_waited(self):
+        upstream = self.upstream(status=503)
+        started = time.monotonic()
+        with resilience.deadline(0.3):
+            with self.assertRaises(requests.RequestException):
+                http_client.get(upstream.url)
+        self.assertLess(time.monotonic() - started, 0.3)
+        self.assertEqual(upstream.calls, 2) # второй повтор ждал бы 0.4 с
+
+    def test_timeout_capped_by_deadline(self):
+        upstream = self.upstream(status=200, delay=1.0)
+        started = time.monotonic()
+        with resilience.deadline(0.3):
+            with self.assertRaises(resilience.DeadlineExceeded):
+                http_client.get(upstream.url)
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertEqual(resilience.breaker(upstream.host).failures, 0)
+
+    def test_spent_deadline_skips_call(self):
+        upstream = self.upstream(status=200)
+        with resilience.deadline(0.01):
+            time.sleep(0.02)
+            with self.assertRaises(resilience.DeadlineExceeded):
+                http_client.get(upstream.url)
+        self.assertEqual(upstream.calls, 0)
+
+    def test_async_backoff_past_deadline(self):
+        upstream = self.upstream(status=503)
+
+        async def call():
+            try:
+                with resilience.deadline(0.3):
+                    await http_client.arequest_json('GET', upstream.url)
+            finally:
+                await http_client.close_async_session()
+
+        with mock.patch.object(http_client, 'BACKOFF_FACTOR', 0.4):
+            with self.assertRaises(resilience.DeadlineExceeded):
+                asyncio.run(call())
+        self.assertEqual(upstream.calls, 1) # пауза 0.4 с перед первым повтором не помещается
+        self.assertEqual(resilience.breaker(upstream.host).failures, 1)
+
+    def test_async_timeout_capped_by_deadline(self):
+        upstream = self.upstream(status=200, delay=1.0)
+
+        async def call():
+            try:
+                with resilience.deadline(0.3):
+                    await http_client.arequest_json('GET', upstream.url)
+            finally:
+                await http_client.close_async_session()
+
+        with self.assertRaises(resilience.UpstreamUnavailable):
+            asyncio.run(call())
+        self.assertEqual(resilience.breaker(upstream.host).failures, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import time
+import unittest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded
+
+
+RESET = 0.05 # секунд до пробного вызова в тестах
+
+
+class DeadlineTest(unittest.TestCase):
+    def test_no_deadline(self):
+        self.assertIsNone(resilience.remaining())
+        self.assertEqual(resilience.timeout(7), 7)
+        self.assertTrue(resilience.fits(1000))
+
+    def test_nested_deadline_only_shortens(self):
+        with resilience.deadline(0.5):
+            with resilience.deadline(10):
+                self.assertLessEqual(resilience.remaining(), 0.5)
+            with resilience.deadline(0.1):
+                self.assertLessEqual(resilience.timeout(5), 0.1)
+        self.assertIsNone(resilience.remaining())
+
+    def test_spent_deadline(self):
+        with resilience.deadline(0.01):
+            time.sleep(0.02)
+            self.assertEqual(resilience.remaining(), 0)
+            self.assertFalse(resilience.fits(0))
+            with self.assertRaises(DeadlineExceeded):
+                resilience.timeout(5)
+            with self.assertRaises(DeadlineExceeded):
+                resilience.check()
+
+    def test_cut_by_deadline(self):
+        self.assertTrue(resilience.cut_by_deadline(DeadlineExceeded()))
+        self.assertFalse(resilience.cut_by_deadline(TimeoutError()))
+        with resilience.deadline(resilience.DEADLINE_SLACK / 2):
+            self.assertTrue(resilience.cut_by_deadline(TimeoutError()))
+        with resilience.deadline(10):
+            self.assertFalse(resilience.cut_by_deadline(TimeoutError()))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.circuit = CircuitBreaker('test', failure_threshold=3, reset_timeout=RESET)
+
+    def open_circuit(self):
+        for _ in range(3):
+            self.assertIsNone(self.circuit.before_call())
+            self.circuit.failure()
+        self.assertEqual(self.circuit.state, 'open')
+
+    def wait_reset(self):
+        time.sleep(RESET * 1.5)
+        self.assertEqual(self.circuit.state, 'half_open')
+
+    def test_opens_at_threshold(self):
+        for _ in range(2):
+            self.circuit.failure()
+        self.assertEqual(self.circuit.state, 'closed')
+        self.circuit.failure()
+        self.assertEqual(self.circuit.state, 'open')
+        self.assertEqual(self.circuit.opened, 1)
+        with self.assertRaises(CircuitOpenError):
+            self.circuit.before_call()
+
+    def test_success_resets_failures(self):
+        for _ in range(2):
+            self.circuit.failure()
+        self.circuit.success()
+        for _ in range(2):
+            self.circuit.failure()
+        self.assertEqual(self.circuit.state, 'closed')
+
+    def test_single_probe_when_half_open(self):
+        self.open_circuit()
+        self.wait_reset()
+        probe = self.circuit.before_call()
+        self.assertIsNotNone(probe)
+        with self.assertRaises(CircuitOpenError):
+            self.circuit.before_call()
+
+    def test_probe_success_closes(self):
+        self.open_circuit()
+        self.wait_reset()
+        probe = self.circuit.before_call()
+        self.circuit.success()
+        self.circuit.release(probe)
+        self.assertEqual(self.circuit.state, 'closed')
+        self.assertEqual(self.circuit.failures, 0)
+        self.assertIsNone(self.circuit.before_call())
+
+    def test_probe_failure_reopens(self):
+        self.open_circuit()
+        self.wait_reset()
+        probe = self.circuit.before_call()
+        self.circuit.failure()
+        self.circuit.release(probe)
+        self.assertEqual(self.circuit.state, 'open')
+        self.assertEqual(self.circuit.opened, 1)
+        with self.assertRaises(CircuitOpenError):
+            self.circuit.before_call()
+        self.wait_reset()
+        self.assertIsNotNone(self.circuit.before_call())
+
+    def test_release_without_outcome_frees_probe(self):
+        self.open_circuit()
+        self.wait_reset()
+        self.circuit.release(self.circuit.before_call())
+        self.assertIsNotNone(self.circuit.before_call())
+
+    def test_older_call_does_not_free_probe(self):
+        older = self.circuit.before_call() # начат, пока автомат был закрыт
+        self.open_circuit()
+        self.wait_reset()
+        self.circuit.before_call()
+        self.circuit.release(older)
+        with self.assertRaises(CircuitOpenError):
+            self.circuit.before_call()
+
+    def test_stale_probe_does_not_free_next_probe(self):
+        self.open_circuit()
+        self.wait_reset()
+        first = self.circuit.before_call()
+        self.circuit.success() # например, заголовки потока получены, поток ещё идёт
+        self.open_circuit()
+        self.wait_reset()
+        self.circuit.before_call()
+        self.circuit.release(first)
+        with self.assertRaises(CircuitOpenError):
+            self.circuit.before_call()
+
+
+if __name__ == '__main__':
+    unittest.main()
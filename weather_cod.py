@@ -1,32 +1,617 @@
 
-import requests
+import asyncio
 import datetime
-from transformers import MarianMTModel, MarianTokenizer
+import hashlib
+import os
+import threading
+import time
+from contextlib import aclosing, closing
 import emoji
 from AI_hf import AI_HF
+from admission import vc_slots
+from cache import AsyncSingleFlight, AsyncStreamFlight, LRUTTLCache, SingleFlight, SQLiteTTLCache, StreamFlight
+from city_resolver import CityResolver
+from marian_worker import MarianPool
+import http_client
+import metrics
+import resilience
+
+
+LOCAL_ML = not os.environ.get('NO_LOCAL_ML') # False — без transformers/torch, только табличный перевод
+MARIAN_BACKEND = os.environ.get('MARIAN_BACKEND', 'local') # 'local' — модели в процессе бота, 'worker' — в отдельных процессах
+MARIAN_WORKERS = int(os.environ.get('MARIAN_WORKERS', 1)) # число процессов перевода для 'worker'
+MARIAN_QUANTIZE = bool(os.environ.get('MARIAN_QUANTIZE')) # int8-динамическая квантизация весов для CPU
+
+
+class ModelRegistry:
+    """
+    Process-wide, thread-safe registry of MarianMT tokenizers and models.
+
+    Models are loaded once per language pair and shared by every Translate
+    instance. Pairs that were not used for longer than ``max_idle`` seconds
+    are evicted to free memory.
+
+    Attributes:
+        max_idle (float | None): Idle time in seconds after which a pair is evicted.
+                                 None disables eviction.
+        quantize (bool): Whether models are converted to int8 dynamic-quantized weights.
+        hits (int): Number of lookups served from memory.
+        misses (int): Number of lookups that required loading from disk.
+        load_seconds (dict): Total load time in seconds per language pair.
+    """
+
+    MODEL_NAME = 'Helsinki-NLP/opus-mt-{src}-{tgt}'
+    DEFAULT_PAIRS = (('en', 'ru'), ('ru', 'en'))
+
+    def __init__(self, max_idle=3600, quantize=False):
+        """
+        Initialize an empty registry.
+
+        Args:
+            max_idle (float | None, optional): Idle time in seconds before a pair is evicted.
+                                               Defaults to one hour.
+            quantize (bool, optional): Quantize the Linear layers to int8 after loading,
+                                       for faster CPU inference and less memory. Defaults to False.
+        """
+        self.max_idle = max_idle
+        self.quantize = quantize
+        self.hits = 0
+        self.misses = 0
+        self.load_seconds = {}
+        self._models = {}
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self._pair_locks = {}
+
+    def get(self, src_lang, tgt_lang):
+        """
+        Return the tokenizer and model for a language pair, loading them if needed.
+
+        Concurrent callers asking for the same pair wait for a single load.
+
+        Args:
+            src_lang (str): Source language code ('ru' or 'en').
+            tgt_lang (str): Target language code ('ru' or 'en').
+
+        Returns:
+            tuple: (tokenizer, model) for translation.
+        """
+        pair = (src_lang, tgt_lang)
+        with self._lock:
+            self._evict_idle_locked()
+            if pair in self._models:
+                self.hits += 1
+                self._last_used[pair] = time.monotonic()
+                return self._models[pair]
+            pair_lock = self._pair_locks.setdefault(pair, threading.Lock())
+
+        with pair_lock:
+            with self._lock:
+                if pair in self._models:
+                    self.hits += 1
+                    self._last_used[pair] = time.monotonic()
+                    return self._models[pair]
+            started = time.perf_counter()
+            loaded = self._load(src_lang, tgt_lang)
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.misses += 1
+                self.load_seconds[pair] = self.load_seconds.get(pair, 0.0) + elapsed
+                self._models[pair] = loaded
+                self._last_used[pair] = time.monotonic()
+            return loaded
+
+    def _load(self, src_lang, tgt_lang):
+        """
+        Load a MarianMT tokenizer and model from disk or the HuggingFace hub.
+
+        Args:
+            src_lang (str): Source language code.
+            tgt_lang (str): Target language code.
+
+        Returns:
+            tuple: (tokenizer, model).
+        """
+        if not LOCAL_ML:
+            raise RuntimeError('Локальные модели отключены (NO_LOCAL_ML)')
+        from transformers import MarianMTModel, MarianTokenizer # тяжёлый импорт torch — только при первой загрузке
+
+        name = self.MODEL_NAME.format(src=src_lang, tgt=tgt_lang)
+        tok = MarianTokenizer.from_pretrained(name)
+        model = MarianMTModel.from_pretrained(name)
+        if self.quantize:
+            import torch
+
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return tok, model
+
+    def warm_up(self, pairs=None):
+        """
+        Load the given language pairs in advance, e.g. at bot startup.
+
+        Args:
+            pairs (iterable, optional): Pairs like ('en', 'ru'). Defaults to DEFAULT_PAIRS.
+        """
+        for src_lang, tgt_lang in pairs or self.DEFAULT_PAIRS:
+            self.get(src_lang, tgt_lang)
+
+    def evict(self, src_lang, tgt_lang):
+        """
+        Drop a language pair from memory.
+
+        Args:
+            src_lang (str): Source language code.
+            tgt_lang (str): Target language code.
+        """
+        with self._lock:
+            self._models.pop((src_lang, tgt_lang), None)
+            self._last_used.pop((src_lang, tgt_lang), None)
+
+    def _evict_idle_locked(self):
+        """
+        Drop pairs that have been idle longer than max_idle. Caller holds the lock.
+        """
+        if self.max_idle is None:
+            return
+        deadline = time.monotonic() - self.max_idle
+        for pair in [p for p, used in self._last_used.items() if used < deadline]:
+            self._models.pop(pair, None)
+            self._last_used.pop(pair, None)
+
+    def stats(self):
+        """
+        Return registry counters.
+
+        Returns:
+            dict: Hits, misses, loaded pairs and cumulative load time per pair.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'loaded': sorted(f'{s}-{t}' for s, t in self._models),
+                'load_seconds': {f'{s}-{t}': v for (s, t), v in self.load_seconds.items()},
+            }
+
+
+model_registry = ModelRegistry(quantize=MARIAN_QUANTIZE)
+marian_pool = MarianPool(MARIAN_WORKERS, MARIAN_QUANTIZE) if MARIAN_BACKEND == 'worker' else None
+
+
+class DayRecord:
+    """
+    Compact Visual Crossing day record: the FIELDS of one day and nothing else.
+
+    Shared by the forecast formatting, the commentary fingerprint and
+    forecast_cache. A slotted object takes several times less memory than a
+    dict of the same fields; in the shared SQLite cache it is stored as a
+    plain list in FIELDS order.
+
+    Attributes:
+        FIELDS (tuple): Visual Crossing day elements kept in the record.
+    """
+
+    FIELDS = (
+        'temp', 'tempmax', 'tempmin', 'feelslike', 'feelslikemax', 'feelslikemin',
+        'humidity', 'precip', 'precipprob', 'preciptype', 'windspeed', 'windgust',
+        'winddir', 'cloudcover', 'visibility', 'sunrise', 'sunset', 'uvindex',
+        'conditions', 'description',
+    )
+    __slots__ = FIELDS
+
+    def __init__(self, values):
+        """
+        Initialize a record from field values; missing fields are None.
+
+        Args:
+            values (dict): Visual Crossing day JSON or any mapping with FIELDS keys.
+        """
+        for field in self.FIELDS:
+            setattr(self, field, values.get(field))
+        if self.preciptype is not None and not isinstance(self.preciptype, str):
+            self.preciptype = tuple(self.preciptype)
+
+    @classmethod
+    def from_cached(cls, value):
+        """
+        Restore a record stored by to_cached().
+
+        Args:
+            value (list | dict): List in FIELDS order, or a dict of an older cache entry.
+
+        Returns:
+            DayRecord: Record.
+        """
+        if isinstance(value, dict):
+            return cls(value)
+        return cls(dict(zip(cls.FIELDS, value)))
+
+    def to_cached(self):
+        """
+        Return the record as a JSON-serializable list in FIELDS order.
+
+        Returns:
+            list: Field values.
+        """
+        return [getattr(self, field) for field in self.FIELDS]
+
+    def __repr__(self):
+        return f'DayRecord(temp={self.temp!r}, conditions={self.conditions!r})'
+
+
+class ForecastCache:
+    """
+    Cache of parsed Visual Crossing day records keyed by location and date.
+
+    Records live in an in-process LRU cache and, optionally, in a shared
+    SQLite backend so that several bot processes reuse each other's fetches.
+    Forecasts for today change more often than for later days, so the two
+    have separate TTLs.
+
+    Attributes:
+        local (LRUTTLCache): In-process cache.
+        shared (SQLiteTTLCache | None): Optional shared backend.
+        ttl_today (float): Time to live in seconds of today's records.
+        ttl_tomorrow (float): Time to live in seconds of records for later days.
+    """
+
+    def __init__(self, maxsize=1024, ttl_today=1800, ttl_tomorrow=3 * 3600, shared=None):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize (int, optional): Maximum number of records in memory. Defaults to 1024.
+            ttl_today (float, optional): TTL of today's records. Defaults to 30 minutes.
+            ttl_tomorrow (float, optional): TTL of later records. Defaults to 3 hours.
+            shared (SQLiteTTLCache, optional): Shared backend. Defaults to None.
+        """
+        self.local = LRUTTLCache(maxsize=maxsize, ttl=ttl_today)
+        self.shared = shared
+        self.ttl_today = ttl_today
+        self.ttl_tomorrow = ttl_tomorrow
+        self.shared_hits = 0
+
+    @staticmethod
+    def _key(location, date):
+        return f'{location.lower()}|{date.isoformat()}'
+
+    def ttl_for(self, date):
+        """
+        Return the TTL for a forecast date.
+
+        Args:
+            date (datetime.date): Forecast date.
+
+        Returns:
+            float: TTL in seconds.
+        """
+        return self.ttl_today if date <= datetime.date.today() else self.ttl_tomorrow
+
+    def get(self, location, date):
+        """
+        Return a cached day record.
+
+        Args:
+            location (str): Location in the "City, Country" format.
+            date (datetime.date): Forecast date.
+
+        Returns:
+            DayRecord | None: Day record, or None on a miss.
+        """
+        key = self._key(location, date)
+        record = self.local.get(key)
+        if record is None and self.shared is not None:
+            cached = self.shared.get(key)
+            if cached is not None:
+                self.shared_hits += 1
+                record = DayRecord.from_cached(cached)
+                self.local.set(key, record, self.ttl_for(date))
+        return record
+
+    def set(self, location, date, record):
+        """
+        Store a day record in the local and shared caches.
+
+        Args:
+            location (str): Location in the "City, Country" format.
+            date (datetime.date): Forecast date.
+            record (DayRecord): Parsed day record.
+        """
+        key = self._key(location, date)
+        ttl = self.ttl_for(date)
+        self.local.set(key, record, ttl)
+        if self.shared is not None:
+            self.shared.set(key, record.to_cached(), ttl)
+
+    def stats(self):
+        """
+        Return cache metrics.
+
+        Returns:
+            dict: Local counters, shared hits, saved API calls and overall hit rate.
+        """
+        local = self.local.stats()
+        lookups = local['hits'] + local['misses']
+        saved = local['hits'] + self.shared_hits
+        return {
+            **local,
+            'shared_hits': self.shared_hits,
+            'saved_api_calls': saved,
+            'hit_rate': saved / lookups if lookups else 0.0,
+        }
+
+
+SHARED_FORECAST_CACHE = False # общий SQLite-кэш прогнозов для нескольких процессов бота
+
+forecast_cache = ForecastCache(
+    shared=SQLiteTTLCache(table='forecasts') if SHARED_FORECAST_CACHE else None,
+)
+
+def _bucket(value, step):
+    """
+    Round a value to the nearest multiple of step; None stays None.
+    """
+    if value is None:
+        return None
+    return round(value / step) * step
+
+
+def commentary_fingerprint(day):
+    """
+    Build a fingerprint of a day record for the commentary cache.
+
+    Values are rounded into buckets (2°C, 20% precipitation probability,
+    45° wind sectors, ...) so that small forecast updates reuse the same
+    AI commentary.
+
+    Args:
+        day (DayRecord): Day record returned by Weather._fetch_day().
+
+    Returns:
+        str: Short hex digest.
+    """
+    preciptype = day.preciptype or ()
+    if isinstance(preciptype, str):
+        preciptype = (preciptype,)
+    parts = (
+        _bucket(day.temp, 2), _bucket(day.tempmax, 2), _bucket(day.tempmin, 2),
+        _bucket(day.feelslike, 2),
+        _bucket(day.precipprob, 20), _bucket(day.precip, 2), tuple(sorted(preciptype)),
+        _bucket(day.windspeed, 2), _bucket(day.windgust, 3),
+        _bucket(day.winddir, 45) % 360 if day.winddir is not None else None,
+        _bucket(day.cloudcover, 25), _bucket(day.visibility, 5),
+        _bucket(day.uvindex, 2), _bucket(day.humidity, 20),
+        day.conditions,
+    )
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+
+CONDITIONS_RU = {
+    'clear': 'ясно',
+    'partially cloudy': 'переменная облачность',
+    'overcast': 'пасмурно',
+    'rain': 'дождь',
+    'light rain': 'небольшой дождь',
+    'heavy rain': 'сильный дождь',
+    'rain showers': 'ливни',
+    'drizzle': 'морось',
+    'freezing drizzle/freezing rain': 'ледяной дождь',
+    'snow': 'снег',
+    'snow showers': 'снегопад',
+    'snow and rain showers': 'дождь со снегом',
+    'ice': 'гололёд',
+    'hail': 'град',
+    'fog': 'туман',
+    'thunderstorm': 'гроза',
+    'thunderstorm without precipitation': 'гроза без осадков',
+}
+
+# Visual Crossing собирает description из шаблонных фраз; ищем их по порядку
+DESCRIPTION_HINTS = (
+    ('clear conditions throughout the day', 'весь день ясно'),
+    ('partly cloudy throughout the day', 'весь день переменная облачность'),
+    ('cloudy skies throughout the day', 'весь день облачно'),
+    ('becoming cloudy', 'облачность будет расти'),
+    ('clearing in the afternoon', 'после обеда прояснится'),
+    ('rain in the morning', 'утром дождь'),
+    ('rain in the afternoon', 'днём дождь'),
+    ('rain in the evening', 'вечером дождь'),
+    ('snow in the morning', 'утром снег'),
+    ('snow in the afternoon', 'днём снег'),
+    ('snow in the evening', 'вечером снег'),
+    ('chance of rain', 'возможен дождь'),
+    ('chance of snow', 'возможен снег'),
+    ('storm', 'возможны грозы'),
+)
+
+
+def conditions_ru(conditions):
+    """
+    Translate Visual Crossing conditions by CONDITIONS_RU; unknown parts are skipped.
+
+    Args:
+        conditions (str | None): Value of the 'conditions' field, e.g. 'Rain, Overcast'.
+
+    Returns:
+        str: Comma-separated Russian conditions, or '' if none are known.
+    """
+    translated = [CONDITIONS_RU.get(c.strip().lower()) for c in (conditions or '').split(',')]
+    return ', '.join(c for c in translated if c)
+
+
+def template_commentary(day):
+    """
+    Build a short deterministic commentary from a day record, without the LLM.
+
+    Served when the AI commentary fails or does not fit in the deadline:
+    conditions are translated by CONDITIONS_RU, the description by
+    DESCRIPTION_HINTS, and advice follows from fixed thresholds.
+
+    Args:
+        day (DayRecord): Day record returned by Weather._fetch_day().
+
+    Returns:
+        str: Commentary in Russian.
+    """
+    sentences = []
+    conditions = conditions_ru(day.conditions)
+    if conditions:
+        sentences.append(conditions.capitalize() + '.')
+    description = (day.description or '').lower()
+    hints = [ru for en, ru in DESCRIPTION_HINTS if en in description]
+    if hints:
+        sentences.append(', '.join(dict.fromkeys(hints)).capitalize() + '.')
+
+    preciptype = day.preciptype or ()
+    if isinstance(preciptype, str):
+        preciptype = (preciptype,)
+    if (day.precipprob or 0) >= 50:
+        if 'freezingrain' in preciptype or 'ice' in preciptype:
+            sentences.append('На улице может быть скользко, будь осторожнее 🧊')
+        elif 'snow' in preciptype:
+            sentences.append('Ожидается снег, одевайся теплее ❄️')
+        else:
+            sentences.append('Не забудь зонт ☔')
+    if (day.windgust or 0) >= 15:
+        sentences.append('Ожидаются сильные порывы ветра 💨')
+    if day.tempmax is not None and day.tempmax - 273.15 >= 28:
+        sentences.append('Будет жарко, не забывай пить воду 🥤')
+    if day.tempmin is not None and day.tempmin - 273.15 <= -15:
+        sentences.append('Сильный мороз, одевайся теплее 🧣')
+    if (day.uvindex or 0) >= 6:
+        sentences.append('Солнце активное, пригодится крем от загара 😎')
+    sentences.append('Хорошего дня! 🙂')
+    return ' '.join(sentences)
+
+
+commentary_cache = LRUTTLCache(maxsize=4096, ttl=3 * 3600)
+commentary_flights = SingleFlight()
+commentary_aflights = AsyncSingleFlight()
+commentary_streams = StreamFlight() # потоки текста «на сейчас», а не дельт: их можно перезапустить
+commentary_astreams = AsyncStreamFlight()
+
+
+def _snapshots(chunks):
+    """
+    Turn a stream of text deltas into a stream of the text so far.
+
+    Args:
+        chunks (iterator): Text deltas, e.g. from AI_HF.stream_formating_answer().
+
+    Yields:
+        str: The text received so far.
+    """
+    text = ''
+    with closing(chunks):
+        for chunk in chunks:
+            text += chunk
+            yield text
+
+
+async def _asnapshots(chunks):
+    """
+    Asynchronous counterpart of _snapshots().
+
+    Args:
+        chunks (async iterator): Text deltas.
+
+    Yields:
+        str: The text received so far.
+    """
+    text = ''
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            text += chunk
+            yield text
+
+
+def _cache_metrics():
+    """
+    Collect cache and model registry counters for the metrics endpoint.
+
+    Returns:
+        dict: Gauges in the metrics.register_collector() format.
+    """
+    forecast = forecast_cache.stats()
+    commentary = commentary_cache.stats()
+    return {
+        ('cache_hits', 'Cache hits by cache.'): {
+            (('cache', 'forecast'),): forecast['saved_api_calls'],
+            (('cache', 'commentary'),): commentary['hits'],
+            (('cache', 'marian'),): model_registry.hits,
+        },
+        ('cache_misses', 'Cache misses by cache.'): {
+            (('cache', 'forecast'),): forecast['misses'] - forecast['shared_hits'],
+            (('cache', 'commentary'),): commentary['misses'],
+            (('cache', 'marian'),): model_registry.misses,
+        },
+        ('city_resolutions', 'Resolved city names by source.'): {
+            (('source', source),): n for source, n in city_resolver.stats.items()
+        },
+        ('marian_requests_per_batch', 'Average translation requests per worker model call.'): {
+            (): marian_pool.stats()['requests_per_batch'] if marian_pool is not None else 0.0,
+        },
+    }
+
+
+metrics.register_collector(_cache_metrics)
+
+CITY_BUDGET = 8 # секунд на определение города через LLM, потом — транслитерация
+COMMENTARY_BUDGET = 15 # секунд на комментарий LLM без стриминга, потом — template_commentary()
+
+
+def _llm_city(text):
+    with resilience.deadline(CITY_BUDGET):
+        return AI_HF(text).translate()
+
+
+async def _allm_city(text):
+    with resilience.deadline(CITY_BUDGET):
+        return await AI_HF(text).atranslate()
+
+
+city_resolver = CityResolver(
+    cache=SQLiteTTLCache(table='cities', ttl=30 * 86400),
+    fallback=_llm_city,
+    afallback=_allm_city,
+)
 
 
 class Translate:
     """
-    Class for translating text between Russian and English using MarianMT models.
+    Class for translating text between Russian and English using MarianMT models,
+    in the bot process or, with MARIAN_BACKEND = 'worker', in marian_pool.
 
     Attributes:
-        text (str): The text to be translated.
+        text (str | list[str]): The text to be translated, or a list of texts
+                                translated together in one batch.
+        PRECIPTYPE_RU (dict): Precomputed translations of the Visual Crossing
+                              precipitation types; these never reach the model.
     """
 
+    PRECIPTYPE_RU = {
+        'rain': 'дождь',
+        'snow': 'снег',
+        'freezingrain': 'ледяной дождь',
+        'ice': 'ледяная крупа',
+    }
+
     def __init__(self, text):
         """
         Initialize a Translate object.
 
         Args:
-            text (str): Text to be translated.
+            text (str | list[str]): Text or list of texts to be translated.
         """
         self.text = text
 
     @staticmethod
     def _load_model(src_lang, tgt_lang):
         """
-        Load a MarianMT tokenizer and model for the specified language pair.
+        Get a MarianMT tokenizer and model for the specified language pair.
+
+        Models come from the process-wide model_registry, so they are loaded
+        from disk only once.
 
         Args:
             src_lang (str): Source language code ('ru' or 'en').
@@ -35,27 +620,61 @@ class Translate:
         Returns:
             tuple: (tokenizer, model) for translation.
         """
-        name = f'Helsinki-NLP/opus-mt-{src_lang}-{tgt_lang}'
-        tok = MarianTokenizer.from_pretrained(name)
-        model = MarianMTModel.from_pretrained(name)
-        return tok, model
+        return model_registry.get(src_lang, tgt_lang)
 
     @staticmethod
     def _translate(text, tokenizer, model):
         """
         Translate text using the provided MarianMT tokenizer and model.
 
+        A list of texts is translated as one padded batch with a single
+        model.generate call.
+
         Args:
-            text (str): Text to translate.
+            text (str | list[str]): Text or list of texts to translate.
             tokenizer: MarianMT tokenizer.
             model: MarianMT model.
 
         Returns:
-            str: Translated text.
+            str | list[str]: Translated text, or a list in the input order.
+        """
+        texts = [text] if isinstance(text, str) else list(text)
+        if not texts:
+            return []
+        with metrics.stage('marian'):
+            batch = tokenizer(texts, return_tensors="pt", truncation=True, padding=True)
+            gen = model.generate(**batch)
+            result = tokenizer.batch_decode(gen, skip_special_tokens=True)
+        return result[0] if isinstance(text, str) else result
+
+    @classmethod
+    def translate_preciptype(cls, preciptype):
+        """
+        Translate Visual Crossing precipitation types into Russian.
+
+        Known values come from PRECIPTYPE_RU; unknown ones are translated by
+        MarianMT in a single batch, so a forecast costs at most one model call.
+        With LOCAL_ML off, or when the model fails to load or the translation
+        worker fails or does not answer in time, unknown values are kept in
+        English.
+
+        Args:
+            preciptype (str | list[str] | None): Value of the 'preciptype' field.
+
+        Returns:
+            str: Comma-separated Russian precipitation types, or 'Нет'.
         """
-        batch = tokenizer([text], return_tensors="pt", truncation=True, padding=True)
-        gen = model.generate(**batch)
-        return tokenizer.decode(gen[0], skip_special_tokens=True)
+        if not preciptype:
+            return 'Нет'
+        values = [preciptype] if isinstance(preciptype, str) else list(preciptype)
+        unknown = [v for v in dict.fromkeys(values) if v.lower() not in cls.PRECIPTYPE_RU]
+        translated = {v: v for v in unknown}
+        if unknown and LOCAL_ML:
+            try:
+                translated = dict(zip(unknown, cls(unknown).translate_word_en_ru()))
+            except (OSError, RuntimeError, resilience.DeadlineExceeded): # таймаут или сбой воркера, модель не загрузилась
+                metrics.fallback('preciptype')
+        return ', '.join(cls.PRECIPTYPE_RU.get(v.lower()) or translated[v] for v in values)
 
 
     def translate_word_ru_en(self):
@@ -63,8 +682,11 @@ class Translate:
         Translate text from Russian to English.
 
         Returns:
-            str: Translated text in English.
+            str | list[str]: Translated text in English (a list for list input).
         """
+        if marian_pool is not None:
+            with metrics.stage('marian'):
+                return marian_pool.translate('ru', 'en', self.text)
         tok_ru_en, model_ru_en = self._load_model('ru', 'en')
         src = self.text
         return self._translate(src, tok_ru_en, model_ru_en)
@@ -75,8 +697,11 @@ class Translate:
         Translate text from English to Russian.
 
         Returns:
-            str: Translated text in Russian.
+            str | list[str]: Translated text in Russian (a list for list input).
         """
+        if marian_pool is not None:
+            with metrics.stage('marian'):
+                return marian_pool.translate('en', 'ru', self.text)
         tok_en_ru, model_en_ru = self._load_model('en', 'ru')
         src = self.text
         return self._translate(src, tok_en_ru, model_en_ru)
@@ -90,24 +715,220 @@ class Weather:
     Attributes:
         API_key (str): API key for accessing Visual Crossing.
         url_weather (str): URL for weather forecast requests.
+        ELEMENTS (str): Day elements requested from Visual Crossing.
         location (str): City name in English.
     """
 
     API_KEY = "YOUR-KEY"
     url_weather = 'https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/'
+    ELEMENTS = ','.join(('datetime',) + DayRecord.FIELDS)
+    PREFETCH_DAYS = 1 # следующих дней, которые запрашиваются вместе с нужным: завтрашний прогноз уже в кэше
+    WEEK_DAYS = 7
+    WEEKDAYS_RU = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс')
 
 
-    def __init__(self, location):
+    def __init__(self, location, strict=False):
         """
         Initializes a Weather instance with a translated location name.
 
         Args:
             location (str): The original city or location name provided by the user.
-                            It will be translated via the AI_HF class to match
-                            the format expected by the weather API.
+                            It is resolved by city_resolver: the offline index and
+                            the persistent cache first, the AI_HF class only on a miss.
+            strict (bool, optional): Raise LookupError instead of using a transliterated
+                            guess when the AI_HF call fails. Defaults to False.
+        """
+        self.location = city_resolver.resolve(location, strict)
+
+
+    @classmethod
+    def for_location(cls, location):
+        """
+        Creates a Weather instance for an already resolved location, without
+        resolving it again (e.g. for stored subscriptions).
+
+        Args:
+            location (str): Location in the "City, Country" format.
+
+        Returns:
+            Weather: Instance for the location.
+        """
+        weather = cls.__new__(cls)
+        weather.location = location
+        return weather
+
+
+    @classmethod
+    async def acreate(cls, location, strict=False):
+        """
+        Asynchronously creates a Weather instance, without blocking the event loop
+        while the location is resolved.
+
+        Args:
+            location (str): The original city or location name provided by the user.
+            strict (bool, optional): See __init__(). Defaults to False.
+
+        Returns:
+            Weather: Instance with a resolved location.
+        """
+        weather = cls.__new__(cls)
+        weather.location = await city_resolver.aresolve(location, strict)
+        return weather
+
+
+    def _params(self, start, end):
+        """
+        Builds the Visual Crossing request parameters for a date range.
+
+        Only daily data and the DayRecord fields are requested, without the
+        hourly data and the current conditions of the full timeline payload.
+
+        Args:
+            start (datetime.date): First date of the range.
+            end (datetime.date): Last date of the range, inclusive.
+
+        Returns:
+            dict: Query parameters.
+        """
+        return {'location': self.location,
+          'key': self.API_KEY,
+          'date1': start.isoformat(),
+          'date2': end.isoformat(),
+          'unitGroup': 'base',
+          'include': 'days',
+          'elements': self.ELEMENTS,
+          }
+
+
+    def _store_days(self, json_weather, start):
         """
-        translate_ai = AI_HF(location)
-        self.location = translate_ai.translate()
+        Parses the days of a Visual Crossing response into forecast_cache.
+
+        Args:
+            json_weather (dict): Parsed response.
+            start (datetime.date): First requested date, for days without 'datetime'.
+
+        Returns:
+            dict: datetime.date -> DayRecord.
+        """
+        days = {}
+        for i, json_day in enumerate(json_weather['days']):
+            date = json_day.get('datetime')
+            date = datetime.date.fromisoformat(date) if date else start + datetime.timedelta(i)
+            days[date] = DayRecord(json_day)
+            forecast_cache.set(self.location, date, days[date])
+        return days
+
+
+    def _cached_days(self, dates):
+        """
+        Returns the cached day records for the given dates.
+
+        Args:
+            dates (list[datetime.date]): Requested dates.
+
+        Returns:
+            list[DayRecord | None]: Records, None for a miss.
+        """
+        return [forecast_cache.get(self.location, date) for date in dates]
+
+
+    def _missing_range(self, dates, records):
+        """
+        Returns the date range to fetch for the records missing from the cache,
+        extended by PREFETCH_DAYS.
+
+        Args:
+            dates (list[datetime.date]): Requested dates.
+            records (list[DayRecord | None]): Cached records, None for a miss.
+
+        Returns:
+            tuple | None: (start, end), or None if nothing is missing.
+        """
+        missing = [date for date, record in zip(dates, records) if record is None]
+        if not missing:
+            return None
+        return missing[0], missing[-1] + datetime.timedelta(self.PREFETCH_DAYS)
+
+
+    def _fetch_days(self, start, days=1):
+        """
+        Returns the day records for consecutive dates, from forecast_cache when
+        possible; the missing ones are fetched in a single call.
+
+        Args:
+            start (datetime.date): First date.
+            days (int, optional): Number of dates. Defaults to 1.
+
+        Returns:
+            list[DayRecord]: Records in date order.
+        """
+        dates = [start + datetime.timedelta(i) for i in range(days)]
+        records = self._cached_days(dates)
+        fetch = self._missing_range(dates, records)
+        if fetch is not None:
+            with vc_slots, metrics.stage('visual_crossing'):
+                response = http_client.get(self.url_weather, params=self._params(*fetch))
+                fetched = self._store_days(response.json(), fetch[0])
+            records = [record if record is not None else fetched[date] for date, record in zip(dates, records)]
+        return records
+
+
+    async def _afetch_days(self, start, days=1):
+        """
+        Asynchronous counterpart of _fetch_days() using a non-blocking HTTP client.
+        With a shared forecast_cache backend, the cache is read and written in
+        a worker thread.
+
+        Args:
+            start (datetime.date): First date.
+            days (int, optional): Number of dates. Defaults to 1.
+
+        Returns:
+            list[DayRecord]: Records in date order.
+        """
+        dates = [start + datetime.timedelta(i) for i in range(days)]
+        if forecast_cache.shared is None:
+            records = self._cached_days(dates)
+        else: # общий кэш — SQLite, его чтение и запись не должны блокировать цикл событий
+            records = await asyncio.to_thread(self._cached_days, dates)
+        fetch = self._missing_range(dates, records)
+        if fetch is not None:
+            async with vc_slots:
+                with metrics.stage('visual_crossing'):
+                    json_weather = await http_client.arequest_json('GET', self.url_weather, params=self._params(*fetch))
+                    if forecast_cache.shared is None:
+                        fetched = self._store_days(json_weather, fetch[0])
+                    else:
+                        fetched = await asyncio.to_thread(self._store_days, json_weather, fetch[0])
+            records = [record if record is not None else fetched[date] for date, record in zip(dates, records)]
+        return records
+
+
+    def _fetch_day(self, date):
+        """
+        Returns the day record for a date, from forecast_cache when possible.
+
+        Args:
+            date (datetime.date): The date for which the weather data should be retrieved.
+
+        Returns:
+            DayRecord: The Visual Crossing day record.
+        """
+        return self._fetch_days(date)[0]
+
+
+    async def _afetch_day(self, date):
+        """
+        Asynchronous counterpart of _fetch_day().
+
+        Args:
+            date (datetime.date): The date for which the weather data should be retrieved.
+
+        Returns:
+            DayRecord: The Visual Crossing day record.
+        """
+        return (await self._afetch_days(date))[0]
 
 
     def _day_get_weather(self, date):
@@ -121,41 +942,219 @@ class Weather:
             str: A formatted string containing temperature, wind, precipitation,
                  humidity, visibility, and other weather details for the given day.
         """
-        date1 = date
-        params = {'location': self.location,
-          'key': self.API_key,
-          'date1': date1,
-          'unitGroup': 'base'
-          }
-        response = requests.get(self.url_weather, params=params)
-        json_weather = response.json()
-        temp_med = json_weather['days'][0]['temp'] - 273.15
-        temp_max = json_weather['days'][0]['tempmax'] - 273.15
-        temp_min = json_weather['days'][0]['tempmin'] - 273.15
-        feel_temp_med = json_weather['days'][0]['feelslike'] - 273.15
-        feel_temp_max = json_weather['days'][0]['feelslikemax'] - 273.15
-        feel_temp_min = json_weather['days'][0]['feelslikemin'] - 273.15
-        humidity = json_weather['days'][0]['humidity'] # влажность воздуха в процентах
-        precip = json_weather['days'][0]['precip'] # количество выпавших осадков в миллиметрах
-        precipprob = json_weather['days'][0]['precipprob'] # вероятность осадков в процентах %
-        preciptype = json_weather['days'][0]['preciptype'] # дождь/снег/смешанные осадки, тип осадков (если нет, то возвращает None)
-        if preciptype is None:
-            preciptype = 'Нет'
-        elif isinstance(preciptype, list):
-            for info in preciptype:
-                preciptype = ', '.join([Translate(info).translate_word_en_ru() for info in preciptype])
-        else:
-            preciptype = Translate(preciptype).translate_word_en_ru()
-        windspeed = json_weather['days'][0]['windspeed']
-        windgust = json_weather['days'][0]['windgust'] # порывы ветра, максимальная скорость (метров в секунду)
-        winddir = json_weather['days'][0]['winddir'] # направление ветра в градусах, где 0 — север
-        cloudcover = json_weather['days'][0]['cloudcover'] # процент неба, покрытого облаками 
-        visibility = json_weather['days'][0]['visibility'] # Видимость: Километры, расстояние, на котором можно разглядеть объекты
-        sunrise = json_weather['days'][0]['sunrise'] # время восхода солнца
-        sunset = json_weather['days'][0]['sunset'] # время захода солнца
-        uvindex = json_weather['days'][0]['uvindex'] # уровень ультрафиолетового излучения
-        conditions = json_weather['days'][0]['conditions'] # краткое описание погодных условий
-        description = json_weather['days'][0]['description'] # подробное описание погоды
+        day = self._fetch_day(date)
+        base_forecast, info_forecast = self._base_forecast(date, day)
+        ai_forecast = self._commentary(date, day, info_forecast)
+        weather_forecast = base_forecast + ai_forecast
+        return weather_forecast
+
+
+    def iter_day_weather(self, date):
+        """
+        Yields the forecast progressively, for sending before the AI answer is ready.
+
+        The first item is the numeric forecast, available as soon as the Visual
+        Crossing data is parsed. Each next item is the full text with the
+        commentary streamed so far. Cached commentary is yielded at once, and
+        concurrent requests for the same key follow one AI_HF stream; if that
+        stream is cut by its leader's deadline, followers start a new one.
+        If the stream fails, outlives the deadline or ends without any text,
+        the last item carries template_commentary() instead.
+
+        Args:
+            date (datetime.date): The date for which the weather data should be retrieved.
+
+        Yields:
+            str: The forecast text, growing with every item.
+        """
+        day = self._fetch_day(date)
+        base_forecast, info_forecast = self._base_forecast(date, day)
+        yield base_forecast
+
+        key = self._commentary_key(date, day)
+        ai_forecast = commentary_cache.get(key)
+        if ai_forecast is not None:
+            yield base_forecast + ai_forecast
+            return
+        ai_forecast = ''
+        try:
+            stream = lambda: _snapshots(AI_HF(info_forecast).stream_formating_answer(self.location, date))
+            for ai_forecast in commentary_streams.stream(key, stream):
+                yield base_forecast + ai_forecast
+            if not ai_forecast.strip():
+                raise ValueError('Пустой ответ модели')
+        except Exception:
+            metrics.fallback('commentary')
+            yield base_forecast + template_commentary(day)
+            return
+        commentary_cache.set(key, ai_forecast)
+
+
+    async def aiter_day_weather(self, date):
+        """
+        Asynchronous counterpart of iter_day_weather().
+
+        Args:
+            date (datetime.date): The date for which the weather data should be retrieved.
+
+        Yields:
+            str: The forecast text, growing with every item.
+        """
+        day = await self._afetch_day(date)
+        # to_thread переносит контекст: дедлайн запроса и трассировка действуют и в потоке
+        base_forecast, info_forecast = await asyncio.to_thread(self._base_forecast, date, day)
+        yield base_forecast
+
+        key = self._commentary_key(date, day)
+        ai_forecast = commentary_cache.get(key)
+        if ai_forecast is not None:
+            yield base_forecast + ai_forecast
+            return
+        ai_forecast = ''
+        try:
+            stream = lambda: _asnapshots(AI_HF(info_forecast).astream_formating_answer(self.location, date))
+            async with aclosing(commentary_astreams.stream(key, stream)) as texts:
+                async for ai_forecast in texts:
+                    yield base_forecast + ai_forecast
+            if not ai_forecast.strip():
+                raise ValueError('Пустой ответ модели')
+        except Exception:
+            metrics.fallback('commentary')
+            yield base_forecast + template_commentary(day)
+            return
+        commentary_cache.set(key, ai_forecast)
+
+
+    def _commentary_key(self, date, day):
+        """
+        Builds the commentary cache key from location, dates and the day fingerprint.
+
+        Args:
+            date (datetime.date): The date of the forecast.
+            day (DayRecord): Day record returned by _fetch_day().
+
+        Returns:
+            str: Cache key.
+        """
+        return f'{self.location.lower()}|{date}|{datetime.date.today()}|{commentary_fingerprint(day)}'
+
+
+    def _commentary(self, date, day, info_forecast):
+        """
+        Returns the AI commentary for a day, from commentary_cache when possible.
+
+        Concurrent requests for the same key share a single AI_HF call. If the
+        call fails, returns no text or takes longer than COMMENTARY_BUDGET,
+        the uncached template_commentary() is returned instead.
+
+        Args:
+            date (datetime.date): The date of the forecast.
+            day (DayRecord): Day record returned by _fetch_day().
+            info_forecast (str): Forecast text passed to the AI.
+
+        Returns:
+            str: Human-friendly weather commentary.
+        """
+        key = self._commentary_key(date, day)
+        ai_forecast = commentary_cache.get(key)
+        if ai_forecast is None:
+            def generate():
+                text = AI_HF(info_forecast).formating_answer(self.location, date)
+                if not text.strip():
+                    raise ValueError('Пустой ответ модели')
+                commentary_cache.set(key, text)
+                return text
+            try:
+                with resilience.deadline(COMMENTARY_BUDGET):
+                    ai_forecast = commentary_flights.do(key, generate)
+            except Exception:
+                metrics.fallback('commentary')
+                ai_forecast = template_commentary(day)
+        return ai_forecast
+
+
+    async def _acommentary(self, date, day, info_forecast):
+        """
+        Asynchronous counterpart of _commentary().
+
+        Args:
+            date (datetime.date): The date of the forecast.
+            day (DayRecord): Day record returned by _afetch_day().
+            info_forecast (str): Forecast text passed to the AI.
+
+        Returns:
+            str: Human-friendly weather commentary.
+        """
+        key = self._commentary_key(date, day)
+        ai_forecast = commentary_cache.get(key)
+        if ai_forecast is None:
+            async def generate():
+                text = await AI_HF(info_forecast).aformating_answer(self.location, date)
+                if not text.strip():
+                    raise ValueError('Пустой ответ модели')
+                commentary_cache.set(key, text)
+                return text
+            try:
+                with resilience.deadline(COMMENTARY_BUDGET):
+                    ai_forecast = await commentary_aflights.do(key, generate)
+            except Exception:
+                metrics.fallback('commentary')
+                ai_forecast = template_commentary(day)
+        return ai_forecast
+
+
+    async def _aday_get_weather(self, date):
+        """
+        Asynchronous counterpart of _day_get_weather().
+
+        Network calls are awaited; formatting with Marian inference runs in the
+        default executor so it does not block the event loop.
+
+        Args:
+            date (datetime.date): The date for which the weather data should be retrieved.
+
+        Returns:
+            str: A formatted weather report for the given day.
+        """
+        day = await self._afetch_day(date)
+        base_forecast, info_forecast = await asyncio.to_thread(self._base_forecast, date, day)
+        ai_forecast = await self._acommentary(date, day, info_forecast)
+        return base_forecast + ai_forecast
+
+
+    def _base_forecast(self, date, day):
+        """
+        Formats the numeric part of the forecast from a day record.
+
+        Args:
+            date (datetime.date): The date of the forecast.
+            day (DayRecord): Day record returned by _fetch_day().
+
+        Returns:
+            tuple: (base_forecast, info_forecast) — the text shown to the user and
+                   the same text with conditions and description for the AI commentary.
+        """
+        temp_med = day.temp - 273.15
+        temp_max = day.tempmax - 273.15
+        temp_min = day.tempmin - 273.15
+        feel_temp_med = day.feelslike - 273.15
+        feel_temp_max = day.feelslikemax - 273.15
+        feel_temp_min = day.feelslikemin - 273.15
+        humidity = day.humidity # влажность воздуха в процентах
+        precip = day.precip # количество выпавших осадков в миллиметрах
+        precipprob = day.precipprob # вероятность осадков в процентах %
+        preciptype = day.preciptype # дождь/снег/смешанные осадки, тип осадков (если нет, то возвращает None)
+        preciptype = Translate.translate_preciptype(preciptype)
+        windspeed = day.windspeed
+        windgust = day.windgust # порывы ветра, максимальная скорость (метров в секунду)
+        winddir = day.winddir # направление ветра в градусах, где 0 — север
+        cloudcover = day.cloudcover # процент неба, покрытого облаками 
+        visibility = day.visibility # Видимость: Километры, расстояние, на котором можно разглядеть объекты
+        sunrise = day.sunrise # время восхода солнца
+        sunset = day.sunset # время захода солнца
+        uvindex = day.uvindex # уровень ультрафиолетового излучения
+        conditions = day.conditions # краткое описание погодных условий
+        description = day.description # подробное описание погоды
         base_forecast = (
             f"\n🌍 Прогноз погоды на {str(date.strftime('%d.%m.%Y')).replace('-', '.')}:\n\n"
             f"{emoji.emojize(':thermometer:')} Температура:\n"
@@ -180,10 +1179,7 @@ class Weather:
             f"{emoji.emojize(':microphone:')} О погоде:\n"
         )
         info_forecast = base_forecast + (f"{conditions}, {description}")
-        ai = AI_HF(info_forecast)
-        ai_forecast = ai.formating_answer(self.location, date1)
-        weather_forecast = base_forecast + ai_forecast
-        return weather_forecast
+        return base_forecast, info_forecast
 
 
     def weather_today(self, date=None):
@@ -202,6 +1198,21 @@ class Weather:
         return weather_forecast
 
 
+    async def aweather_today(self, date=None):
+        """
+        Asynchronously gets the weather forecast for the current day.
+
+        Args:
+            date (datetime.date, optional): A specific date for the forecast. Defaults to today.
+
+        Returns:
+            str: A formatted weather report for the current day.
+        """
+        if date is None:
+            date = datetime.date.today()
+        return await self._aday_get_weather(date)
+
+
     def weather_tommorow(self, date=None):
         """
         Gets the weather forecast for the next day.
@@ -216,4 +1227,74 @@ class Weather:
             today = datetime.date.today() 
             date = datetime.timedelta(1) + today
         weather_forecast = self._day_get_weather(date)
-        return weather_forecast
\ No newline at end of file
+        return weather_forecast
+
+
+    async def aweather_tommorow(self, date=None):
+        """
+        Asynchronously gets the weather forecast for the next day.
+
+        Args:
+            date (datetime.date, optional): A specific date for the forecast. Defaults to tomorrow.
+
+        Returns:
+            str: A formatted weather report for the next day.
+        """
+        if date is None:
+            date = datetime.date.today() + datetime.timedelta(1)
+        return await self._aday_get_weather(date)
+
+    def _week_forecast(self, start, records):
+        """
+        Formats a short multi-day forecast, one block per day, without the AI commentary.
+
+        Args:
+            start (datetime.date): Date of the first record.
+            records (list[DayRecord]): Day records in date order.
+
+        Returns:
+            str: The forecast text.
+        """
+        end = start + datetime.timedelta(len(records) - 1)
+        lines = [f"\n🌍 Прогноз погоды на неделю ({start:%d.%m} – {end:%d.%m}):\n"]
+        for i, day in enumerate(records):
+            date = start + datetime.timedelta(i)
+            conditions = conditions_ru(day.conditions).capitalize() or day.conditions
+            lines.append(
+                f"{emoji.emojize(':calendar:')} {self.WEEKDAYS_RU[date.weekday()]}, {date:%d.%m}\n"
+                f"  • {day.tempmin - 273.15:.0f}…{day.tempmax - 273.15:.0f}°C, {conditions}\n"
+                f"  • Осадки — {Translate.translate_preciptype(day.preciptype)}, {day.precipprob}%\n"
+                f"  • Ветер — {day.windspeed} м/с, порывы до {day.windgust} м/с\n"
+            )
+        return '\n'.join(lines)
+
+
+    def weather_week(self, start=None):
+        """
+        Gets the forecast for WEEK_DAYS days, fetched from Visual Crossing in one call.
+
+        Args:
+            start (datetime.date, optional): First date of the forecast. Defaults to today.
+
+        Returns:
+            str: A formatted weather report for the week.
+        """
+        if start is None:
+            start = datetime.date.today()
+        return self._week_forecast(start, self._fetch_days(start, self.WEEK_DAYS))
+
+
+    async def aweather_week(self, start=None):
+        """
+        Asynchronously gets the forecast for WEEK_DAYS days.
+
+        Args:
+            start (datetime.date, optional): First date of the forecast. Defaults to today.
+
+        Returns:
+            str: A formatted weather report for the week.
+        """
+        if start is None:
+            start = datetime.date.today()
+        records = await self._afetch_days(start, self.WEEK_DAYS)
+        return await asyncio.to_thread(self._week_forecast, start, records)
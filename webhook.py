@@ -0,0 +1,161 @@
+import hmac
+import os
+import signal
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import telebot
+
+
+BOT_TOKEN = os.environ.get('BOT_TOKEN', 'YOUR-KEY')
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL') # публичный https-адрес, на который Telegram шлёт обновления
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '') # сверяется с заголовком X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.environ.get('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', 8080))
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/telegram')
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 2)) # процессов-обработчиков на одном узле
+RUN_SCHEDULER = not os.environ.get('NO_SCHEDULER') # на остальных узлах за тем же адресом рассылку выключают
+
+
+def make_handler(tg_bot):
+    """
+    Build the HTTP handler that passes Telegram updates to the bot.
+
+    Updates are answered with 200 at once; telebot runs the message handlers
+    in its own thread pool of bot.HANDLER_THREADS threads.
+
+    Args:
+        tg_bot (telebot.TeleBot): Bot whose handlers process the updates.
+
+    Returns:
+        type: BaseHTTPRequestHandler subclass.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.split('?')[0] != WEBHOOK_PATH:
+                self.send_error(404)
+                return
+            token = self.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+            if WEBHOOK_SECRET and not hmac.compare_digest(token, WEBHOOK_SECRET):
+                self.send_error(403)
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                update = telebot.types.Update.de_json(body.decode('utf-8'))
+            except ValueError:
+                self.send_error(400)
+                return
+            tg_bot.process_new_updates([update])
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _serve(server, index):
+    """
+    Worker process: import the bot and handle updates from the shared socket.
+
+    The bot is imported only after fork, so every worker opens its own
+    SQLite connections, HTTP sessions and handler threads.
+
+    Args:
+        server (ThreadingHTTPServer): Server bound in the parent process.
+        index (int): Worker number; worker i serves metrics on METRICS_PORT + i.
+    """
+    import bot
+    import metrics
+
+    if bot.METRICS_PORT or bot.TRACE_LOG:
+        metrics.enable(bot.METRICS_PORT and bot.METRICS_PORT + index, trace_log=bot.TRACE_LOG)
+    server.RequestHandlerClass = make_handler(bot.bot)
+    server.serve_forever()
+
+
+def _schedule():
+    """
+    Scheduler process: sends the daily subscription forecasts.
+    """
+    import bot
+
+    bot.subscription_scheduler.run_forever()
+
+
+def _spawn(target, *args):
+    """
+    Fork a child process running target(*args).
+
+    Returns:
+        int: Child PID.
+    """
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        try:
+            target(*args)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def main():
+    """
+    Runs the bot in webhook mode: registers WEBHOOK_URL with Telegram and
+    pre-forks WEBHOOK_WORKERS processes that accept updates on one socket,
+    plus one process for the subscription scheduler. Crashed children are
+    restarted.
+
+    Conversation state lives in conversation.SQLiteStateStore, so a user's
+    reply may reach any worker. Several nodes can run behind one load
+    balancer with NO_SCHEDULER=1 on all but one of them and a state store
+    shared between the nodes.
+    """
+    if not WEBHOOK_URL:
+        sys.exit('Задайте WEBHOOK_URL, например https://example.com/telegram')
+    server = ThreadingHTTPServer((WEBHOOK_HOST, WEBHOOK_PORT), BaseHTTPRequestHandler)
+    server.daemon_threads = True
+
+    telebot.TeleBot(BOT_TOKEN, threaded=False).set_webhook(
+        url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET or None, max_connections=WEBHOOK_WORKERS * 10,
+    )
+
+    children = {_spawn(_serve, server, i): (_serve, server, i) for i in range(WEBHOOK_WORKERS)}
+    if RUN_SCHEDULER:
+        children[_spawn(_schedule)] = (_schedule,)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        role = children.pop(pid, None)
+        if role is None or stopping:
+            continue
+        print(f'Процесс {pid} завершился (код {os.waitstatus_to_exitcode(status)}), перезапуск...')
+        time.sleep(1)
+        children[_spawn(*role)] = role
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()